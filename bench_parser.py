@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+解析器微基准
+对比旧的 unescape + re.findall + dict 路径与 fund_parser 的预编译单次扫描
+用法: python bench_parser.py [行数] [重复次数]
+"""
+
+import re
+import sys
+import time
+from datetime import date, timedelta
+from html import unescape
+
+from fund_parser import parse_eastmoney_rows
+
+
+def make_payload(rows):
+    """生成与 F10DataApi 格式一致的模拟响应"""
+    day = date(2025, 12, 31)
+    parts = []
+    for i in range(rows):
+        nav = 1 + (i % 997) / 1000
+        parts.append(
+            f"<tr><td>{(day - timedelta(days=i)).isoformat()}</td>"
+            f"<td class='tor bold'>{nav:.4f}</td><td class='tor bold'>{nav + 0.5:.4f}</td>"
+            f"<td class='tor bold red'>{(i % 7) - 3:.2f}%</td>"
+            f"<td>开放申购</td><td>开放赎回</td><td class='red unbold'></td></tr>"
+        )
+    table = ("<table class='w782 comm lsjz'><thead><tr><th class='first'>净值日期</th><th>单位净值</th>"
+             "<th>累计净值</th><th>日增长率</th><th>申购状态</th><th>赎回状态</th>"
+             "<th class='tor last'>分红送配</th></tr></thead><tbody>" + ''.join(parts) + "</tbody></table>")
+    return f'var apidata={{ content:"{table}",records:{rows},pages:1,curpage:1}};'
+
+
+def legacy_parse(content):
+    """旧实现（fund_scraper_v3.fetch_nav_eastmoney_page 中的解析部分）"""
+    match = re.search(r'content:"([^"]*)"', content)
+    if not match or not match.group(1):
+        return None
+    html = unescape(match.group(1))
+    nav_data = []
+    row_pattern = r'<tr><td>(\d{4}-\d{2}-\d{2})</td><td[^>]*>([\d.]+)</td><td[^>]*>([\d.]+)</td><td[^>]*>([-\d.%]+)</td>'
+    for row in re.findall(row_pattern, html):
+        date_str, nav, cumulative_nav, daily_return = row
+        daily_return = daily_return.replace('%', '').strip()
+        if daily_return == '--':
+            daily_return = None
+        try:
+            nav_data.append({
+                'date': date_str,
+                'nav': float(nav) if nav else None,
+                'cumulative_nav': float(cumulative_nav) if cumulative_nav else None,
+                'daily_return': float(daily_return) if daily_return else None
+            })
+        except:
+            pass
+    return nav_data
+
+
+def bench(name, func, payload, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<8} {best * 1000:8.2f} ms  {len(result) / best:12,.0f} 行/秒")
+    return result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    payload = make_payload(rows)
+    print(f"响应 {len(payload) / 1024:.0f} KB, {rows} 行, 取 {repeat} 次最好成绩")
+
+    old = bench('legacy', legacy_parse, payload, repeat)
+    new = bench('parser', parse_eastmoney_rows, payload, repeat)
+
+    expected = [(d['date'], d['nav'], d['cumulative_nav'], d['daily_return']) for d in old]
+    print("结果一致" if expected == new else "结果不一致!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+端到端基准
+子进程中启动 fake_fund_server，本进程经 HTTP 代理把发往东方财富/新浪的请求都指向它，
+在临时数据库上跑完整的 发现 → 抓取 → 解析 → 校验 → 写库 流程，
+报告 基金/s、行/s、峰值 RSS 与瓶颈判断；--history 把结果追加到 JSONL 文件，并与上一次相同参数的结果对比
+
+用法:
+    python bench_pipeline.py --funds 200 --days 2500
+    python bench_pipeline.py --funds 500 --latency 0.05 --error-rate 0.02 --workers 8
+    python bench_pipeline.py --replay recordings/ --source hedged
+    python bench_pipeline.py --passes 2 --history bench_history.jsonl   # 第二遍命中响应缓存
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from urllib.request import urlopen
+
+import fund_telemetry as telemetry
+
+import fake_fund_server
+import fund_cache
+import fund_discovery
+import fund_http
+import fund_nav_scraper
+from fund_pipeline import FANOUT, FETCH_WORKERS, eastmoney_pages, run_pipeline
+from fund_store import close_stores, get_store
+from fund_universe import iter_universe
+
+HOSTS = ('fund.eastmoney.com', 'stock.finance.sina.com.cn')
+
+SOURCES = {'eastmoney': eastmoney_pages, 'hedged': fund_nav_scraper.fetch_fund_pages}
+
+# 参与历史对比的参数（相同才比较）
+PARAM_KEYS = ('funds', 'days', 'replay', 'seed', 'latency', 'jitter', 'error_rate', 'throttle_rate',
+              'reset_rate', 'workers', 'rate', 'source')
+
+
+def _serve(ready, replay, funds, days, seed, latency, jitter, error_rate, throttle_rate, reset_rate):
+    data = fake_fund_server.RecordedData(replay) if replay else fake_fund_server.SyntheticData(funds, days, seed)
+    server = fake_fund_server.FakeFundServer(data, port=0, latency=latency, jitter=jitter, error_rate=error_rate,
+                                             throttle_rate=throttle_rate, reset_rate=reset_rate, seed=seed)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+def start_server(args):
+    """在子进程中启动回放服务器，返回 (进程, URL)"""
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    process = ctx.Process(target=_serve, daemon=True, args=(
+        ready, args.replay, args.funds, args.days, args.seed, args.latency, args.jitter,
+        args.error_rate, args.throttle_rate, args.reset_rate))
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+def use_proxy(url, workers, rate):
+    """把 HTTP 请求代理到回放服务器，放开主机限速（并发按抓取线程 × 分页扇出）"""
+    os.environ['HTTP_PROXY'] = os.environ['http_proxy'] = url
+    os.environ.pop('NO_PROXY', None)
+    os.environ.pop('no_proxy', None)
+    for host in HOSTS:
+        fund_http.configure_host(host, rate=rate, burst=max(1, int(rate)), max_in_flight=workers * FANOUT)
+
+
+def server_stats(url):
+    with urlopen(f'{url}/_stats', timeout=10) as resp:
+        return json.load(resp)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def retries():
+    """各主机累计重试次数（fund_retry 的统计不随 telemetry.reset 清零）"""
+    return sum(value for key, value in telemetry.summary()['counters'].items()
+               if key.split('{')[0] == 'retries_total')
+
+
+def run_pass(db_path, source, workers):
+    """跑一遍流水线，返回结果 dict"""
+    telemetry.reset()
+    retried = retries()
+    start = time.monotonic()
+    stats = run_pipeline(iter_universe(db_path), get_store(db_path), fetch_pages=SOURCES[source],
+                         fetch_workers=workers)
+    wall = time.monotonic() - start
+    summary = telemetry.summary()
+    return {
+        'wall_seconds': round(wall, 3),
+        'funds': stats['funds'],
+        'rows': stats['rows'],
+        'pages': stats['pages'],
+        'errors': stats['errors'],
+        'issues': stats['issues'],
+        'funds_per_second': round(stats['funds'] / wall, 2),
+        'rows_per_second': round(stats['rows'] / wall),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'bytes_downloaded': summary['bytes_downloaded'],
+        'retries': retries() - retried,
+        'stage_busy': {stage: round(busy, 3) for stage, busy in summary['stage_busy'].items()},
+        'bound': summary['bound'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_result(path, params):
+    """历史文件中参数相同的最近一条记录"""
+    if not os.path.exists(path):
+        return None
+    found = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('params') == params:
+                found = entry
+    return found
+
+
+def append_history(path, entry):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def format_result(label, result, previous=None):
+    busy = result['stage_busy']
+    line = (f"{label}: {result['funds']} 只基金 {result['rows']} 行 {result['pages']} 页, "
+            f"耗时 {result['wall_seconds']:.2f}s, {result['funds_per_second']:.1f} 基金/s, "
+            f"{result['rows_per_second']} 行/s, 峰值 RSS {result['peak_rss_mb']:.0f}MB, "
+            f"失败 {result['errors']}, 重试 {result['retries']}, "
+            f"忙碌 网络 {busy['network']:.0%} 解析 {busy['parse']:.0%} 写库 {busy['write']:.0%} → 瓶颈 {result['bound']}")
+    if previous:
+        change = result['rows_per_second'] / previous['rows_per_second'] - 1 if previous['rows_per_second'] else 0
+        line += (f"\n    对比 {previous.get('revision') or '-'} ({previous['rows_per_second']} 行/s, "
+                 f"RSS {previous['peak_rss_mb']:.0f}MB): 行/s {change:+.1%}")
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端流水线基准（离线回放）')
+    parser.add_argument('--funds', type=int, default=fake_fund_server.FUNDS, help='生成的基金数')
+    parser.add_argument('--days', type=int, default=fake_fund_server.DAYS, help='每只基金最多的交易日数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='回放录制目录（代替生成数据）')
+    parser.add_argument('--latency', type=float, default=0.0, help='服务器每个请求的平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.5, help='延迟抖动比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='直接断开连接的比例')
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help='抓取线程数')
+    parser.add_argument('--rate', type=float, default=1000.0, help='每个主机每秒请求数上限')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='eastmoney',
+                        help='eastmoney 为分页流水线，hedged 为带新浪对冲的整只基金抓取')
+    parser.add_argument('--passes', type=int, default=1, help='同一数据库上重复的遍数（第二遍起命中缓存）')
+    parser.add_argument('--history', help='结果追加到该 JSONL 文件并与上一次对比')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库目录')
+    args = parser.parse_args()
+
+    process, url = start_server(args)
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    db_path = os.path.join(workdir, 'fund_robot.db')
+    try:
+        use_proxy(url, args.workers, args.rate)
+        fund_cache.configure_cache(os.path.join(workdir, 'http_cache.db'))
+        fund_nav_scraper.DB_PATH = db_path
+        fund_nav_scraper.init_database()
+        total, _ = fund_discovery.discover(db_path, details='none')
+        print(f"[INFO] 回放服务器 {url}，基金池 {total} 只，工作目录 {workdir}")
+
+        params = {key: getattr(args, key) for key in PARAM_KEYS}
+        for i in range(1, args.passes + 1):
+            result = run_pass(db_path, args.source, args.workers)
+            params['pass'] = i
+            previous = previous_result(args.history, params) if args.history else None
+            print(format_result(f'第 {i} 遍', result, previous))
+            if args.history:
+                append_history(args.history, {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                              'revision': git_revision(), 'params': dict(params), **result})
+        print(f"[INFO] 服务器请求统计: {server_stats(url)}")
+    finally:
+        close_stores()
+        fund_cache.get_cache().close()
+        process.terminate()
+        process.join(10)
+        if args.keep:
+            print(f"[INFO] 已保留 {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
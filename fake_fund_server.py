@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+离线回放服务器
+在本地模拟东方财富 F10DataApi.aspx / fundcode_search.js 和新浪 FundInfo_LSJZ.php，
+按上游的响应格式分页渲染录制好的（或按种子生成的）净值数据；可配置延迟、错误注入和基金数量。
+既可以按路径直接访问，也可以当 HTTP 代理用（HTTP_PROXY 指向本服务），
+抓取脚本发往原域名的请求都会落到这里，不需要改抓取代码
+
+用法:
+    python fake_fund_server.py --funds 500 --days 2500                  # 生成数据，监听 127.0.0.1:8767
+    python fake_fund_server.py --latency 0.2 --error-rate 0.05 --reset-rate 0.01
+    python fake_fund_server.py --record recordings/ --fund 021489      # 从线上录制
+    python fake_fund_server.py --replay recordings/                     # 回放录制的数据
+    HTTP_PROXY=http://127.0.0.1:8767 python fund_nav_scraper.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+HOST = '127.0.0.1'
+PORT = 8767
+
+FUNDS = 200
+DAYS = 2500
+END_DATE = date(2025, 12, 31)
+
+# 新浪历史净值页每页行数
+SINA_PAGE_ROWS = 40
+
+# 生成基金名称用的主题词（让 fund_discovery 的主题标签也能命中）
+NAME_THEMES = ['机器人', '人工智能', '半导体', '新能源', '医药', '消费', '军工', '先进制造', '价值', '成长']
+
+EASTMONEY_HEAD = ("<table class='w782 comm lsjz'><thead><tr><th class='first'>净值日期</th><th>单位净值</th>"
+                  "<th>累计净值</th><th>日增长率</th><th>申购状态</th><th>赎回状态</th>"
+                  "<th class='tor last'>分红送配</th></tr></thead><tbody>")
+EASTMONEY_EMPTY = "<tr><td colspan='7' align='center' class='tor'>暂无数据!</td></tr>"
+
+SINA_HEAD = ('<table id="historyTable" class="list"><thead><tr><td>净值日期</td><td>单位净值</td>'
+             '<td>累计净值</td><td>净值增长率</td></tr></thead><tbody>')
+
+
+def _pct(value):
+    return '' if value is None else f'{value:.2f}%'
+
+
+def _num(value):
+    return '' if value is None else f'{value:.4f}'
+
+
+class SyntheticData:
+    """按种子生成的基金与净值（工作日、带分红，日增长率与净值一致），同一参数每次结果相同"""
+
+    def __init__(self, funds=FUNDS, days=DAYS, seed=0):
+        self.days = days
+        self.seed = seed
+        self._codes = [f'{i + 1:06d}' for i in range(funds)]
+
+    def codes(self):
+        return self._codes
+
+    def name(self, code):
+        return f'模拟{NAME_THEMES[int(code) % len(NAME_THEMES)]}混合{code}'
+
+    @lru_cache(maxsize=256)
+    def history(self, code):
+        """(date, nav, cumulative_nav, daily_return) 列表，日期倒序（与上游一致）"""
+        rng = random.Random(f'{self.seed}:{code}')
+        # 成立日期错开，部分基金历史较短
+        length = max(2, int(self.days * rng.uniform(0.3, 1.0)))
+        day = END_DATE
+        days = []
+        while len(days) < length:
+            if day.weekday() < 5:
+                days.append(day)
+            day -= timedelta(days=1)
+        days.reverse()
+        nav = cumulative = round(rng.uniform(0.8, 1.2), 4)
+        drift, vol = rng.uniform(-0.0002, 0.0008), rng.uniform(0.005, 0.02)
+        rows = [(days[0].isoformat(), nav, cumulative, None)]
+        for day in days[1:]:
+            new_nav = max(0.1, round(nav * (1 + rng.gauss(drift, vol)), 4))
+            new_cumulative = round(cumulative + new_nav - nav, 4)
+            if rng.random() < 0.002 and new_nav > 1.2:
+                # 分红：单位净值下降，累计净值不变
+                new_nav = round(new_nav - 0.1, 4)
+            rows.append((day.isoformat(), new_nav, new_cumulative,
+                         round((new_cumulative - cumulative) / nav * 100, 2)))
+            nav, cumulative = new_nav, new_cumulative
+        rows.reverse()
+        return rows
+
+
+class RecordedData:
+    """录制目录：每只基金一个 <code>.json（名称与日期倒序的净值行）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._codes = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+
+    def codes(self):
+        return self._codes
+
+    @lru_cache(maxsize=256)
+    def _load(self, code):
+        with open(os.path.join(self.directory, f'{code}.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def name(self, code):
+        return self._load(code)['name']
+
+    def history(self, code):
+        return [tuple(row) for row in self._load(code)['rows']]
+
+
+def record(codes, directory):
+    """从线上抓取并保存为录制目录，返回每只基金的行数"""
+    from fund_sources import EastmoneySource
+    from fund_universe import DEFAULT_FUNDS
+    names = {fund['code']: fund['name'] for fund in DEFAULT_FUNDS}
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    source = EastmoneySource()
+    for code in codes:
+        rows = sorted(source.fetch(code), reverse=True)
+        with open(os.path.join(directory, f'{code}.json'), 'w', encoding='utf-8') as f:
+            json.dump({'name': names.get(code, code), 'rows': rows}, f, ensure_ascii=False)
+        counts[code] = len(rows)
+    return counts
+
+
+def render_eastmoney(data, query):
+    code = query.get('code', '')
+    page = max(1, int(query.get('page', 1)))
+    per = max(1, int(query.get('per', 20)))
+    sdate, edate = query.get('sdate'), query.get('edate')
+    rows = data.history(code) if code in _code_set(data) else []
+    if sdate or edate:
+        rows = [row for row in rows if (not sdate or row[0] >= sdate) and (not edate or row[0] <= edate)]
+    records = len(rows)
+    pages = math.ceil(records / per)
+    chunk = rows[(page - 1) * per:page * per]
+    body = ''.join(
+        f"<tr><td>{d}</td><td class='tor bold'>{_num(n)}</td><td class='tor bold'>{_num(c)}</td>"
+        f"<td class='tor bold {'red' if (r or 0) >= 0 else 'grn'}'>{_pct(r)}</td>"
+        f"<td>开放申购</td><td>开放赎回</td><td class='red unbold'></td></tr>"
+        for d, n, c, r in chunk) or EASTMONEY_EMPTY
+    text = (f'var apidata={{ content:"{EASTMONEY_HEAD}{body}</tbody></table>",'
+            f'records:{records},pages:{pages},curpage:{page}}};')
+    return text, 'text/html; charset=utf-8', 'utf-8'
+
+
+def render_sina(data, query):
+    code = query.get('symbol', '')
+    page = max(1, int(query.get('page', 1)))
+    rows = data.history(code) if code in _code_set(data) else []
+    chunk = rows[(page - 1) * SINA_PAGE_ROWS:page * SINA_PAGE_ROWS]
+    body = ''.join(
+        f'<tr><td><div align="center">{d}</div></td><td><div align="center">{_num(n)}</div></td>'
+        f'<td><div align="center">{_num(c)}</div></td><td><div align="center">{_pct(r)}</div></td></tr>'
+        for d, n, c, r in chunk)
+    return f'<html><body>{SINA_HEAD}{body}</tbody></table></body></html>', 'text/html; charset=gb2312', 'gb2312'
+
+
+def render_fundcode(data, query):
+    entries = ','.join(f'["{code}","MN{code}","{data.name(code)}","混合型-偏股","MONI{code}"]'
+                       for code in data.codes())
+    return f'var r = [{entries}];', 'application/javascript; charset=utf-8', 'utf-8'
+
+
+ROUTES = {
+    '/f10/F10DataApi.aspx': render_eastmoney,
+    '/fundInfo/view/FundInfo_LSJZ.php': render_sina,
+    '/js/fundcode_search.js': render_fundcode,
+}
+
+_code_sets = {}
+
+
+def _code_set(data):
+    codes = _code_sets.get(id(data))
+    if codes is None:
+        codes = _code_sets[id(data)] = frozenset(data.codes())
+    return codes
+
+
+class FaultInjector:
+    """按比例注入 503 / 429 / 断开连接，带种子可复现"""
+
+    def __init__(self, error_rate=0.0, throttle_rate=0.0, reset_rate=0.0, seed=0):
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.reset_rate = reset_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        with self._lock:
+            x = self._rng.random()
+        if x < self.error_rate:
+            return 'error'
+        x -= self.error_rate
+        if x < self.throttle_rate:
+            return 'throttle'
+        x -= self.throttle_rate
+        if x < self.reset_rate:
+            return 'reset'
+        return None
+
+    def delay(self, latency, jitter):
+        if latency <= 0:
+            return 0.0
+        with self._lock:
+            return max(0.0, latency * (1 + jitter * self._rng.uniform(-1, 1)))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体分两次写出，关闭 Nagle 避免长连接上每个请求多等一个延迟 ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        # 代理请求的 path 是完整 URL
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == '/_stats':
+            return self._send(200, json.dumps(server.stats()).encode(), 'application/json')
+
+        time.sleep(server.faults.delay(server.latency, server.jitter))
+        fault = server.faults.draw()
+        server.count(fault or 'ok')
+        if fault == 'reset':
+            self.close_connection = True
+            return
+        if fault == 'error':
+            return self._send(503, b'Service Unavailable', 'text/plain')
+        if fault == 'throttle':
+            return self._send(429, b'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._send(404, b'Not Found', 'text/plain')
+        text, content_type, encoding = route(server.data, query)
+        body = text.encode(encoding)
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', content_type, {'ETag': etag})
+        self._send(200, body, content_type, {'ETag': etag})
+
+    def _send(self, status, body, content_type, headers=None):
+        if body and 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+            body = gzip.compress(body, 1)
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeFundServer(ThreadingHTTPServer):
+    """回放服务器；port=0 时自动分配端口（见 url）"""
+
+    daemon_threads = True
+
+    def __init__(self, data, host=HOST, port=PORT, latency=0.0, jitter=0.5, error_rate=0.0,
+                 throttle_rate=0.0, reset_rate=0.0, seed=0):
+        super().__init__((host, port), ReplayHandler)
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = FaultInjector(error_rate, throttle_rate, reset_rate, seed)
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, outcome):
+        with self._counts_lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def start(self):
+        """在后台线程中运行"""
+        thread = threading.Thread(target=self.serve_forever, name='fake-fund-server', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='东方财富/新浪离线回放服务器')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--funds', type=int, default=FUNDS, help='生成的基金数')
+    parser.add_argument('--days', type=int, default=DAYS, help='每只基金最多的交易日数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='回放录制目录（代替生成数据）')
+    parser.add_argument('--record', help='从线上录制 --fund 指定的基金到该目录后退出')
+    parser.add_argument('--fund', action='append', help='录制的基金代码，可重复；默认内置基金池')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.5, help='延迟抖动比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='直接断开连接的比例')
+    args = parser.parse_args()
+
+    if args.record:
+        from fund_universe import DEFAULT_FUNDS
+        codes = args.fund or [fund['code'] for fund in DEFAULT_FUNDS]
+        for code, count in record(codes, args.record).items():
+            print(f"[INFO] {code}: {count} 行")
+        return
+
+    data = RecordedData(args.replay) if args.replay else SyntheticData(args.funds, args.days, args.seed)
+    server = FakeFundServer(data, args.host, args.port, args.latency, args.jitter, args.error_rate,
+                            args.throttle_rate, args.reset_rate, args.seed)
+    print(f"[INFO] 回放服务器 {server.url}: {len(data.codes())} 只基金，"
+          f"延迟 {args.latency}s，503 {args.error_rate:.0%}，429 {args.throttle_rate:.0%}，断开 {args.reset_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[INFO] 请求统计: {server.stats()}")
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+净值分析
+把 nav_history 读成 NumPy 数组（日期为 int64 天数，净值为 float64），
+按基金 × 日期矩阵向量化计算累计/年化收益、波动率、夏普比率、最大回撤及滚动指标，不对行做 Python 循环
+
+用法:
+    python fund_analytics.py                 # 全部基金的指标表
+    python fund_analytics.py --fund 021489   # 单只基金
+"""
+
+import argparse
+import sqlite3
+from itertools import chain
+
+import numpy as np
+
+import fund_compact
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+TRADING_DAYS = 252
+RISK_FREE_RATE = 0.02
+
+# 默认用累计净值计算收益（含分红），缺失时退回单位净值
+NAV_EXPR = 'COALESCE(cumulative_nav, nav_value)'
+
+# 1970-01-01 的儒略日
+UNIX_EPOCH_JD = 2440587.5
+
+# 紧凑布局：一只基金的 (天数, 净值)，参数 (fund_id, 起始天数, 结束天数)
+COMPACT_NAV_EXPR = fund_compact.decode_sql('COALESCE(cumulative_nav, nav)')
+COMPACT_PANEL_SQL = f'''
+    SELECT day, {COMPACT_NAV_EXPR} FROM nav_compact
+    WHERE fund_id = ? AND day BETWEEN ? AND ? AND COALESCE(cumulative_nav, nav) IS NOT NULL
+    ORDER BY day
+'''
+
+
+def to_days(dates):
+    """'YYYY-MM-DD' 序列 → 自 1970-01-01 起的天数（int64）"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def from_days(days):
+    """天数 → 'YYYY-MM-DD' 字符串数组"""
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype(str)
+
+
+class NavPanel:
+    """
+    按基金拼接的净值：第 i 只基金的数据为 days[offsets[i]:offsets[i+1]]，
+    基金内按日期升序；axis/positions 为可选的预先算好的日期轴及每行在轴上的位置（见 fund_snapshot）
+    """
+
+    def __init__(self, codes, offsets, days, navs, axis=None, positions=None):
+        self.codes = codes
+        self.offsets = offsets
+        self.days = days
+        self.navs = navs
+        self.axis = axis
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.codes)
+
+    def fund(self, code):
+        """单只基金的 (days, navs)"""
+        i = int(np.searchsorted(self.codes, code))
+        if i >= len(self.codes) or self.codes[i] != code:
+            raise KeyError(code)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.days[lo:hi], self.navs[lo:hi]
+
+    def matrix(self, fill=True):
+        """
+        基金 × 日期矩阵，返回 (日期轴 int64, 矩阵 float64)
+        某基金在某日无数据为 NaN；fill 为 True 时用前值填充（成立前保持 NaN）
+        """
+        if self.axis is not None:
+            axis, col = self.axis, self.positions
+        else:
+            axis, col = np.unique(self.days, return_inverse=True)
+        row = np.repeat(np.arange(len(self.codes)), np.diff(self.offsets))
+        mat = np.full((len(self.codes), len(axis)), np.nan)
+        mat[row, col] = self.navs
+        if fill:
+            mat = ffill(mat)
+        return axis, mat
+
+
+def load_panel(db_path=DB_PATH, fund_codes=None, start=None, end=None):
+    """
+    读出全部（或指定）基金的净值，按 fund_code、date 排序
+    日期在 SQLite 中直接换算成天数，两列数值平铺读入一个数组，避免逐行构造字符串数组；
+    紧凑布局下逐只基金按 nav_compact 主键范围读取
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        # 两次查询在同一个读事务里，看到同一份快照
+        conn.execute('BEGIN')
+        if fund_compact.is_compact(conn):
+            counts, flat = _read_compact(conn, fund_codes, start, end)
+        else:
+            counts, flat = _read_rows(conn, fund_codes, start, end)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    codes = np.array([code for code, _ in counts], dtype=str)
+    offsets = np.concatenate([[0], np.cumsum([n for _, n in counts], dtype=np.int64)]).astype(np.int64)
+    return NavPanel(codes, offsets, flat[:, 0].astype(np.int64), flat[:, 1].copy())
+
+
+def _read_rows(conn, fund_codes, start, end):
+    where = f'{NAV_EXPR} IS NOT NULL'
+    params = []
+    if fund_codes:
+        codes = list(fund_codes)
+        where += f" AND fund_code IN ({','.join('?' * len(codes))})"
+        params.extend(codes)
+    if start:
+        where += ' AND date >= ?'
+        params.append(start)
+    if end:
+        where += ' AND date <= ?'
+        params.append(end)
+
+    counts = conn.execute(
+        f'SELECT fund_code, COUNT(*) FROM nav_history WHERE {where} GROUP BY fund_code ORDER BY fund_code',
+        params).fetchall()
+    total = sum(n for _, n in counts)
+    cursor = conn.execute(
+        f'SELECT CAST(julianday(date) - {UNIX_EPOCH_JD} AS INTEGER), {NAV_EXPR} FROM nav_history'
+        f' WHERE {where} ORDER BY fund_code, date', params)
+    return counts, np.fromiter(chain.from_iterable(cursor), np.float64, 2 * total).reshape(total, 2)
+
+
+def _read_compact(conn, fund_codes, start, end):
+    ids = fund_compact.fund_ids(conn)
+    lo = fund_compact.to_day(start) if start else -(1 << 62)
+    hi = fund_compact.to_day(end) if end else 1 << 62
+    counts, parts = [], []
+    for code in sorted(set(fund_codes) if fund_codes else ids):
+        if code not in ids:
+            continue
+        rows = conn.execute(COMPACT_PANEL_SQL, (ids[code], lo, hi)).fetchall()
+        if rows:
+            counts.append((code, len(rows)))
+            parts.append(rows)
+    total = sum(n for _, n in counts)
+    flat = np.fromiter(chain.from_iterable(chain.from_iterable(parts)), np.float64, 2 * total)
+    return counts, flat.reshape(total, 2)
+
+
+def ffill(mat):
+    """按行前值填充 NaN（向量化）"""
+    valid = ~np.isnan(mat)
+    idx = np.where(valid, np.arange(mat.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = mat[np.arange(mat.shape[0])[:, None], idx]
+    # 首个有效值之前仍为 NaN
+    filled[np.cumsum(valid, axis=1) == 0] = np.nan
+    return filled
+
+
+def daily_returns(mat):
+    """逐日收益率矩阵，形状 (基金数, 日期数 - 1)，成立前为 NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return mat[:, 1:] / mat[:, :-1] - 1
+
+
+def point_returns(mat):
+    """
+    每只基金相对自己上一个净值点的收益，与输入同形；mat 不做前值填充，
+    没有净值的日子、首个净值点为 NaN，跨过缺失日的收益记在下一个净值点上（与 fund_metrics 的折叠口径一致）
+    """
+    prev = np.full_like(mat, np.nan)
+    prev[:, 1:] = ffill(mat)[:, :-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return mat / prev - 1
+
+
+def _first_last(mat, axis_days):
+    """每行首个/最后一个有效值及对应日期"""
+    valid = ~np.isnan(mat)
+    has = valid.any(axis=1)
+    first_idx = np.argmax(valid, axis=1)
+    last_idx = mat.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    rows = np.arange(mat.shape[0])
+    first = np.where(has, mat[rows, first_idx], np.nan)
+    last = np.where(has, mat[rows, last_idx], np.nan)
+    return first, last, axis_days[first_idx], axis_days[last_idx], has
+
+
+def max_drawdown(mat):
+    """每行的最大回撤（负数，如 -0.25 表示 25%）"""
+    peak = np.fmax.accumulate(mat, axis=1)
+    with np.errstate(invalid='ignore'):
+        drawdown = mat / peak - 1
+    return np.nanmin(np.where(np.isnan(drawdown), 0.0, drawdown), axis=1)
+
+
+def compute_metrics(axis_days, mat, risk_free=RISK_FREE_RATE, trading_days=TRADING_DAYS):
+    """
+    对基金 × 日期矩阵（不做前值填充，即 panel.matrix(fill=False)）计算整套指标，返回 {指标名: 每只基金一个值的数组}
+    起止日期、收益都只看各基金自己的净值日，不受其他基金日期轴的影响；
+    年化收益按自然日折算；波动率、夏普按交易日折算
+    """
+    first, last, first_day, last_day, has = _first_last(mat, axis_days)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cumulative = last / first - 1
+        years = (last_day - first_day) / 365.25
+        annualized = np.where(years > 0, np.power(1 + cumulative, 1 / np.where(years > 0, years, 1)) - 1, np.nan)
+
+        rets = point_returns(mat)
+        count = np.sum(~np.isnan(rets), axis=1)
+        mean = np.nanmean(np.where(count[:, None] > 0, rets, 0.0), axis=1)
+        std = np.where(count > 1, np.nanstd(np.where(count[:, None] > 1, rets, 0.0), axis=1, ddof=1), np.nan)
+        volatility = std * np.sqrt(trading_days)
+        sharpe = (mean * trading_days - risk_free) / volatility
+
+    return {
+        'start': np.where(has, first_day, -1),
+        'end': np.where(has, last_day, -1),
+        'days': count + has,
+        'cumulative_return': cumulative,
+        'annualized_return': annualized,
+        'volatility': volatility,
+        'sharpe': sharpe,
+        'max_drawdown': max_drawdown(mat),
+    }
+
+
+def _window_sums(values, window):
+    """按行的滑动窗口和（前缀和相减），结果比输入少 window - 1 列"""
+    csum = np.cumsum(values, axis=1)
+    csum = np.concatenate([np.zeros((values.shape[0], 1)), csum], axis=1)
+    return csum[:, window:] - csum[:, :-window]
+
+
+def rolling_return(mat, window):
+    """window 个交易日的滚动收益，第 j 列对应日期轴第 j + window 天"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return mat[:, window:] / mat[:, :-window] - 1
+
+
+def rolling_volatility(mat, window, trading_days=TRADING_DAYS):
+    """window 个交易日的滚动年化波动率，第 j 列对应日期轴第 j + window 天"""
+    rets = daily_returns(mat)
+    valid = ~np.isnan(rets)
+    r = np.where(valid, rets, 0.0)
+    n = _window_sums(valid.astype(np.float64), window)
+    s1 = _window_sums(r, window)
+    s2 = _window_sums(r * r, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+    var = np.where(n == window, np.maximum(var, 0.0), np.nan)
+    return np.sqrt(var * trading_days)
+
+
+def rolling_sharpe(mat, window, risk_free=RISK_FREE_RATE, trading_days=TRADING_DAYS):
+    """window 个交易日的滚动夏普比率"""
+    rets = daily_returns(mat)
+    valid = ~np.isnan(rets)
+    n = _window_sums(valid.astype(np.float64), window)
+    s1 = _window_sums(np.where(valid, rets, 0.0), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n == window, s1 / n, np.nan)
+        return (mean * trading_days - risk_free) / rolling_volatility(mat, window, trading_days)
+
+
+def panel_metrics(panel, **kwargs):
+    """NavPanel → (基金代码数组, 指标 dict)"""
+    axis, mat = panel.matrix(fill=False)
+    return panel.codes, compute_metrics(axis, mat, **kwargs)
+
+
+def fund_metrics(db_path, fund_code, **kwargs):
+    """单只基金的指标，返回 {指标名: 标量}，无数据返回 None"""
+    panel = load_panel(db_path, [fund_code])
+    if not len(panel):
+        return None
+    _, metrics = panel_metrics(panel, **kwargs)
+    return {name: values[0].item() for name, values in metrics.items()}
+
+
+def format_metrics(codes, metrics):
+    """按年化收益降序排列的文本表"""
+    order = np.argsort(-np.nan_to_num(metrics['annualized_return'], nan=-np.inf))
+    starts = from_days(np.maximum(metrics['start'], 0))
+    ends = from_days(np.maximum(metrics['end'], 0))
+    lines = [f"{'代码':<8}{'起始':<12}{'截止':<12}{'累计':>10}{'年化':>10}{'波动':>9}{'夏普':>8}{'最大回撤':>10}"]
+    for i in order:
+        lines.append(
+            f"{codes[i]:<8}{starts[i]:<12}{ends[i]:<12}"
+            f"{metrics['cumulative_return'][i]:>+10.2%}{metrics['annualized_return'][i]:>+10.2%}"
+            f"{metrics['volatility'][i]:>9.2%}{metrics['sharpe'][i]:>8.2f}{metrics['max_drawdown'][i]:>10.2%}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基金净值指标（向量化计算）')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--fund', action='append', help='只计算指定基金，可重复')
+    parser.add_argument('--start', help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', help='截止日期 YYYY-MM-DD')
+    parser.add_argument('--risk-free', type=float, default=RISK_FREE_RATE, help='年化无风险利率')
+    parser.add_argument('--snapshot', help='从列式快照目录读取（见 fund_snapshot），忽略 --fund/--start/--end')
+    args = parser.parse_args()
+
+    if args.snapshot:
+        from fund_snapshot import open_snapshot
+        snapshot = open_snapshot(args.snapshot)
+        if snapshot is None:
+            print('[WARN] 快照不存在，先运行 fund_snapshot.py refresh')
+            return
+        panel = snapshot.panel()
+    else:
+        panel = load_panel(args.db, args.fund, args.start, args.end)
+    if not len(panel):
+        print('[WARN] 没有净值数据')
+        return
+    codes, metrics = panel_metrics(panel, risk_free=args.risk_free)
+    for line in format_metrics(codes, metrics):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
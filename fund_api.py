@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+只读查询服务
+本地 HTTP/JSON 接口，提供单只基金的净值序列与指标、按主题的最新净值与排行，
+使用方不必再直接打开数据库写 SQL。
+只读连接池（mode=ro + query_only，WAL 下与同步进程的写事务互不阻塞），SQL 都是固定语句（连接内预编译缓存）；
+已迁移为紧凑布局（fund_compact）时净值序列直接按 nav_compact 主键范围读取；
+结果按请求缓存在 LRU 中：写端每次写入推进 fund_metrics.version，
+读端发现 PRAGMA data_version 变化后只查出 version 更大的基金并失效它们的条目（主题级结果一并失效）；
+funds 表没有版本列，data_version 变化时与上次读到的基础信息逐行比对，名称/主题等有改动的基金同样失效；
+长序列不进缓存，按批从游标读出、分块传输
+
+用法:
+    python fund_api.py --port 8780
+    curl 'http://127.0.0.1:8780/funds/021489'
+    curl 'http://127.0.0.1:8780/funds/021489/nav?start=2025-01-01'
+    curl 'http://127.0.0.1:8780/latest?theme=机器人'
+    curl 'http://127.0.0.1:8780/top?by=return_1y&n=20&theme=机器人'
+    curl 'http://127.0.0.1:8780/metrics'          # Prometheus 文本
+"""
+
+import argparse
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import fund_telemetry as telemetry
+
+import fund_compact
+from fund_metrics import PERIODS, RANK_COLUMNS, top_funds
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+HOST = '127.0.0.1'
+PORT = 8780
+
+POOL_SIZE = 8
+CACHE_ENTRIES = 4096
+CACHE_BYTES = 64 * 1024 * 1024
+
+# 行数超过该值的净值序列不缓存，边读边分块发送
+STREAM_ROWS = 5000
+FETCH_BATCH = 1000
+
+FUND_COLUMNS = ['fund_code', 'fund_name', 'fund_company', 'fund_manager', 'fund_type', 'theme']
+METRIC_COLUMNS = ['first_date', 'last_date', 'last_nav', 'nav_count', 'drawdown', 'max_drawdown',
+                  'volatility', 'sharpe', 'cumulative_return', 'annualized_return'] + list(PERIODS)
+NAV_FIELDS = ['date', 'nav', 'cumulative_nav', 'daily_return']
+
+FUND_SQL = f'''
+    SELECT {', '.join('f.' + c for c in FUND_COLUMNS)}, {', '.join('m.' + c for c in METRIC_COLUMNS)}
+    FROM funds f LEFT JOIN fund_metrics m ON m.fund_code = f.fund_code
+    WHERE f.fund_code = ?
+'''
+
+LATEST_SQL = '''
+    SELECT f.fund_code, f.fund_name, f.theme, m.last_date, m.last_nav, m.return_1m, m.return_1y
+    FROM funds f LEFT JOIN fund_metrics m ON m.fund_code = f.fund_code
+    WHERE ?1 IS NULL OR f.theme = ?1
+    ORDER BY f.fund_code
+'''
+LATEST_FIELDS = ['code', 'name', 'theme', 'last_date', 'last_nav', 'return_1m', 'return_1y']
+
+NAV_SQL = '''
+    SELECT date, nav_value, cumulative_nav, daily_return FROM nav_history
+    WHERE fund_code = ? AND date >= ? AND date <= ?
+    ORDER BY date
+'''
+
+# 序列区间的默认两端（紧凑布局下要换算成天数，需是合法日期）
+MIN_DATE = '0001-01-01'
+MAX_DATE = '9999-12-31'
+
+CHANGED_SQL = 'SELECT fund_code, version FROM fund_metrics WHERE version > ?'
+FUNDS_SQL = f"SELECT {', '.join(FUND_COLUMNS)} FROM funds"
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class NotFound(LookupError):
+    pass
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class ReadPool:
+    """固定大小的只读连接池"""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self._pool = queue.Queue()
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(f'file:{quote(self.db_path)}?mode=ro', uri=True, timeout=5,
+                               check_same_thread=False, cached_statements=128)
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute('PRAGMA cache_size=-16384')
+        conn.execute('PRAGMA mmap_size=268435456')
+        return conn
+
+    def acquire(self):
+        return self._pool.get()
+
+    def release(self, conn):
+        self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+class ResultCache:
+    """
+    编码好的响应体的 LRU（条目数与字节数双上限）
+    条目归属某只基金（fund=None 为主题级/全库结果），按基金失效
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, max_bytes=CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.epoch = 0
+        self._entries = OrderedDict()
+        self._by_fund = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, fund, body, epoch):
+        """epoch 为查询前读到的值；期间发生过失效则不写入（避免把失效前读到的旧结果放回缓存）"""
+        with self._lock:
+            if epoch != self.epoch or len(body) > self.max_bytes:
+                return
+            self._remove(key)
+            self._entries[key] = (fund, body)
+            self._by_fund.setdefault(fund, set()).add(key)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        fund, body = entry
+        self._bytes -= len(body)
+        keys = self._by_fund.get(fund)
+        keys.discard(key)
+        if not keys:
+            del self._by_fund[fund]
+
+    def invalidate(self, funds):
+        """失效这些基金及所有主题级条目"""
+        with self._lock:
+            self.epoch += 1
+            for fund in list(funds) + [None]:
+                for key in list(self._by_fund.get(fund, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+            self._by_fund.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'funds': len(self._by_fund)}
+
+
+class FundQueryService:
+    """查询与缓存；方法返回编码好的 JSON（bytes），长序列返回分块迭代器"""
+
+    def __init__(self, db_path=DB_PATH, pool_size=POOL_SIZE, cache_entries=CACHE_ENTRIES, cache_bytes=CACHE_BYTES):
+        self.pool = ReadPool(db_path, pool_size)
+        self.cache = ResultCache(cache_entries, cache_bytes)
+        self._watch = self.pool._connect()
+        self._watch_lock = threading.Lock()
+        self._data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+        self._seen = self._max_version()
+        self._funds = self._fund_rows()
+        self.nav_sql = fund_compact.RANGE_SQL if fund_compact.is_compact(self._watch) else NAV_SQL
+
+    def _max_version(self):
+        try:
+            return self._watch.execute('SELECT COALESCE(MAX(version), 0) FROM fund_metrics').fetchone()[0]
+        except sqlite3.OperationalError:
+            # 写端尚未升级（没有 version 列）：有任何提交就整体清空
+            return None
+
+    def _fund_rows(self):
+        """funds 表快照 {fund_code: 整行}（基金池只有几千行，整表读出比对）"""
+        return {row[0]: row for row in self._watch.execute(FUNDS_SQL)}
+
+    def _changed_funds(self):
+        """与上次快照相比新增、删除或信息有改动的基金"""
+        funds = self._fund_rows()
+        changed = {code for code in funds.keys() | self._funds.keys() if funds.get(code) != self._funds.get(code)}
+        self._funds = funds
+        return changed
+
+    def refresh(self):
+        """其他连接提交过写事务时，失效有新数据的基金"""
+        with self._watch_lock:
+            data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            # 迁移工具可能在服务运行期间改了布局
+            self.nav_sql = fund_compact.RANGE_SQL if fund_compact.is_compact(self._watch) else NAV_SQL
+            latest = self._max_version()
+            changed = self._changed_funds()
+            if self._seen is None or latest is None or latest < self._seen:
+                # 指标表被重建（version 从头开始）
+                self.cache.clear()
+            else:
+                if latest > self._seen:
+                    changed.update(code for code, _ in self._watch.execute(CHANGED_SQL, (self._seen,)))
+                if changed:
+                    self.cache.invalidate(changed)
+            self._seen = latest
+
+    def _cached(self, key, fund, compute):
+        self.refresh()
+        body = self.cache.get(key)
+        telemetry.inc('api_cache_total', result='miss' if body is None else 'hit')
+        if body is None:
+            epoch = self.cache.epoch
+            with self.pool.connection() as conn:
+                body = _dumps(compute(conn)).encode()
+            self.cache.put(key, fund, body, epoch)
+        return body
+
+    def fund(self, code):
+        def compute(conn):
+            row = conn.execute(FUND_SQL, (code,)).fetchone()
+            if row is None:
+                raise NotFound(f'基金不存在: {code}')
+            info = dict(zip(FUND_COLUMNS, row))
+            info['metrics'] = dict(zip(METRIC_COLUMNS, row[len(FUND_COLUMNS):]))
+            return info
+        return self._cached(('fund', code), code, compute)
+
+    def latest(self, theme=None):
+        def compute(conn):
+            return [dict(zip(LATEST_FIELDS, row)) for row in conn.execute(LATEST_SQL, (theme,))]
+        return self._cached(('latest', theme), None, compute)
+
+    def top(self, by='return_1y', n=20, ascending=False, theme=None):
+        if by not in RANK_COLUMNS:
+            raise BadRequest(f'不支持的排行指标: {by}')
+        return self._cached(('top', by, n, ascending, theme), None,
+                            lambda conn: top_funds(conn, by, n, ascending, theme))
+
+    def nav(self, code, start=None, end=None):
+        """
+        净值序列 {"code", "fields", "rows": [[date, nav, cumulative_nav, daily_return], ...]}
+        不超过 STREAM_ROWS 行时返回 bytes 并缓存；否则返回 SeriesStream（发送完才归还连接）
+        """
+        key = ('nav', code, start, end)
+        self.refresh()
+        body = self.cache.get(key)
+        telemetry.inc('api_cache_total', result='miss' if body is None else 'hit')
+        if body is not None:
+            return body
+        epoch = self.cache.epoch
+        head = f'{{"code":{_dumps(code)},"fields":{_dumps(NAV_FIELDS)},"rows":['
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(self.nav_sql, (code, start or MIN_DATE, end or MAX_DATE))
+            parts, rows = [], 0
+            for batch in iter(lambda: cursor.fetchmany(FETCH_BATCH), []):
+                parts.append(_dumps(batch)[1:-1])
+                rows += len(batch)
+                if rows > STREAM_ROWS:
+                    stream = SeriesStream(self.pool, conn, cursor, (head + ','.join(parts)).encode())
+                    conn = None
+                    return stream
+            if not rows and conn.execute('SELECT 1 FROM funds WHERE fund_code = ?', (code,)).fetchone() is None:
+                raise NotFound(f'基金不存在: {code}')
+        finally:
+            if conn is not None:
+                self.pool.release(conn)
+        body = (head + ','.join(parts) + ']}').encode()
+        self.cache.put(key, code, body, epoch)
+        return body
+
+    def close(self):
+        self._watch.close()
+        self.pool.close()
+
+
+class SeriesStream:
+    """分块发送的长净值序列：先发已读出的部分，之后每批一块；迭代结束或 close() 时归还连接"""
+
+    def __init__(self, pool, conn, cursor, first):
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.first = first
+
+    def __iter__(self):
+        try:
+            yield self.first
+            for batch in iter(lambda: self.cursor.fetchmany(FETCH_BATCH), []):
+                yield (',' + _dumps(batch)[1:-1]).encode()
+            yield b']}'
+        finally:
+            self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.cursor.close()
+            self.pool.release(self.conn)
+            self.conn = None
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体分两次写出，关闭 Nagle 避免长连接上每个请求多等一个延迟 ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        service = self.server.service
+        route = 'unknown'
+        start = time.monotonic()
+        status = 200
+        try:
+            if parts == ['latest']:
+                route = 'latest'
+                body = service.latest(query.get('theme'))
+            elif len(parts) == 2 and parts[0] == 'funds':
+                route = 'fund'
+                body = service.fund(parts[1])
+            elif len(parts) == 3 and parts[0] == 'funds' and parts[2] == 'nav':
+                route = 'nav'
+                start_date, end_date = query.get('start'), query.get('end')
+                for value in (start_date, end_date):
+                    try:
+                        value and date.fromisoformat(value)
+                    except ValueError:
+                        raise BadRequest(f'无效的日期: {value}')
+                body = service.nav(parts[1], start_date, end_date)
+            elif parts == ['top']:
+                route = 'top'
+                try:
+                    n = min(int(query.get('n', 20)), 1000)
+                except ValueError:
+                    raise BadRequest(f"无效的 n: {query.get('n')}")
+                body = service.top(query.get('by', 'return_1y'), n, query.get('asc') in ('1', 'true'),
+                                   query.get('theme'))
+            elif parts == ['metrics']:
+                route = 'metrics'
+                return self._send(200, telemetry.to_prometheus().encode(), 'text/plain; version=0.0.4')
+            else:
+                status = 404
+                return self._error(404, f'未知路径: {url.path}')
+            if isinstance(body, SeriesStream):
+                return self._send_stream(body)
+            self._send(200, body)
+        except BadRequest as e:
+            status = 400
+            self._error(400, str(e))
+        except NotFound as e:
+            status = 404
+            self._error(404, str(e))
+        except sqlite3.Error as e:
+            status = 503
+            self._error(503, f'数据库错误: {e}')
+        finally:
+            telemetry.observe('api_request_seconds', time.monotonic() - start, route=route)
+            telemetry.inc('api_requests_total', route=route, status=status)
+
+    def _error(self, status, message):
+        self._send(status, _dumps({'error': message}).encode())
+
+    def _send(self, status, body, content_type='application/json; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, stream):
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in stream:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        finally:
+            stream.close()
+
+    def log_message(self, *args):
+        pass
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host=HOST, port=PORT):
+        super().__init__((host, port), QueryHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基金净值只读查询服务')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--pool', type=int, default=POOL_SIZE, help='只读连接数')
+    parser.add_argument('--cache-entries', type=int, default=CACHE_ENTRIES, help='结果缓存条目数上限')
+    parser.add_argument('--cache-mb', type=int, default=CACHE_BYTES // (1024 * 1024), help='结果缓存容量（MB）')
+    args = parser.parse_args()
+
+    service = FundQueryService(args.db, args.pool, args.cache_entries, args.cache_mb * 1024 * 1024)
+    server = QueryServer(service, args.host, args.port)
+    print(f"[INFO] 查询服务 http://{args.host}:{server.server_address[1]}（{args.db}，{args.pool} 个只读连接）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
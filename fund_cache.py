@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+本地 HTTP 响应缓存
+按 URL 缓存响应正文（zlib 压缩）及解析结果（marshal），存放在一个 SQLite 文件中；
+过期后带 If-None-Match / If-Modified-Since 发条件请求，304 时沿用缓存；
+截止日期早于今天的区间查询长期有效，其余（分页内容随新净值整体后移）只缓存很短时间；总大小超限时按最近访问时间淘汰
+"""
+
+import marshal
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date
+from urllib.parse import urlsplit, parse_qs
+
+import fund_telemetry as telemetry
+from fund_http import http_request
+
+CACHE_PATH = os.path.expanduser('~/.cache/fund_scraper/http_cache.db')
+MAX_BYTES = 256 * 1024 * 1024
+
+# 不限截止日期的查询：历史页按最新在前分页，每出一个新净值所有页的内容都后移一行，
+# 第 1 页新、后续页旧的组合会漏行或重行，所以各页用同样短的有效期
+LATEST_TTL = 10 * 60
+IMMUTABLE_TTL = 365 * 24 * 3600 # 截止日期早于今天的区间查询，内容不会再变
+
+
+def ttl_for(url):
+    """缓存有效期（秒）：只有日期区间已封闭（edate 早于今天）的查询长期有效"""
+    edate = parse_qs(urlsplit(url).query).get('edate', [''])[0]
+    if edate and edate < date.today().isoformat():
+        return IMMUTABLE_TTL
+    return LATEST_TTL
+
+
+class ResponseCache:
+    """线程安全的磁盘缓存"""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                parser TEXT,
+                parsed BLOB
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_http_cache_access ON http_cache(last_access)')
+        self._total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+
+    def _row(self, url):
+        return self.conn.execute(
+            'SELECT etag, last_modified, expires_at, body, parser, parsed FROM http_cache WHERE url = ?',
+            (url,)).fetchone()
+
+    def _touch(self, url, now, expires_at=None):
+        if expires_at is None:
+            self.conn.execute('UPDATE http_cache SET last_access = ? WHERE url = ?', (now, url))
+        else:
+            self.conn.execute('UPDATE http_cache SET last_access = ?, expires_at = ? WHERE url = ?',
+                              (now, expires_at, url))
+
+    def _evict(self):
+        """超出容量时按最近访问时间淘汰到 90%"""
+        if self._total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for url, size in self.conn.execute(
+                'SELECT url, size FROM http_cache ORDER BY last_access').fetchall():
+            if self._total <= target:
+                break
+            self.conn.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+            self._total -= size
+
+    def get_parsed(self, url, parse, count=True):
+        """未过期且有同一解析函数的结果时直接返回解析结果，否则返回 None"""
+        with self._lock:
+            row = self._row(url)
+            now = time.time()
+            if not row or row[2] < now or row[4] != parse.__name__:
+                return None
+            self._touch(url, now)
+            if count:
+                self.hits += 1
+        return marshal.loads(row[5])
+
+    def put_parsed(self, url, parse, result):
+        """为已缓存的响应记录解析结果"""
+        blob = marshal.dumps(result)
+        with self._lock:
+            row = self.conn.execute('SELECT size, LENGTH(body) FROM http_cache WHERE url = ?', (url,)).fetchone()
+            if not row:
+                return
+            size = row[1] + len(blob)
+            self.conn.execute('UPDATE http_cache SET parser = ?, parsed = ?, size = ? WHERE url = ?',
+                              (parse.__name__, blob, size, url))
+            self._total += size - row[0]
+            self._evict()
+
+    def fetch(self, url, encoding='utf-8', timeout=30):
+        """返回响应文本：未过期直接用缓存，过期则发条件请求"""
+        now = time.time()
+        with self._lock:
+            row = self._row(url)
+        if row and row[2] >= now:
+            with self._lock:
+                self._touch(url, now)
+                self.hits += 1
+            return zlib.decompress(row[3]).decode(encoding)
+
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        resp = http_request(url, encoding, timeout, headers=headers or None)
+
+        if resp.status_code == 304 and row:
+            with self._lock:
+                self._touch(url, now, now + ttl_for(url))
+                self.revalidated += 1
+            return zlib.decompress(row[3]).decode(encoding)
+
+        resp.raise_for_status()
+        text = resp.text
+        body = zlib.compress(text.encode(encoding), 1)
+        with self._lock:
+            self.misses += 1
+            old = self.conn.execute('SELECT size FROM http_cache WHERE url = ?', (url,)).fetchone()
+            self.conn.execute('''
+                INSERT OR REPLACE INTO http_cache
+                    (url, etag, last_modified, expires_at, last_access, size, body, parser, parsed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)
+            ''', (url, resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+                  now + ttl_for(url), now, len(body), body))
+            self._total += len(body) - (old[0] if old else 0)
+            self._evict()
+        return text
+
+    def fetch_parsed(self, url, parse, encoding='utf-8', timeout=30):
+        """返回解析结果；缓存命中时既不走网络也不重新解析"""
+        result = self.get_parsed(url, parse)
+        if result is not None:
+            return result
+        text = self.fetch(url, encoding, timeout)
+        # 304 重新验证后，原解析结果依然有效
+        result = self.get_parsed(url, parse, count=False)
+        if result is None:
+            result = parse(text)
+            self.put_parsed(url, parse, result)
+        return result
+
+    def caching_parser(self, url, parse):
+        """包装解析函数：解析后把结果写回缓存（供流水线的解析阶段使用）"""
+        def parse_and_store(text):
+            result = parse(text)
+            self.put_parsed(url, parse, result)
+            return result
+        return parse_and_store
+
+    def stats(self):
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses,
+                'bytes': self._total}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(path=CACHE_PATH, max_bytes=MAX_BYTES):
+    """替换默认缓存（如改路径、容量）"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = ResponseCache(path, max_bytes)
+        return _cache
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def cached_get(url, encoding='utf-8', timeout=30):
+    return get_cache().fetch(url, encoding, timeout)
+
+
+def cached_parse(url, parse, encoding='utf-8', timeout=30):
+    return get_cache().fetch_parsed(url, parse, encoding, timeout)
+
+
+def _collect():
+    """导出给 fund_telemetry 的计数（尚未创建缓存时为空）"""
+    cache = _cache
+    if cache is None:
+        return
+    stats = cache.stats()
+    for result in ('hits', 'revalidated', 'misses'):
+        yield 'cache_requests_total', {'result': result}, stats[result]
+
+
+telemetry.register_collector(_collect)
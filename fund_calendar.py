@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+交易日历
+周一至周五为交易日，扣除每年固定的休市日和节假日文件/add_holiday 登记的休市日
+（春节、清明、端午、中秋等农历假期每年日期不同，需由节假日文件补充，默认读数据库同目录下的 holidays.txt）；
+已入库净值的日期只用来确认交易日（登记为休市但有净值的日期仍算交易日），
+不会把没有任何基金有净值的工作日当作节假日，否则所有基金都缺的那天永远查不出缺口
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+import fund_compact
+
+ONE_DAY = timedelta(days=1)
+
+# 每年固定休市的 (月, 日)：元旦、劳动节、国庆
+FIXED_HOLIDAYS = ((1, 1), (5, 1), (10, 1), (10, 2), (10, 3), (10, 4), (10, 5), (10, 6), (10, 7))
+_FIXED = frozenset(FIXED_HOLIDAYS)
+
+HOLIDAYS_FILE = 'holidays.txt'
+
+# 区间不超过这么多天时逐日判断
+SCAN_DAYS = 62
+
+
+def weekdays_between(start, end):
+    """[start, end) 内的周一至周五天数（date 对象）"""
+    days = (end - start).days
+    if days <= 0:
+        return 0
+    weeks, rest = divmod(days, 7)
+    first = start.weekday()
+    return weeks * 5 + sum(1 for i in range(rest) if (first + i) % 7 < 5)
+
+
+class TradingCalendar:
+    """dates 为有净值的日期（'YYYY-MM-DD' 或 date），只用来确认交易日；holidays 为额外休市日（date 对象）"""
+
+    def __init__(self, dates=(), holidays=()):
+        self.trading = {date.fromisoformat(day) if isinstance(day, str) else day for day in dates}
+        self.holidays = set(holidays)
+
+    def __len__(self):
+        return len(self.trading)
+
+    def add_holiday(self, day):
+        self.holidays.add(day)
+
+    def add_trading_day(self, day):
+        """已有净值的日期：即使登记为休市也按交易日算"""
+        self.trading.add(day)
+
+    def _listed(self, day):
+        return day in self.holidays or (day.month, day.day) in _FIXED
+
+    def is_trading_day(self, day):
+        if day.weekday() >= 5:
+            return False
+        return day in self.trading or not self._listed(day)
+
+    def count(self, start, end):
+        """[start, end) 内的交易日数（date 对象）"""
+        if start >= end:
+            return 0
+        if (end - start).days <= SCAN_DAYS:
+            return sum(1 for i in range((end - start).days) if self.is_trading_day(start + timedelta(days=i)))
+        closed = {day for day in self.holidays if start <= day < end}
+        for year in range(start.year, end.year + 1):
+            for month, dom in FIXED_HOLIDAYS:
+                day = date(year, month, dom)
+                if start <= day < end:
+                    closed.add(day)
+        return weekdays_between(start, end) - sum(
+            1 for day in closed if day.weekday() < 5 and day not in self.trading)
+
+    def between(self, a, b):
+        """两个日期之间（不含两端）的交易日数"""
+        if a > b:
+            a, b = b, a
+        return self.count(a + ONE_DAY, b)
+
+    def next_trading_day(self, day):
+        """day 之后（不含）的第一个交易日"""
+        day += ONE_DAY
+        while not self.is_trading_day(day):
+            day += ONE_DAY
+        return day
+
+    def previous_trading_day(self, day):
+        """day 之前（不含）的最后一个交易日"""
+        day -= ONE_DAY
+        while not self.is_trading_day(day):
+            day -= ONE_DAY
+        return day
+
+
+def load_holidays(path):
+    """节假日文件：每行一个 YYYY-MM-DD，# 之后为注释"""
+    holidays = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.add(date.fromisoformat(line))
+    return holidays
+
+
+def load_calendar(db_path, holidays_path=None):
+    """
+    节假日文件（默认数据库同目录下的 holidays.txt，不存在则只按固定休市日）加上 nav_history 中有净值的工作日
+    """
+    if holidays_path is None:
+        holidays_path = os.path.join(os.path.dirname(os.path.abspath(db_path)), HOLIDAYS_FILE)
+        holidays = load_holidays(holidays_path) if os.path.exists(holidays_path) else ()
+    else:
+        holidays = load_holidays(holidays_path)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        has_navs = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = 'nav_history'").fetchone()
+        if not has_navs:
+            return TradingCalendar(holidays=holidays)
+        if fund_compact.is_compact(conn):
+            # 紧凑布局：直接取整数天数，不经视图逐行还原日期字符串
+            days = (fund_compact.from_day(day) for (day,) in conn.execute('SELECT DISTINCT day FROM nav_compact'))
+            return TradingCalendar((day for day in days if day.weekday() < 5), holidays)
+        rows = conn.execute(
+            "SELECT DISTINCT date FROM nav_history WHERE strftime('%w', date) NOT IN ('0', '6') ORDER BY date")
+        return TradingCalendar((day for (day,) in rows), holidays)
+    finally:
+        conn.close()
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+# 进程内缓存的日历过了这么久重新读取（常驻进程能看到新同步的日期和更新过的节假日文件）
+CALENDAR_TTL = 6 * 3600
+
+
+def get_calendar(db_path, refresh=False):
+    """按数据库路径缓存的交易日历，超过 CALENDAR_TTL 或 refresh=True 时重新读取"""
+    with _calendars_lock:
+        cached = _calendars.get(db_path)
+        if cached is None or refresh or time.monotonic() - cached[0] >= CALENDAR_TTL:
+            cached = _calendars[db_path] = (time.monotonic(), load_calendar(db_path))
+        return cached[1]
+
+
+def invalidate_calendar(db_path=None):
+    """丢弃缓存的日历（db_path 为 None 时全部丢弃），下次 get_calendar 重新读取"""
+    with _calendars_lock:
+        if db_path is None:
+            _calendars.clear()
+        else:
+            _calendars.pop(db_path, None)
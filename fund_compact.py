@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+紧凑净值表（nav_compact）
+原 nav_history 每行都存 TEXT 代码和日期、一个没人用的自增 id，外加 UNIQUE(fund_code, date)
+与 idx_nav_fund_date 两份内容相同的索引。紧凑布局：
+    fund_ids       基金代码 ↔ 整数 id
+    nav_compact    (fund_id, day) 为主键的 WITHOUT ROWID 表，按基金、日期聚簇存放，没有额外索引；
+                   day 为自 1970-01-01 起的天数（与 fund_analytics 的天数一致），
+                   净值按 10000 倍、日增长率（百分比）按 100 倍存为整数——只有换算无损的值才这样存，
+                   其余原样存 REAL（整数/REAL 由 typeof 区分，读出时按类型还原）
+迁移后 nav_history 变成同名视图（列与原表一致），只读 nav_history 的脚本无需改动；
+视图上的 INSTEAD OF INSERT 触发器把旧脚本的 INSERT / INSERT OR REPLACE 转成对 nav_compact 的 UPSERT。
+NavStore、fund_metrics、fund_api，以及整表扫描的 fund_analytics、fund_snapshot、fund_calendar、plot_fund_nav
+在紧凑布局下都直接按 nav_compact 主键读取（天数不经日期字符串往返，不逐行 JOIN fund_ids）。
+迁移需在没有同步进程运行时进行
+
+用法:
+    python fund_compact.py status                 # 当前布局、行数、文件大小
+    python fund_compact.py migrate                # 迁移（逐行核对后替换，并 VACUUM）
+    python fund_compact.py migrate --no-vacuum
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+NAV_SCALE = 10000
+RETURN_SCALE = 100
+
+# 1970-01-01 的儒略日 / 序数
+UNIX_EPOCH_JD = 2440587.5
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+BATCH_SIZE = 5000
+
+CREATE_IDS_SQL = '''
+    CREATE TABLE IF NOT EXISTS fund_ids (
+        fund_id INTEGER PRIMARY KEY,
+        fund_code TEXT NOT NULL UNIQUE
+    )
+'''
+
+CREATE_COMPACT_SQL = '''
+    CREATE TABLE IF NOT EXISTS nav_compact (
+        fund_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        nav INTEGER,
+        cumulative_nav INTEGER,
+        daily_return INTEGER,
+        PRIMARY KEY (fund_id, day)
+    ) WITHOUT ROWID
+'''
+
+
+def day_sql(text):
+    """'YYYY-MM-DD' 表达式 → 天数表达式"""
+    return f'CAST(julianday({text}) - {UNIX_EPOCH_JD} AS INTEGER)'
+
+
+def date_sql(day):
+    """天数表达式 → 'YYYY-MM-DD' 表达式"""
+    return f"date({day} * 86400, 'unixepoch')"
+
+
+def decode_sql(column, scale=NAV_SCALE):
+    """按类型还原定点整数"""
+    return f"CASE typeof({column}) WHEN 'integer' THEN {column} / {scale}.0 ELSE {column} END"
+
+
+def encode_sql(value, scale=NAV_SCALE):
+    """与 encode() 相同的换算（触发器中使用）"""
+    return (f'CASE WHEN round({value} * {scale}) / {scale}.0 = {value}'
+            f' THEN CAST(round({value} * {scale}) AS INTEGER) ELSE {value} END')
+
+
+# 与 nav_history 原表列一致的视图
+CREATE_VIEW_SQL = f'''
+    CREATE VIEW IF NOT EXISTS nav_history (fund_code, date, nav_value, cumulative_nav, daily_return) AS
+    SELECT i.fund_code, {date_sql('n.day')}, {decode_sql('n.nav')}, {decode_sql('n.cumulative_nav')},
+        {decode_sql('n.daily_return', RETURN_SCALE)}
+    FROM nav_compact n JOIN fund_ids i ON i.fund_id = n.fund_id
+'''
+
+CREATE_TRIGGER_SQL = f'''
+    CREATE TRIGGER IF NOT EXISTS nav_history_insert INSTEAD OF INSERT ON nav_history
+    BEGIN
+        -- 不用 INSERT OR IGNORE：外层语句的 OR REPLACE 会覆盖触发器内的冲突策略，把已有的 id 换掉
+        INSERT INTO fund_ids (fund_code)
+        SELECT NEW.fund_code WHERE NOT EXISTS (SELECT 1 FROM fund_ids WHERE fund_code = NEW.fund_code);
+        INSERT INTO nav_compact (fund_id, day, nav, cumulative_nav, daily_return)
+        VALUES ((SELECT fund_id FROM fund_ids WHERE fund_code = NEW.fund_code), {day_sql('NEW.date')},
+            {encode_sql('NEW.nav_value')}, {encode_sql('NEW.cumulative_nav')},
+            {encode_sql('NEW.daily_return', RETURN_SCALE)})
+        ON CONFLICT (fund_id, day) DO UPDATE SET
+            nav = excluded.nav, cumulative_nav = excluded.cumulative_nav, daily_return = excluded.daily_return;
+    END
+'''
+
+# 与 fund_store.UPSERT_NAV_SQL 语义一致：数值未变化的行不改写
+UPSERT_SQL = '''
+    INSERT INTO nav_compact (fund_id, day, nav, cumulative_nav, daily_return)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(fund_id, day) DO UPDATE SET
+        nav = excluded.nav,
+        cumulative_nav = excluded.cumulative_nav,
+        daily_return = excluded.daily_return
+    WHERE nav IS NOT excluded.nav
+       OR cumulative_nav IS NOT excluded.cumulative_nav
+       OR daily_return IS NOT excluded.daily_return
+'''
+
+FUND_ID_SQL = 'SELECT fund_id FROM fund_ids WHERE fund_code = ?'
+
+# 按基金的区间读取（主键范围扫描），参数 (fund_code, start, end)
+RANGE_SQL = f'''
+    SELECT {date_sql('day')}, {decode_sql('nav')}, {decode_sql('cumulative_nav')},
+        {decode_sql('daily_return', RETURN_SCALE)}
+    FROM nav_compact
+    WHERE fund_id = (SELECT fund_id FROM fund_ids WHERE fund_code = ?)
+      AND day BETWEEN {day_sql('?')} AND {day_sql('?')}
+    ORDER BY day
+'''
+
+# 有净值的基金代码（每只基金一次主键查找）
+FUND_CODES_SQL = '''
+    SELECT fund_code FROM fund_ids i
+    WHERE EXISTS (SELECT 1 FROM nav_compact n WHERE n.fund_id = i.fund_id)
+    ORDER BY fund_code
+'''
+
+WATERMARK_SQL = f'''
+    SELECT {date_sql('MAX(day)')} FROM nav_compact
+    WHERE fund_id = (SELECT fund_id FROM fund_ids WHERE fund_code = ?)
+'''
+
+
+def is_compact(conn):
+    """数据库是否已迁移为紧凑布局"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'nav_compact'").fetchone() is not None
+
+
+def to_day(text):
+    return date.fromisoformat(text).toordinal() - UNIX_EPOCH_ORDINAL
+
+
+def from_day(day):
+    return date.fromordinal(day + UNIX_EPOCH_ORDINAL)
+
+
+def fund_ids(conn):
+    """{基金代码: 整数 id}"""
+    return dict(conn.execute('SELECT fund_code, fund_id FROM fund_ids'))
+
+
+def encode(value, scale=NAV_SCALE):
+    """能无损换算时返回定点整数，否则原样返回"""
+    if value is None:
+        return None
+    scaled = round(value * scale)
+    return scaled if scaled / scale == value else value
+
+
+def decode(value, scale=NAV_SCALE):
+    return value / scale if type(value) is int else value
+
+
+def encode_rows(fund_id, rows):
+    """(fund_code, date, nav, cumulative_nav, daily_return) 行 → nav_compact 参数"""
+    for _, day, nav, cumulative, daily_return in rows:
+        yield fund_id, to_day(day), encode(nav), encode(cumulative), encode(daily_return, RETURN_SCALE)
+
+
+def fund_id(conn, fund_code):
+    """基金的整数 id，没有则分配（需在写事务内调用）"""
+    row = conn.execute(FUND_ID_SQL, (fund_code,)).fetchone()
+    if row is not None:
+        return row[0]
+    return conn.execute('INSERT INTO fund_ids (fund_code) VALUES (?)', (fund_code,)).lastrowid
+
+
+def _file_size(db_path):
+    return sum(os.path.getsize(p) for p in (db_path, db_path + '-wal') if os.path.exists(p))
+
+
+def migrate(db_path, vacuum=True):
+    """
+    把 nav_history 表迁移为 nav_compact + 同名视图，返回统计
+    先按 (fund_code, date) 顺序整表换算写入（主键顺序追加），再与原表逐行核对，全部一致才删除原表
+    """
+    start = time.monotonic()
+    before = _file_size(db_path)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if is_compact(conn):
+            conn.execute('ROLLBACK')
+            raise RuntimeError('数据库已是紧凑布局')
+        conn.execute(CREATE_IDS_SQL)
+        conn.execute(CREATE_COMPACT_SQL)
+        conn.execute('''
+            INSERT OR IGNORE INTO fund_ids (fund_code)
+            SELECT fund_code FROM (SELECT fund_code FROM funds UNION SELECT DISTINCT fund_code FROM nav_history)
+            ORDER BY fund_code
+        ''')
+        ids = dict(conn.execute('SELECT fund_code, fund_id FROM fund_ids'))
+
+        source = 'SELECT fund_code, date, nav_value, cumulative_nav, daily_return FROM nav_history ORDER BY fund_code, date'
+        rows = 0
+        cursor = conn.execute(source)
+        while True:
+            batch = cursor.fetchmany(BATCH_SIZE)
+            if not batch:
+                break
+            conn.executemany('INSERT INTO nav_compact VALUES (?, ?, ?, ?, ?)',
+                             ((ids[r[0]], to_day(r[1]), encode(r[2]), encode(r[3]), encode(r[4], RETURN_SCALE))
+                              for r in batch))
+            rows += len(batch)
+
+        # 逐行核对：还原后的值与原表完全相等
+        compact = conn.execute(
+            f"SELECT i.fund_code, {date_sql('n.day')}, n.nav, n.cumulative_nav, n.daily_return"
+            f" FROM nav_compact n JOIN fund_ids i ON i.fund_id = n.fund_id ORDER BY i.fund_code, n.day")
+        original = conn.execute(source)
+        checked = 0
+        for old, new in zip(original, compact):
+            restored = (new[0], new[1], decode(new[2]), decode(new[3]), decode(new[4], RETURN_SCALE))
+            if old != restored:
+                raise RuntimeError(f'核对失败: {old} != {restored}')
+            checked += 1
+        if checked != rows:
+            raise RuntimeError(f'核对失败: 写入 {rows} 行，核对 {checked} 行')
+        scaled = conn.execute(
+            "SELECT COUNT(*) FROM nav_compact WHERE typeof(nav) = 'real'"
+            " OR typeof(cumulative_nav) = 'real' OR typeof(daily_return) = 'real'").fetchone()[0]
+
+        conn.execute('DROP TABLE nav_history')
+        conn.execute(CREATE_VIEW_SQL)
+        conn.execute(CREATE_TRIGGER_SQL)
+        conn.execute('COMMIT')
+        if vacuum:
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    return {'rows': rows, 'funds': len(ids), 'unscaled_rows': scaled, 'bytes_before': before,
+            'bytes_after': _file_size(db_path), 'seconds': time.monotonic() - start}
+
+
+def status(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        compact = is_compact(conn)
+        table = 'nav_compact' if compact else 'nav_history'
+        rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+    return {'layout': 'compact' if compact else 'legacy', 'rows': rows,
+            'bytes': page_size * pages, 'free_bytes': page_size * free}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='nav_history 紧凑布局')
+    parser.add_argument('command', choices=['status', 'migrate'])
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--no-vacuum', action='store_true', help='迁移后不 VACUUM（原表空间留在空闲页中）')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        info = status(args.db)
+        print(f"[INFO] 布局 {info['layout']}, {info['rows']} 行, 文件 {info['bytes'] / 1e6:.1f}MB"
+              f"（空闲 {info['free_bytes'] / 1e6:.1f}MB）")
+        return
+    result = migrate(args.db, vacuum=not args.no_vacuum)
+    print(f"[INFO] 已迁移 {result['funds']} 只基金 {result['rows']} 行（{result['unscaled_rows']} 行含无法定点存放的值），"
+          f"{result['bytes_before'] / 1e6:.1f}MB → {result['bytes_after'] / 1e6:.1f}MB，耗时 {result['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+跨基金相关性
+把净值面板对齐成 基金 × 交易日 的日收益矩阵，对最近 window 个交易日维护成对统计量（共同有效天数、收益和、平方和、乘积和），
+由此向量化得到协方差/相关系数矩阵、近似重复基金的聚类、成对跟踪差异（年化收益差与跟踪误差）；
+统计量按窗口缓存，新的一天只加上新列、减去移出窗口的列的外积（O(n²)），不重算 O(n²·window)
+
+用法:
+    python fund_correlation.py --theme 机器人                  # 60 日窗口的近似重复簇与最相关的基金对
+    python fund_correlation.py --window 250 --pairs 30
+    python fund_correlation.py --fund 562500                   # 与该基金最相关的基金及跟踪差异
+    python fund_correlation.py --snapshot /root/.openclaw/workspace/nav_snapshot --cache /root/.openclaw/workspace/nav_corr
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from fund_analytics import DB_PATH, TRADING_DAYS, from_days, load_panel, point_returns
+
+CACHE_DIR = '/root/.openclaw/workspace/nav_corr'
+
+WINDOWS = (20, 60, 250)
+DEFAULT_WINDOW = 60
+
+# 两只基金共同有效的天数少于此值时相关系数记为 NaN
+MIN_OVERLAP = 20
+
+# 相关系数不低于此值视为近似重复（跟踪同一指数的 ETF、联接基金、A/C 份额等）
+DUPLICATE_CORR = 0.98
+
+# 增量更新累积的舍入误差：每推进这么多天从窗口数据重算一次
+REBUILD_EVERY = 250
+
+# 窗口内被改动（补录、修正）的列超过此比例时整体重算，否则逐列替换
+PATCH_RATIO = 0.25
+
+
+def aligned_returns(panel):
+    """
+    NavPanel → (日期轴, 日收益矩阵)；第 j 列为日期轴上第 j 个日期当天的收益
+    每只基金的收益按它自己相邻的两个净值点计算后再放到并集日期轴上（见 fund_analytics.point_returns）：
+    该基金当天没有净值（成立前、停更后、个别缺失日、只有别的基金有净值的日子）为 NaN，不计入成对统计量，
+    也不会让它下一个净值日的收益丢失
+    """
+    axis, mat = panel.matrix(fill=False)
+    return axis[1:], point_returns(mat)[:, 1:]
+
+
+def _outer_sums(cols):
+    """cols（基金 × 天）→ 成对的 (共同有效天数, 收益和, 平方和, 乘积和)，均为矩阵乘法"""
+    valid = ~np.isnan(cols)
+    v = valid.astype(np.float64)
+    r = np.where(valid, cols, 0.0)
+    return v @ v.T, r @ v.T, (r * r) @ v.T, r @ r.T
+
+
+class WindowStats:
+    """
+    最近 window 个交易日的收益（环形缓冲）及其成对统计量：
+        n[i, j]   基金 i、j 都有收益的天数
+        s[i, j]   这些天里基金 i 的收益和（基金 j 的为 s[j, i]）
+        ss[i, j]  这些天里基金 i 的收益平方和
+        sp[i, j]  这些天里两只基金收益乘积之和
+    只统计两只基金都有数据的日子，成立较晚的基金不影响其他基金之间的结果
+    """
+
+    def __init__(self, codes, window):
+        self.codes = np.asarray(codes)
+        self.window = window
+        size = len(self.codes)
+        self.buffer = np.full((size, window), np.nan)
+        self.pos = 0
+        self.filled = 0
+        self.last_day = None
+        self.updates = 0
+        self.n = np.zeros((size, size))
+        self.s = np.zeros((size, size))
+        self.ss = np.zeros((size, size))
+        self.sp = np.zeros((size, size))
+
+    @classmethod
+    def build(cls, codes, days, returns, window):
+        """用收益矩阵最后 window 列一次算出"""
+        stats = cls(codes, window)
+        tail = returns[:, -window:]
+        stats.filled = tail.shape[1]
+        stats.buffer[:, :stats.filled] = tail
+        stats.pos = stats.filled % window
+        stats.last_day = int(days[-1]) if len(days) else None
+        stats._recompute()
+        return stats
+
+    def _recompute(self):
+        self.n, self.s, self.ss, self.sp = _outer_sums(self.buffer[:, :self.filled])
+        self.updates = 0
+
+    def _accumulate(self, col, sign):
+        valid = ~np.isnan(col)
+        v = valid.astype(np.float64)
+        r = np.where(valid, col, 0.0)
+        self.n += sign * np.outer(v, v)
+        self.s += sign * np.outer(r, v)
+        self.ss += sign * np.outer(r * r, v)
+        self.sp += sign * np.outer(r, r)
+
+    def push(self, day, col):
+        """推进一个交易日：col 为各基金当天收益（NaN 为无数据）"""
+        if self.filled == self.window:
+            self._accumulate(self.buffer[:, self.pos], -1)
+        else:
+            self.filled += 1
+        self.buffer[:, self.pos] = col
+        self._accumulate(col, 1)
+        self.pos = (self.pos + 1) % self.window
+        self.last_day = int(day)
+        self.updates += 1
+        if self.updates >= REBUILD_EVERY:
+            self._recompute()
+
+    def replace(self, offset, col):
+        """替换窗口内按时间顺序第 offset 列（补录或修正的历史数据）"""
+        slot = (self.pos - self.filled + offset) % self.window
+        self._accumulate(self.buffer[:, slot], -1)
+        self.buffer[:, slot] = col
+        self._accumulate(col, 1)
+        self.updates += 1
+
+    def columns(self):
+        """窗口内的收益，按时间顺序"""
+        if self.filled < self.window:
+            return self.buffer[:, :self.filled]
+        return np.roll(self.buffer, -self.pos, axis=1)
+
+    def _variances(self):
+        """成对的 (基金 i 的方差, 协方差)，只用两只基金都有数据的日子"""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (self.ss - self.s * self.s / n) / (n - 1)
+            cov = (self.sp - self.s * self.s.T / n) / (n - 1)
+        enough = n >= MIN_OVERLAP
+        return np.where(enough, np.maximum(var, 0.0), np.nan), np.where(enough, cov, np.nan)
+
+    def covariance(self):
+        """日收益协方差矩阵"""
+        return self._variances()[1]
+
+    def correlation(self):
+        """相关系数矩阵，共同有效天数不足 MIN_OVERLAP 或一方无波动时为 NaN"""
+        var, cov = self._variances()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cov / np.sqrt(var * var.T)
+        corr = np.clip(np.where(np.isfinite(corr), corr, np.nan), -1.0, 1.0)
+        diag = np.diagonal(corr).copy()
+        np.fill_diagonal(corr, np.where(np.isnan(diag), np.nan, 1.0))
+        return corr
+
+    def tracking(self, trading_days=TRADING_DAYS):
+        """
+        成对跟踪差异，返回 (年化收益差, 年化跟踪误差)：
+        gap[i, j] 为基金 i 相对基金 j 的日均收益差 × trading_days，te[i, j] 为两者日收益差的标准差年化
+        """
+        var, cov = self._variances()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.s / self.n
+        gap = np.where(self.n >= MIN_OVERLAP, (mean - mean.T) * trading_days, np.nan)
+        te = np.sqrt(np.maximum(var + var.T - 2 * cov, 0.0) * trading_days)
+        return gap, te
+
+    def save(self, path):
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, codes=self.codes, buffer=self.buffer, n=self.n, s=self.s, ss=self.ss, sp=self.sp,
+                 state=np.array([self.window, self.pos, self.filled,
+                                 -1 if self.last_day is None else self.last_day, self.updates]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            window, pos, filled, last_day, updates = (int(x) for x in data['state'])
+            stats = cls(data['codes'], window)
+            stats.buffer = data['buffer']
+            stats.n, stats.s, stats.ss, stats.sp = data['n'], data['s'], data['ss'], data['sp']
+        stats.pos, stats.filled, stats.updates = pos, filled, updates
+        stats.last_day = None if last_day < 0 else last_day
+        return stats
+
+
+def advance(stats, codes, days, returns, window):
+    """
+    把 stats 推进到收益矩阵的最后一天，返回 (stats, 动作)：
+    基金集合变化、断档或新增天数超过窗口时整体重算（'built'）；否则先替换被改动的窗口内历史列，再逐日 push（'advanced'）
+    """
+    if stats is None or stats.window != window or not np.array_equal(stats.codes, codes) \
+            or stats.last_day is None:
+        return WindowStats.build(codes, days, returns, window), 'built'
+    end = int(np.searchsorted(days, stats.last_day, side='right'))
+    if end == 0 or days[end - 1] != stats.last_day or end < stats.filled or len(days) - end >= window:
+        return WindowStats.build(codes, days, returns, window), 'built'
+
+    old = stats.columns()
+    new = returns[:, end - stats.filled:end]
+    same = (old == new) | (np.isnan(old) & np.isnan(new))
+    changed = np.flatnonzero(~same.all(axis=0))
+    if len(changed) > window * PATCH_RATIO:
+        return WindowStats.build(codes, days, returns, window), 'built'
+    for offset in changed:
+        stats.replace(offset, new[:, offset])
+    for j in range(end, len(days)):
+        stats.push(days[j], returns[:, j])
+    if not len(changed) and end == len(days):
+        return stats, 'unchanged'
+    return stats, 'advanced'
+
+
+def iter_windows(codes, days, returns, window):
+    """逐日滚动：窗口填满后每推进一天产出一次 (日期, WindowStats)，用于历史上的滚动相关矩阵"""
+    stats = WindowStats(codes, window)
+    for j in range(len(days)):
+        stats.push(days[j], returns[:, j])
+        if stats.filled == window:
+            yield int(days[j]), stats
+
+
+class CorrelationEngine:
+    """按窗口缓存 WindowStats；cache_dir 非空时在进程之间保存（每个窗口一个 w<window>.npz）"""
+
+    def __init__(self, windows=WINDOWS, cache_dir=None):
+        self.windows = tuple(windows)
+        self.cache_dir = cache_dir
+        self.stats = {}
+
+    def _path(self, window):
+        return os.path.join(self.cache_dir, f'w{window}.npz')
+
+    def _cached(self, window):
+        if window in self.stats:
+            return self.stats[window]
+        if self.cache_dir and os.path.exists(self._path(window)):
+            try:
+                return WindowStats.load(self._path(window))
+            except (OSError, ValueError, KeyError):
+                return None
+        return None
+
+    def refresh(self, panel):
+        """用最新面板推进各窗口，返回 {窗口: 动作}"""
+        days, returns = aligned_returns(panel)
+        actions = {}
+        for window in self.windows:
+            stats, action = advance(self._cached(window), panel.codes, days, returns, window)
+            self.stats[window] = stats
+            actions[window] = action
+            if self.cache_dir and action != 'unchanged':
+                os.makedirs(self.cache_dir, exist_ok=True)
+                stats.save(self._path(window))
+        return actions
+
+    def __getitem__(self, window):
+        return self.stats[window]
+
+
+def duplicate_clusters(corr, threshold=DUPLICATE_CORR):
+    """
+    相关系数不低于 threshold 的基金连通成簇（向量化标签传播 + 指针跳跃），
+    返回只含 2 只以上基金的簇（下标数组），按大小降序
+    """
+    size = corr.shape[0]
+    if not size:
+        return []
+    adj = np.nan_to_num(corr, nan=-1.0) >= threshold
+    np.fill_diagonal(adj, True)
+    labels = np.arange(size)
+    while True:
+        new = np.where(adj, labels[None, :], size).min(axis=1)
+        new = new[new]
+        if np.array_equal(new, labels):
+            break
+        labels = new
+    order = np.argsort(labels, kind='stable')
+    _, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    clusters = [order[start:start + count] for start, count in zip(starts, counts) if count > 1]
+    return sorted(clusters, key=len, reverse=True)
+
+
+def top_pairs(corr, n=20, members=None):
+    """相关系数最高的 n 对基金 [(i, j, corr)]，members 非空时只在这些下标之间找"""
+    idx = np.arange(corr.shape[0]) if members is None else np.asarray(members)
+    sub = corr[np.ix_(idx, idx)]
+    iu, ju = np.triu_indices(len(idx), k=1)
+    values = np.nan_to_num(sub[iu, ju], nan=-np.inf)
+    if not len(values):
+        return []
+    take = min(n, len(values))
+    best = np.argpartition(-values, take - 1)[:take]
+    best = best[np.argsort(-values[best])]
+    return [(int(idx[iu[k]]), int(idx[ju[k]]), float(values[k])) for k in best if np.isfinite(values[k])]
+
+
+def theme_codes(db_path, theme):
+    from fund_universe import iter_universe
+    return [fund['code'] for fund in iter_universe(db_path, theme=theme)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='跨基金相关性与近似重复基金')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--snapshot', help='从列式快照目录读取（见 fund_snapshot）')
+    parser.add_argument('--cache', nargs='?', const=CACHE_DIR, help=f'窗口统计量缓存目录（默认 {CACHE_DIR}）')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='滚动窗口（交易日）')
+    parser.add_argument('--theme', help='只输出该主题的基金')
+    parser.add_argument('--fund', help='输出与该基金最相关的基金')
+    parser.add_argument('--pairs', type=int, default=20, help='输出最相关的基金对数')
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_CORR, help='近似重复的相关系数阈值')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    if args.snapshot:
+        from fund_snapshot import open_snapshot
+        snapshot = open_snapshot(args.snapshot)
+        if snapshot is None:
+            print('[WARN] 快照不存在，先运行 fund_snapshot.py refresh')
+            return
+        panel = snapshot.panel()
+    else:
+        panel = load_panel(args.db)
+    if not len(panel):
+        print('[WARN] 没有净值数据')
+        return
+    loaded = time.monotonic()
+    engine = CorrelationEngine([args.window], args.cache)
+    action = engine.refresh(panel)[args.window]
+    stats = engine[args.window]
+    corr = stats.correlation()
+    gap, te = stats.tracking()
+    print(f"[INFO] {len(panel)} 只基金, 窗口 {args.window} 日截至 {from_days([stats.last_day])[0]}, "
+          f"读取 {loaded - start:.2f}s, 统计量 {action} {time.monotonic() - loaded:.2f}s")
+
+    codes = stats.codes
+    members = None
+    if args.theme:
+        members = np.flatnonzero(np.isin(codes, theme_codes(args.db, args.theme)))
+        if not len(members):
+            print(f'[WARN] 主题 {args.theme} 没有净值数据')
+            return
+
+    if args.fund:
+        i = int(np.searchsorted(codes, args.fund))
+        if i >= len(codes) or codes[i] != args.fund:
+            print(f'[WARN] {args.fund} 没有净值数据')
+            return
+        peers = np.arange(len(codes)) if members is None else members
+        peers = peers[(peers != i) & ~np.isnan(corr[i, peers])]
+        peers = peers[np.argsort(-corr[i, peers])][:args.pairs]
+        print(f"{'代码':<8}{'相关系数':>10}{'年化收益差':>12}{'跟踪误差':>10}")
+        for j in peers:
+            print(f"{codes[j]:<8}{corr[i, j]:>10.4f}{gap[i, j]:>+12.2%}{te[i, j]:>10.2%}")
+        return
+
+    sub = corr if members is None else corr[np.ix_(members, members)]
+    clusters = duplicate_clusters(sub, args.threshold)
+    print(f"[INFO] 相关系数 ≥ {args.threshold} 的近似重复簇 {len(clusters)} 个")
+    for cluster in clusters:
+        idx = cluster if members is None else members[cluster]
+        inner = corr[np.ix_(idx, idx)][np.triu_indices(len(idx), k=1)]
+        print(f"  {len(idx)} 只, 簇内相关系数 {np.nanmin(inner):.4f} ~ {np.nanmax(inner):.4f}: "
+              f"{' '.join(codes[idx])}")
+    print(f"{'基金对':<16}{'相关系数':>10}{'年化收益差':>12}{'跟踪误差':>10}")
+    for i, j, value in top_pairs(corr, args.pairs, members):
+        print(f"{codes[i]}-{codes[j]:<9}{value:>10.4f}{gap[i, j]:>+12.2%}{te[i, j]:>10.2%}")
+
+
+if __name__ == '__main__':
+    main()
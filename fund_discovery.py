@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+基金发现
+一次下载东方财富全量基金代码表（fundcode_search.js），边下载边解析，
+按名称关键词打主题标签；对还没有基金公司信息的基金抓取基本概况页（jbgk）补全基金管理人、基金经理，
+最后在一个事务内批量写入 funds 表（表不存在时先建表）
+
+用法:
+    python fund_discovery.py                      # 在线抓取（默认只给命中主题的新基金补全详情）
+    python fund_discovery.py --from-file r.js     # 使用录制好的响应离线导入
+    python fund_discovery.py --tagged-only        # 只导入命中主题关键词的基金
+    python fund_discovery.py --details all        # 给所有缺少详情的基金补全（请求数与基金数相当）
+"""
+
+import argparse
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fund_cache import cached_parse
+from fund_http import http_stream
+from fund_retry import classify
+from fund_store import get_store
+from fund_universe import ensure_table, upsert_funds
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+FUNDCODE_URL = 'http://fund.eastmoney.com/js/fundcode_search.js'
+
+# var r = [["000001","HXCZHH","华夏成长混合","混合型-偏股","HUAXIACHENGZHANGHUNHE"],...];
+ENTRY_RE = re.compile(r'\["(\d{6})","[^"]*","([^"]*)","([^"]*)","[^"]*"\]')
+
+# 基本概况页：<th>基金管理人</th><td><a href="...">华夏基金</a></td>
+DETAIL_URL = 'http://fundf10.eastmoney.com/jbgk_{code}.html'
+DETAIL_FIELDS = {'company': '基金管理人', 'manager': '基金经理人'}
+TAG_RE = re.compile(r'<[^>]+>')
+
+# 补全详情的范围：none 不抓，tagged 只抓命中主题的基金，all 全部；都只抓库中还没有基金公司的基金
+DETAIL_MODES = ('none', 'tagged', 'all')
+DETAIL_WORKERS = 4
+
+# 单条记录的最大长度，缓冲区里超过这个长度仍未匹配的前缀可以丢弃
+MAX_ENTRY_LEN = 512
+
+# 主题关键词，按顺序匹配，先命中者为准
+THEME_KEYWORDS = [
+    ('机器人', ('机器人',)),
+    ('人工智能', ('人工智能', 'AI')),
+    ('半导体', ('半导体', '芯片', '集成电路')),
+    ('新能源', ('新能源', '光伏', '电池', '碳中和')),
+    ('医药', ('医药', '医疗', '生物', '创新药')),
+    ('消费', ('消费', '食品', '白酒')),
+    ('军工', ('军工', '国防')),
+    ('高端制造', ('先进制造', '高端装备', '智能制造', '高端制造')),
+]
+
+OTHER_THEME = '其他'
+
+
+def tag_theme(name):
+    """按名称关键词返回主题，未命中返回 None"""
+    for theme, keywords in THEME_KEYWORDS:
+        for keyword in keywords:
+            if keyword in name:
+                return theme
+    return None
+
+
+def iter_fund_entries(chunks):
+    """从文本块流中逐条解析 (code, name, type)，只保留一条记录长度的尾部缓冲"""
+    buf = ''
+    for chunk in chunks:
+        buf += chunk
+        end = 0
+        for match in ENTRY_RE.finditer(buf):
+            yield match.group(1), match.group(2), match.group(3)
+            end = match.end()
+        if end:
+            buf = buf[end:]
+        elif len(buf) > MAX_ENTRY_LEN:
+            buf = buf[-MAX_ENTRY_LEN:]
+
+
+def iter_discovered_funds(chunks, tagged_only=False):
+    """把代码表条目转成 funds 行，已有基金未命中主题时保留原主题"""
+    for code, name, fund_type in iter_fund_entries(chunks):
+        theme = tag_theme(name)
+        if tagged_only and theme is None:
+            continue
+        yield {'code': code, 'name': name, 'type': fund_type,
+               'theme': theme, 'default_theme': OTHER_THEME}
+
+
+def parse_fund_details(html):
+    """基本概况页 → {'company': ..., 'manager': ...}，页面上没有的字段不出现"""
+    details = {}
+    for key, label in DETAIL_FIELDS.items():
+        match = re.search(rf'<th>{label}</th>\s*<td[^>]*>(.*?)</td>', html, re.S)
+        if match:
+            value = ' '.join(TAG_RE.sub('', match.group(1)).split())
+            if value:
+                details[key] = value
+    return details
+
+
+def fetch_fund_details(code):
+    return cached_parse(DETAIL_URL.format(code=code), parse_fund_details)
+
+
+def fill_details(funds, workers=DETAIL_WORKERS):
+    """并发抓取详情并就地合入，返回 (成功数, 失败数)；失败的基金照常写入，只是没有详情"""
+    def fetch(fund):
+        try:
+            return fetch_fund_details(fund['code']), None
+        except Exception as e:
+            return None, e
+
+    filled = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='discovery') as pool:
+        for fund, (details, error) in zip(funds, pool.map(fetch, funds)):
+            if error is not None:
+                failed += 1
+                print(f"[WARN] {fund['code']} 详情抓取失败({classify(error)}): {error}")
+                continue
+            fund.update(details)
+            filled += 1
+    return filled, failed
+
+
+def read_file_chunks(path, chunk_size=64 * 1024):
+    with open(path, encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def discover(db_path=DB_PATH, from_file=None, tagged_only=False, details='tagged'):
+    """执行一次发现，返回 (解析条数, 实际变化行数)"""
+    chunks = read_file_chunks(from_file) if from_file else http_stream(FUNDCODE_URL)
+    # 先完整下载解析、抓详情（不在此期间占用写锁），再一个事务批量写入
+    funds = list(iter_discovered_funds(chunks, tagged_only))
+    store = get_store(db_path)
+    with store.transaction() as conn:
+        ensure_table(conn)
+        known = {code for code, in conn.execute("SELECT fund_code FROM funds WHERE COALESCE(fund_company, '') != ''")}
+    if details != 'none':
+        missing = [fund for fund in funds if fund['code'] not in known
+                   and (details == 'all' or fund['theme'] is not None)]
+        if missing:
+            filled, failed = fill_details(missing)
+            print(f"[INFO] 补全详情 {filled} 只，失败 {failed} 只")
+    with store.transaction() as conn:
+        changed = upsert_funds(conn, funds)
+    return len(funds), changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从东方财富基金代码表发现基金并写入 funds 表')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--from-file', help='使用录制好的 fundcode_search.js 响应')
+    parser.add_argument('--tagged-only', action='store_true', help='只导入命中主题关键词的基金')
+    parser.add_argument('--details', choices=DETAIL_MODES, default='tagged',
+                        help='给库中没有基金公司信息的基金抓取基本概况页（默认只抓命中主题的）')
+    args = parser.parse_args()
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 开始发现基金: {args.from_file or FUNDCODE_URL}")
+    total, changed = discover(args.db, args.from_file, args.tagged_only, args.details)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ 解析 {total} 只基金，funds 表变化 {changed} 行")
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+并发抓取引擎
+用有界线程池同时处理多只基金，请求速率由 fund_http 的主机限速器控制
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+MAX_WORKERS = 8
+
+
+def run_concurrent(items, worker, max_workers=MAX_WORKERS, on_done=None, max_pending=None):
+    """
+    并发执行 worker(index, item)
+    items 可以是任意可迭代对象，按需提交，最多同时挂起 max_pending（默认 max_workers*2）个任务；
+    取 item 有副作用（如领取任务租约）时传 max_pending=max_workers，只在有空闲线程时才取下一个；
+    每个任务完成后回调 on_done(index, item, result, error)
+    返回 {index: result}
+    """
+    results = {}
+    pending = {}
+    iterator = iter(enumerate(items))
+    exhausted = False
+    max_pending = max_pending or max_workers * 2
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    index, item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(worker, index, item)] = (index, item)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = pending.pop(future)
+                error = future.exception()
+                result = None if error else future.result()
+                if not error:
+                    results[index] = result
+                if on_done:
+                    on_done(index, item, result, error)
+
+    return results
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+HTTP 访问层
+按主机限速（令牌桶 + 最大并发），每个主机复用一个带连接池的 Session（keep-alive + gzip），
+经 fund_retry 做退避重试与熔断，所有抓取函数统一经由 http_get 发请求；
+每次请求的耗时、限速等待、状态与字节数记入 fund_telemetry
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import fund_telemetry as telemetry
+from fund_retry import call_with_retry, classify
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# 各主机限速配置: rate=每秒请求数, burst=令牌桶容量, max_in_flight=最大并发
+HOST_LIMITS = {
+    'fund.eastmoney.com': {'rate': 5.0, 'burst': 5, 'max_in_flight': 4},
+    'stock.finance.sina.com.cn': {'rate': 2.0, 'burst': 2, 'max_in_flight': 2},
+}
+
+DEFAULT_LIMIT = {'rate': 2.0, 'burst': 2, 'max_in_flight': 2}
+
+
+class HostLimiter:
+    """单个主机的限速器：令牌桶控制速率，信号量控制并发"""
+
+    def __init__(self, rate, burst=1, max_in_flight=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+    def _take_token(self):
+        """取一个令牌，返回需要等待的秒数（0 表示已取到）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        self._in_flight.acquire()
+        while True:
+            wait = self._take_token()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def release(self):
+        self._in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_limiters = {}
+_sessions = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_host(host, rate=None, burst=None, max_in_flight=None):
+    """修改某主机的限速配置（需在发请求前调用）"""
+    limit = dict(HOST_LIMITS.get(host, DEFAULT_LIMIT))
+    if rate is not None:
+        limit['rate'] = rate
+    if burst is not None:
+        limit['burst'] = burst
+    if max_in_flight is not None:
+        limit['max_in_flight'] = max_in_flight
+    HOST_LIMITS[host] = limit
+    with _limiters_lock:
+        _limiters.pop(host, None)
+        session = _sessions.pop(host, None)
+    if session is not None:
+        session.close()
+
+
+def get_limiter(host):
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limit = HOST_LIMITS.get(host, DEFAULT_LIMIT)
+            limiter = HostLimiter(limit['rate'], limit['burst'], limit['max_in_flight'])
+            _limiters[host] = limiter
+        return limiter
+
+
+def get_session(host):
+    """取得主机对应的 Session，连接池大小与该主机的最大并发一致"""
+    with _limiters_lock:
+        session = _sessions.get(host)
+        if session is None:
+            pool_size = HOST_LIMITS.get(host, DEFAULT_LIMIT)['max_in_flight']
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+def connection_stats():
+    """各主机的连接复用统计: {host: {'requests', 'connections', 'reused'}}"""
+    stats = {}
+    with _limiters_lock:
+        sessions = list(_sessions.items())
+    for host, session in sessions:
+        item = {'requests': 0, 'connections': 0, 'reused': 0}
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                item['requests'] += pool.num_requests
+                item['connections'] += pool.num_connections
+        item['reused'] = max(0, item['requests'] - item['connections'])
+        stats[host] = item
+    return stats
+
+
+def format_connection_stats():
+    lines = []
+    for host, item in sorted(connection_stats().items()):
+        lines.append(f"{host}: 请求 {item['requests']} 次, 新建连接 {item['connections']} 个, 复用 {item['reused']} 次")
+    return lines
+
+
+def _wire_bytes(resp):
+    """线上字节数（gzip 解压前），取不到时退回正文长度"""
+    try:
+        return resp.raw.tell()
+    except Exception:
+        return len(resp.content)
+
+
+def _record_attempt(host, queued, started, status):
+    telemetry.observe('http_wait_seconds', started - queued, host=host)
+    telemetry.observe('http_request_seconds', time.monotonic() - started, host=host)
+    telemetry.inc('http_requests_total', host=host, status=status)
+
+
+def _is_retryable_status(status):
+    return status == 429 or status >= 500
+
+
+def http_request(url, encoding='utf-8', timeout=30, headers=None, policy=None):
+    """
+    限速后经连接池发起 GET 请求，返回 Response（供需要状态码/响应头的调用方使用）
+    超时、连接错误、429、5xx 按重试策略退避重试；其余 4xx 原样返回
+    """
+    host = urlsplit(url).hostname
+    session = get_session(host)
+
+    def attempt():
+        queued = time.monotonic()
+        with get_limiter(host):
+            started = time.monotonic()
+            try:
+                resp = session.get(url, headers=headers, timeout=timeout)
+            except Exception as e:
+                _record_attempt(host, queued, started, classify(e))
+                raise
+        _record_attempt(host, queued, started, resp.status_code)
+        telemetry.inc('http_bytes_total', _wire_bytes(resp), host=host)
+        if _is_retryable_status(resp.status_code):
+            resp.close()
+            resp.raise_for_status()
+        return resp
+
+    resp = call_with_retry(host, attempt, policy)
+    resp.encoding = encoding
+    return resp
+
+
+def http_get(url, encoding='utf-8', timeout=30, headers=None):
+    """限速后经连接池发起 GET 请求，返回解码后的文本"""
+    return http_request(url, encoding, timeout, headers).text
+
+
+def http_stream(url, encoding='utf-8', timeout=60, chunk_size=64 * 1024, headers=None, policy=None):
+    """
+    限速后流式下载，逐块产出解码后的文本（大文件不整体驻留内存）
+    只重试建立连接与响应头阶段，开始产出后中断的下载直接抛出
+    """
+    host = urlsplit(url).hostname
+    session = get_session(host)
+    limiter = get_limiter(host)
+
+    def attempt():
+        queued = time.monotonic()
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            resp = session.get(url, headers=headers, timeout=timeout, stream=True)
+        except Exception as e:
+            limiter.release()
+            _record_attempt(host, queued, started, classify(e))
+            raise
+        # 流式下载只计到响应头到达
+        _record_attempt(host, queued, started, resp.status_code)
+        try:
+            resp.raise_for_status()
+        except Exception:
+            resp.close()
+            limiter.release()
+            raise
+        return resp
+
+    resp = call_with_retry(host, attempt, policy)
+    try:
+        resp.encoding = encoding
+        for chunk in resp.iter_content(chunk_size=chunk_size, decode_unicode=True):
+            if chunk:
+                yield chunk
+    finally:
+        telemetry.inc('http_bytes_total', _wire_bytes(resp), host=host)
+        resp.close()
+        limiter.release()
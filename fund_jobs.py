@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+按基金的同步任务表
+每只基金每种模式（full / incremental）一行：状态、水位线、已写到的页与日期、尝试次数、租约；
+多个进程/线程用原子的 claim 领取任务，进程崩溃后租约到期的任务可被重新领取，
+已完成的基金在本轮内不会重做；一轮全部结束后下次 plan 开始新一轮。
+任务所属分片在 plan 时算好存入 shard/num_shards 列并建索引，领取是一次索引查找，不对每行调用 Python 函数
+"""
+
+import os
+import socket
+import time
+
+from fund_universe import shard_of
+
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+CREATE_JOBS_SQL = '''
+    CREATE TABLE IF NOT EXISTS sync_jobs (
+        mode TEXT NOT NULL,
+        fund_code TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        watermark TEXT,
+        last_page INTEGER NOT NULL DEFAULT 0,
+        resume_date TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        lease_expires REAL,
+        last_error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        shard INTEGER,
+        num_shards INTEGER,
+        PRIMARY KEY (mode, fund_code)
+    ) WITHOUT ROWID
+'''
+
+# 只在本分片内（plan 时按本次的分片数写入）
+SHARD_FILTER = 'mode = :mode AND num_shards = :num_shards AND shard = :shard'
+
+# 可领取：待处理（按索引顺序取第一个），其次是租约已过期的运行中任务（持有者已崩溃，这类任务很少）
+CLAIM_PENDING_SQL = f'''
+    SELECT fund_code FROM sync_jobs INDEXED BY idx_sync_jobs_claim
+    WHERE {SHARD_FILTER} AND status = 'pending' AND attempts < :max_attempts
+    ORDER BY fund_code LIMIT 1
+'''
+CLAIM_EXPIRED_SQL = f'''
+    SELECT fund_code FROM sync_jobs INDEXED BY idx_sync_jobs_claim
+    WHERE {SHARD_FILTER} AND status = 'running' AND lease_expires < :now AND attempts < :max_attempts
+    ORDER BY fund_code LIMIT 1
+'''
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobQueue:
+    """
+    基于 NavStore 连接的任务队列，写操作都在 store.transaction() 内完成
+    resume_date 为全量同步已连续写入的最早日期，续传时只抓这之前的数据
+    """
+
+    def __init__(self, store, mode, shard=0, num_shards=1, lease_seconds=LEASE_SECONDS,
+                 max_attempts=MAX_ATTEMPTS, worker=None):
+        self.store = store
+        self.mode = mode
+        self.shard = shard
+        self.num_shards = num_shards
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker = worker or worker_id()
+        with store.transaction() as conn:
+            conn.execute(CREATE_JOBS_SQL)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(sync_jobs)')}
+            for column in ('shard', 'num_shards'):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE sync_jobs ADD COLUMN {column} INTEGER')
+            conn.execute('DROP INDEX IF EXISTS idx_sync_jobs_status')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sync_jobs_claim'
+                         ' ON sync_jobs(mode, num_shards, shard, status, fund_code)')
+
+    def _params(self, **extra):
+        params = {'mode': self.mode, 'shard': self.shard, 'num_shards': self.num_shards,
+                  'max_attempts': self.max_attempts, 'now': time.time()}
+        params.update(extra)
+        return params
+
+    def plan(self, fund_codes):
+        """
+        登记本分片的基金；上一轮还有未完成的任务时续跑，否则重置为新一轮
+        返回 True 表示续跑
+        """
+        assignments = [(self.mode, code, shard_of(code, self.num_shards), self.num_shards) for code in fund_codes]
+        with self.store.transaction() as conn:
+            # 分片数与上次不同时把已有任务改记到本次的分片
+            conn.executemany(
+                'UPDATE sync_jobs SET shard = ?3, num_shards = ?4 WHERE mode = ?1 AND fund_code = ?2'
+                ' AND (shard IS NOT ?3 OR num_shards IS NOT ?4)', assignments)
+            unfinished = conn.execute(
+                f"SELECT 1 FROM sync_jobs WHERE {SHARD_FILTER}"
+                f" AND status IN ('pending', 'running') LIMIT 1", self._params()).fetchone()
+            if not unfinished:
+                conn.execute(f'''
+                    UPDATE sync_jobs SET status = 'pending', attempts = 0, last_page = 0, resume_date = NULL,
+                        worker = NULL, lease_expires = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE {SHARD_FILTER}
+                ''', self._params())
+            # 新加入基金池的基金直接进入本轮
+            conn.executemany('INSERT OR IGNORE INTO sync_jobs (mode, fund_code, shard, num_shards)'
+                             ' VALUES (?, ?, ?, ?)', assignments)
+            return bool(unfinished)
+
+    def claim(self):
+        """原子地领取一个任务，返回任务 dict，没有可领取的任务返回 None"""
+        params = self._params(worker=self.worker, lease=time.time() + self.lease_seconds)
+        with self.store.transaction() as conn:
+            # 持有者崩溃且已用尽尝试次数的任务直接记为失败，不再阻塞本轮结束
+            conn.execute(f'''
+                UPDATE sync_jobs SET status = 'failed', last_error = '租约过期', updated_at = CURRENT_TIMESTAMP
+                WHERE {SHARD_FILTER} AND status = 'running'
+                  AND lease_expires < :now AND attempts >= :max_attempts
+            ''', params)
+            found = (conn.execute(CLAIM_PENDING_SQL, params).fetchone()
+                     or conn.execute(CLAIM_EXPIRED_SQL, params).fetchone())
+            if found is None:
+                return None
+            row = conn.execute('''
+                UPDATE sync_jobs SET status = 'running', worker = :worker, lease_expires = :lease,
+                    attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE mode = :mode AND fund_code = :code
+                RETURNING fund_code, watermark, last_page, resume_date, attempts
+            ''', dict(params, code=found[0])).fetchone()
+            name = conn.execute('SELECT fund_name FROM funds WHERE fund_code = ?', (row[0],)).fetchone()
+        return {'code': row[0], 'name': name[0] if name else row[0], 'watermark': row[1],
+                'last_page': row[2], 'resume_date': row[3], 'attempts': row[4]}
+
+    def iter_claims(self):
+        """不断领取任务直到没有可领取的任务（供 run_concurrent 惰性消费）"""
+        while True:
+            job = self.claim()
+            if job is None:
+                return
+            yield job
+
+    def _update(self, job, sql, **params):
+        """只更新仍由本 worker 持有的任务，返回是否成功（租约被别人接手时为 False）"""
+        with self.store.transaction() as conn:
+            cursor = conn.execute(f'''
+                UPDATE sync_jobs SET {sql}, updated_at = CURRENT_TIMESTAMP
+                WHERE mode = :mode AND fund_code = :code AND worker = :worker AND status = 'running'
+            ''', dict(params, mode=self.mode, code=job['code'], worker=self.worker))
+            return cursor.rowcount == 1
+
+    def renew(self, job):
+        """续租（开始处理前调用），任务已被别人接手时返回 False"""
+        return self._update(job, 'lease_expires = :lease', lease=time.time() + self.lease_seconds)
+
+    def checkpoint(self, job, last_page, resume_date=None):
+        """记录已写入的进度并续租"""
+        return self._update(job, 'last_page = :page, resume_date = COALESCE(:resume, resume_date),'
+                                 ' lease_expires = :lease',
+                            page=last_page, resume=resume_date, lease=time.time() + self.lease_seconds)
+
+    def complete(self, job, watermark=None):
+        return self._update(job, "status = 'done', watermark = COALESCE(:watermark, watermark),"
+                                 " lease_expires = NULL, last_error = NULL", watermark=watermark)
+
+    def fail(self, job, error):
+        """记录失败；未超过最大尝试次数时放回待处理"""
+        return self._update(job, "status = CASE WHEN attempts < :max_attempts THEN 'pending' ELSE 'failed' END,"
+                                 " lease_expires = NULL, last_error = :error",
+                            max_attempts=self.max_attempts, error=str(error)[:500])
+
+    def stats(self):
+        """本分片各状态的任务数"""
+        with self.store.transaction() as conn:
+            rows = conn.execute(
+                f'SELECT status, COUNT(*) FROM sync_jobs WHERE {SHARD_FILTER} GROUP BY status',
+                self._params()).fetchall()
+        return dict(rows)
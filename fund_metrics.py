@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+基金指标表（fund_metrics）
+每只基金一行：最新净值、区间收益、历史最高净值、最大回撤、日收益的 Welford 累加量（算波动率）；
+由 NavStore 在写入净值的同一事务内增量维护——新行都在已有最新日期之后时只对新行做折叠，
+向前补历史或旧行数值被改写时才对该基金整段重算；
+version 是全库递增的变更序号，读端（fund_api）据此只失效有新数据的基金；
+区间收益列都有索引，"近一年收益前 20" 之类的查询是一次索引扫描
+
+用法:
+    python fund_metrics.py rebuild                     # 从 nav_history 全量重建
+    python fund_metrics.py top --by return_1y -n 20    # 排行
+"""
+
+import argparse
+import math
+import sqlite3
+from datetime import date
+
+import fund_compact
+from fund_compact import date_sql, day_sql, decode_sql
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+TRADING_DAYS = 252
+RISK_FREE_RATE = 0.02
+
+# 与 fund_analytics.NAV_EXPR 口径一致：累计净值优先，缺失时用单位净值
+NAV_EXPR = 'COALESCE(cumulative_nav, nav_value)'
+
+# 区间收益列 → 基准日（最新净值日期往前推，取该日及之前最近的净值；基金成立不足该区间为 NULL）
+PERIODS = {
+    'return_1m': "date(:last_date, '-1 month')",
+    'return_3m': "date(:last_date, '-3 months')",
+    'return_6m': "date(:last_date, '-6 months')",
+    'return_1y': "date(:last_date, '-1 year')",
+    'return_3y': "date(:last_date, '-3 years')",
+    'return_ytd': "date(:last_date, 'start of year', '-1 day')",
+}
+
+# 可排行（有索引）的列
+RANK_COLUMNS = list(PERIODS) + ['cumulative_return', 'annualized_return', 'volatility', 'sharpe', 'max_drawdown']
+
+# 折叠状态，增量更新只依赖这些列
+STATE_COLUMNS = ['first_date', 'first_nav', 'last_date', 'last_nav', 'nav_count', 'peak_nav',
+                 'max_drawdown', 'ret_count', 'ret_mean', 'ret_m2']
+
+CREATE_METRICS_SQL = f'''
+    CREATE TABLE IF NOT EXISTS fund_metrics (
+        fund_code TEXT PRIMARY KEY,
+        first_date TEXT,
+        first_nav REAL,
+        last_date TEXT,
+        last_nav REAL,
+        nav_count INTEGER NOT NULL DEFAULT 0,
+        peak_nav REAL,
+        max_drawdown REAL,
+        ret_count INTEGER NOT NULL DEFAULT 0,
+        ret_mean REAL NOT NULL DEFAULT 0,
+        ret_m2 REAL NOT NULL DEFAULT 0,
+        drawdown REAL,
+        volatility REAL,
+        sharpe REAL,
+        cumulative_return REAL,
+        annualized_return REAL,
+        {', '.join(f'{name} REAL' for name in PERIODS)},
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+'''
+
+SAVE_METRICS_SQL = f'''
+    INSERT OR REPLACE INTO fund_metrics (fund_code, {', '.join(STATE_COLUMNS)}, drawdown, volatility, sharpe,
+        cumulative_return, annualized_return, {', '.join(PERIODS)}, version, updated_at)
+    VALUES (:fund_code, {', '.join(':' + c for c in STATE_COLUMNS)}, :drawdown, :volatility, :sharpe,
+        :cumulative_return, :annualized_return, {', '.join(':' + c for c in PERIODS)},
+        (SELECT COALESCE(MAX(version), 0) + 1 FROM fund_metrics), CURRENT_TIMESTAMP)
+'''
+
+# 各区间基准日的净值，一次查询（每个子查询是 (fund_code, date) 唯一索引上的一次倒序查找）
+PERIOD_BASE_SQL = 'SELECT ' + ', '.join(
+    f'(SELECT {NAV_EXPR} FROM nav_history WHERE fund_code = :fund_code AND date <= {base}'
+    f' AND {NAV_EXPR} IS NOT NULL ORDER BY date DESC LIMIT 1)' for base in PERIODS.values())
+
+# 紧凑布局（fund_compact）下直接按 (fund_id, day) 主键查找，基准日换算成天数
+COMPACT_NAV_EXPR = decode_sql('COALESCE(cumulative_nav, nav)')
+COMPACT_FUND_ID = '(SELECT fund_id FROM fund_ids WHERE fund_code = :fund_code)'
+COMPACT_PERIOD_BASE_SQL = 'SELECT ' + ', '.join(
+    f'(SELECT {COMPACT_NAV_EXPR} FROM nav_compact WHERE fund_id = {COMPACT_FUND_ID} AND day <= {day_sql(base)}'
+    f' AND COALESCE(cumulative_nav, nav) IS NOT NULL ORDER BY day DESC LIMIT 1)' for base in PERIODS.values())
+COMPACT_SCAN_SQL = f'''
+    SELECT {date_sql('day')}, {COMPACT_NAV_EXPR} FROM nav_compact
+    WHERE fund_id = {COMPACT_FUND_ID} AND COALESCE(cumulative_nav, nav) IS NOT NULL ORDER BY day
+'''
+COMPACT_REBUILD_SQL = f'''
+    SELECT i.fund_code, {date_sql('n.day')}, {decode_sql('COALESCE(n.cumulative_nav, n.nav)')}
+    FROM nav_compact n JOIN fund_ids i ON i.fund_id = n.fund_id
+    WHERE COALESCE(n.cumulative_nav, n.nav) IS NOT NULL ORDER BY n.fund_id, n.day
+'''
+
+IN_CHUNK = 500
+
+
+def ensure_table(conn, backfill=True):
+    """建表及排行索引；表是新建的且已有净值时全量回填一次"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fund_metrics'").fetchone()
+    conn.execute(CREATE_METRICS_SQL)
+    if exists and 'version' not in {row[1] for row in conn.execute('PRAGMA table_info(fund_metrics)')}:
+        conn.execute('ALTER TABLE fund_metrics ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fund_metrics_version ON fund_metrics(version)')
+    for column in RANK_COLUMNS:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_fund_metrics_{column} ON fund_metrics({column})')
+    has_navs = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = 'nav_history'").fetchone()
+    if backfill and not exists and has_navs:
+        rebuild_all(conn)
+
+
+def empty_state():
+    return {'first_date': None, 'first_nav': None, 'last_date': None, 'last_nav': None, 'nav_count': 0,
+            'peak_nav': None, 'max_drawdown': 0.0, 'ret_count': 0, 'ret_mean': 0.0, 'ret_m2': 0.0}
+
+
+def load_states(conn, fund_codes):
+    """{基金代码: 折叠状态}，没有指标行的基金不在结果中"""
+    codes = list(fund_codes)
+    states = {}
+    for i in range(0, len(codes), IN_CHUNK):
+        chunk = codes[i:i + IN_CHUNK]
+        rows = conn.execute(
+            f"SELECT fund_code, {', '.join(STATE_COLUMNS)} FROM fund_metrics"
+            f" WHERE fund_code IN ({','.join('?' * len(chunk))})", chunk)
+        for row in rows:
+            states[row[0]] = dict(zip(STATE_COLUMNS, row[1:]))
+    return states
+
+
+def row_nav(row):
+    """(fund_code, date, nav, cumulative_nav, daily_return) 行的计算用净值"""
+    return row[3] if row[3] is not None else row[2]
+
+
+def split_rows(state, rows):
+    """
+    按折叠状态把一只基金的新行分成 (已有最新日期及之前的行, 之后的行, 之后的净值点)
+    净值点按日期排序、同日期取最后一行，只保留有净值的 (date, nav)
+    """
+    last_date = state['last_date'] if state else None
+    old, new = [], {}
+    for row in rows:
+        if last_date is not None and row[1] <= last_date:
+            old.append(row)
+        else:
+            new[row[1]] = row
+    tail = [(day, row_nav(row)) for day, row in sorted(new.items()) if row_nav(row) is not None]
+    return old, list(new.values()), tail
+
+
+def fold(state, points):
+    """把按日期升序、都晚于 last_date 的 (date, nav) 折叠进状态（就地修改并返回）"""
+    prev = state['last_nav']
+    peak = state['peak_nav']
+    max_dd = state['max_drawdown']
+    n, mean, m2 = state['ret_count'], state['ret_mean'], state['ret_m2']
+    for day, nav in points:
+        if state['first_date'] is None:
+            state['first_date'], state['first_nav'] = day, nav
+        if prev is not None and prev > 0:
+            r = nav / prev - 1
+            n += 1
+            delta = r - mean
+            mean += delta / n
+            m2 += delta * (r - mean)
+        if peak is None or nav > peak:
+            peak = nav
+        if peak > 0:
+            max_dd = min(max_dd, nav / peak - 1)
+        prev = nav
+    if points:
+        state['last_date'], state['last_nav'] = points[-1]
+        state['nav_count'] += len(points)
+    state.update(peak_nav=peak, max_drawdown=max_dd, ret_count=n, ret_mean=mean, ret_m2=m2)
+    return state
+
+
+def scan_state(conn, fund_code):
+    """从 nav_history 整段重算一只基金的折叠状态"""
+    if fund_compact.is_compact(conn):
+        rows = conn.execute(COMPACT_SCAN_SQL, {'fund_code': fund_code}).fetchall()
+    else:
+        rows = conn.execute(
+            f'SELECT date, {NAV_EXPR} FROM nav_history WHERE fund_code = ? AND {NAV_EXPR} IS NOT NULL ORDER BY date',
+            (fund_code,)).fetchall()
+    return fold(empty_state(), rows)
+
+
+def _ratio(a, b):
+    if a is None or b is None or b <= 0:
+        return None
+    return a / b - 1
+
+
+def derive(conn, fund_code, state, risk_free=RISK_FREE_RATE, trading_days=TRADING_DAYS):
+    """由折叠状态和各区间基准净值算出整行指标"""
+    record = dict(state, fund_code=fund_code)
+    last = state['last_nav']
+    n = state['ret_count']
+    volatility = math.sqrt(state['ret_m2'] / (n - 1) * trading_days) if n > 1 else None
+    cumulative = _ratio(last, state['first_nav'])
+    annualized = None
+    if cumulative is not None and cumulative > -1 and state['first_date'] != state['last_date']:
+        days = (date.fromisoformat(state['last_date']) - date.fromisoformat(state['first_date'])).days
+        annualized = (1 + cumulative) ** (365.25 / days) - 1
+    record.update(
+        drawdown=_ratio(last, state['peak_nav']),
+        volatility=volatility,
+        sharpe=(state['ret_mean'] * trading_days - risk_free) / volatility if volatility else None,
+        cumulative_return=cumulative,
+        annualized_return=annualized,
+    )
+    if state['last_date']:
+        sql = COMPACT_PERIOD_BASE_SQL if fund_compact.is_compact(conn) else PERIOD_BASE_SQL
+        bases = conn.execute(sql, {'fund_code': fund_code, 'last_date': state['last_date']}).fetchone()
+    else:
+        bases = [None] * len(PERIODS)
+    record.update((name, _ratio(last, base)) for name, base in zip(PERIODS, bases))
+    return record
+
+
+def save(conn, fund_code, state):
+    """写入一只基金的指标行；没有任何净值的基金删除其指标行"""
+    if not state['nav_count']:
+        conn.execute('DELETE FROM fund_metrics WHERE fund_code = ?', (fund_code,))
+        return
+    conn.execute(SAVE_METRICS_SQL, derive(conn, fund_code, state))
+
+
+def rebuild_all(conn):
+    """全量重建（一次按 fund_code, date 顺序扫描 nav_history），返回基金数"""
+    conn.execute('DELETE FROM fund_metrics')
+    if fund_compact.is_compact(conn):
+        cursor = conn.execute(COMPACT_REBUILD_SQL)
+    else:
+        cursor = conn.execute(
+            f'SELECT fund_code, date, {NAV_EXPR} FROM nav_history WHERE {NAV_EXPR} IS NOT NULL ORDER BY fund_code, date')
+    count = 0
+    code, points = None, []
+    for fund_code, day, nav in cursor.fetchall():
+        if fund_code != code:
+            if code is not None:
+                save(conn, code, fold(empty_state(), points))
+                count += 1
+            code, points = fund_code, []
+        points.append((day, nav))
+    if code is not None:
+        save(conn, code, fold(empty_state(), points))
+        count += 1
+    return count
+
+
+def top_funds(conn, by='return_1y', n=20, ascending=False, theme=None):
+    """按某个指标排行（走该列索引），返回 dict 列表；该指标为 NULL 的基金不参与，theme 限定主题"""
+    if by not in RANK_COLUMNS:
+        raise ValueError(f'不支持的排行指标: {by}')
+    order = 'ASC' if ascending else 'DESC'
+    where, params = f'm.{by} IS NOT NULL', [n]
+    if theme:
+        where += ' AND f.theme = ?'
+        params.insert(0, theme)
+    rows = conn.execute(f'''
+        SELECT m.fund_code, f.fund_name, m.{by}, m.last_date, m.last_nav
+        FROM fund_metrics m LEFT JOIN funds f ON f.fund_code = m.fund_code
+        WHERE {where} ORDER BY m.{by} {order} LIMIT ?
+    ''', params).fetchall()
+    return [{'code': code, 'name': name or code, by: value, 'last_date': last_date, 'last_nav': last_nav}
+            for code, name, value, last_date, last_nav in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基金指标表')
+    parser.add_argument('command', choices=['rebuild', 'top'])
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--by', default='return_1y', choices=RANK_COLUMNS, help='排行指标')
+    parser.add_argument('-n', type=int, default=20, help='排行数量')
+    parser.add_argument('--asc', action='store_true', help='升序（如最大回撤最深的基金）')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None)
+    try:
+        if args.command == 'rebuild':
+            conn.execute('BEGIN IMMEDIATE')
+            ensure_table(conn, backfill=False)
+            count = rebuild_all(conn)
+            conn.execute('COMMIT')
+            print(f"[INFO] 已重建 {count} 只基金的指标")
+            return
+        for i, row in enumerate(top_funds(conn, args.by, args.n, args.asc), 1):
+            print(f"{i:>3}. {row['code']} {row['name']:<20} {row[args.by]:>+9.2%}  "
+                  f"{row['last_date']} {row['last_nav']:.4f}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+净值数据解析
+正则预编译，单次扫描原始响应直接产出 (date, nav, cumulative_nav, daily_return) 元组，
+不做整段 unescape，也不构造中间 dict
+"""
+
+import re
+
+# 东方财富 F10DataApi: var apidata={ content:"<table>...</table>",records:380,pages:19,curpage:1};
+EASTMONEY_ROW_RE = re.compile(
+    r"<tr><td>(\d{4}-\d\d-\d\d)</td>"
+    r"<td[^>]*>([\d.]*)</td>"
+    r"<td[^>]*>([\d.]*)</td>"
+    r"<td[^>]*>([-\d.]*)%?</td>"
+)
+EASTMONEY_META_RE = re.compile(r'records:(\d+),\s*pages:(\d+),\s*curpage:(\d+)')
+
+# 新浪财经 FundInfo_LSJZ.php 表格行
+SINA_ROW_RE = re.compile(
+    r'<tr[^>]*>\s*<td[^>]*>(.*?)</td>\s*<td[^>]*>(.*?)</td>\s*<td[^>]*>(.*?)</td>\s*<td[^>]*>(.*?)</td>',
+    re.DOTALL
+)
+TAG_RE = re.compile(r'<[^>]+>')
+
+# 首格为日期的表格行（解析前的数据行数，用于统计丢弃的行）
+DATA_ROW_RE = re.compile(r'<tr[^>]*>\s*<td[^>]*>(?:\s*<[^>]+>)*\s*\d{4}[-/]\d')
+
+
+def _num(text):
+    """数值单元格转 float，空值或 '--' 返回 None"""
+    if not text or text.startswith('--'):
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def count_data_rows(text):
+    """原始响应中的数据行数；东方财富的数据行首格不带属性，直接计数，其余格式走正则"""
+    count = text.count('<tr><td>')
+    if count:
+        return count
+    return len(DATA_ROW_RE.findall(text))
+
+
+def parse_eastmoney_rows(text):
+    """解析东方财富净值行，返回元组列表（日期倒序）"""
+    matches = EASTMONEY_ROW_RE.findall(text)
+    try:
+        # 快路径：内联转换，避免逐格函数调用
+        return [
+            (d, float(n) if n else None, float(c) if c else None, float(r) if r else None)
+            for d, n, c, r in matches
+        ]
+    except ValueError:
+        # 含 '--' 等占位符时走逐格转换
+        return [(d, _num(n), _num(c), _num(r)) for d, n, c, r in matches]
+
+
+def parse_eastmoney_meta(text):
+    """读取 apidata 中的 (records, pages, curpage)，读不到返回 (0, 0, 0)"""
+    match = EASTMONEY_META_RE.search(text)
+    if not match:
+        return 0, 0, 0
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+
+def parse_eastmoney(text):
+    """解析 apidata 响应，返回 (rows, records, pages)"""
+    records, pages, _ = parse_eastmoney_meta(text)
+    return parse_eastmoney_rows(text), records, pages
+
+
+def iter_sina_rows(text):
+    """逐行产出新浪财经净值元组，日期统一为 YYYY-MM-DD"""
+    strip = TAG_RE.sub
+    for cells in SINA_ROW_RE.findall(text):
+        date_str = strip('', cells[0]).strip()
+        if '/' in date_str:
+            # 转换日期格式 2025/12/31 -> 2025-12-31
+            parts = date_str.split('/')
+            if len(parts) != 3:
+                continue
+            date_str = f"{parts[0]}-{parts[1].zfill(2)}-{parts[2].zfill(2)}"
+        nav = _num(strip('', cells[1]).strip())
+        if nav is None:
+            # 表头等非数据行
+            continue
+        cumulative_nav = _num(strip('', cells[2]).strip())
+        daily_return = _num(strip('', cells[3]).strip().replace('%', ''))
+        yield (date_str, nav, cumulative_nav, daily_return)
+
+
+def parse_sina(text):
+    return list(iter_sina_rows(text))
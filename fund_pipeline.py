@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+流式 抓取 → 解析 → 写库 流水线
+各阶段之间用有界队列连接，下游慢时上游阻塞（背压），内存占用与基金数量、历史长度无关；
+解析阶段顺带做流式数据质量校验（fund_quality），结果随基金结束标记送到写库阶段
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import fund_telemetry as telemetry
+from fund_cache import get_cache
+from fund_calendar import TradingCalendar, get_calendar
+from fund_parser import parse_eastmoney, parse_eastmoney_meta
+from fund_quality import NavValidator
+from fund_retry import ParseError
+
+QUEUE_SIZE = 16
+BATCH_SIZE = 5000
+FETCH_WORKERS = 4
+
+# 单只基金内并行抓取的页数窗口
+FANOUT = 4
+
+# 页大小档位：固定档位让相同页大小的 URL 能命中响应缓存
+PAGE_SIZES = (20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_FUND_END = object()
+_STOP = object()
+
+
+class PageSizer:
+    """
+    按主机观测到的延迟和错误自适应页大小
+    页请求耗时低于目标一半时升一档；超过目标或出错时降两档
+    """
+
+    def __init__(self, initial=200, target_latency=2.0):
+        self.target_latency = target_latency
+        self._index = PAGE_SIZES.index(initial)
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            return PAGE_SIZES[self._index]
+
+    def observe(self, elapsed, ok=True):
+        with self._lock:
+            if not ok or elapsed > self.target_latency:
+                self._index = max(0, self._index - 2)
+            elif elapsed < self.target_latency / 2:
+                self._index = min(len(PAGE_SIZES) - 1, self._index + 1)
+
+
+PAGE_SIZER = PageSizer()
+
+_fanout_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='page-fanout')
+
+
+def _eastmoney_url(fund_code, page, per, sdate, edate=None):
+    url = f'http://fund.eastmoney.com/f10/F10DataApi.aspx?type=lsjz&code={fund_code}&page={page}&per={per}'
+    if sdate:
+        url += f'&sdate={sdate}'
+    if edate:
+        url += f'&edate={edate}'
+    return url
+
+
+def _fetch_page(url):
+    """
+    抓取一页，返回 (解析函数, 载荷, records, pages)；缓存命中时解析函数为 None
+    重试与熔断由 HTTP 层（fund_retry）负责
+    """
+    cache = get_cache()
+    parsed = cache.get_parsed(url, parse_eastmoney)
+    if parsed is not None:
+        rows, records, pages = parsed
+        return None, rows, records, pages
+
+    start = time.monotonic()
+    try:
+        text = cache.fetch(url)
+    except Exception:
+        PAGE_SIZER.observe(time.monotonic() - start, ok=False)
+        raise
+    PAGE_SIZER.observe(time.monotonic() - start)
+
+    records, pages, _ = parse_eastmoney_meta(text)
+    store_parsed = cache.caching_parser(url, parse_eastmoney)
+    return (lambda text, store_parsed=store_parsed: store_parsed(text)[0]), text, records, pages
+
+
+def iter_eastmoney_pages(fund_code, per=None, sdate=None, edate=None):
+    """
+    逐页产出 (解析函数, 载荷)
+    先抓第一页读出 records/pages，其余页在 FANOUT 窗口内并行抓取、按页序产出；
+    per 为空时使用 PAGE_SIZER 的自适应页大小；sdate/edate 限定日期区间（含两端）。
+    缓存命中时解析函数为 None、载荷为已解析的行；否则载荷为原始响应，解析后写回缓存
+    """
+    per = per or PAGE_SIZER.current()
+    parse, payload, records, pages = _fetch_page(_eastmoney_url(fund_code, 1, per, sdate, edate))
+    if not records:
+        return
+    yield parse, payload
+
+    remaining = iter(range(2, pages + 1))
+    window = deque()
+    try:
+        for page in islice(remaining, FANOUT):
+            window.append(_fanout_pool.submit(_fetch_page, _eastmoney_url(fund_code, page, per, sdate, edate)))
+        while window:
+            parse, payload, _, _ = window.popleft().result()
+            page = next(remaining, None)
+            if page is not None:
+                window.append(_fanout_pool.submit(_fetch_page, _eastmoney_url(fund_code, page, per, sdate, edate)))
+            yield parse, payload
+    finally:
+        for future in window:
+            future.cancel()
+
+
+def eastmoney_pages(fund):
+    """默认抓取函数：产出 (解析函数, 载荷)"""
+    return iter_eastmoney_pages(fund['code'])
+
+
+def run_pipeline(funds, store, fetch_pages=eastmoney_pages, fetch_workers=FETCH_WORKERS,
+                 queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, on_fund_done=None, validate=True, calendar=None):
+    """
+    运行流水线
+    funds 可以是任意可迭代对象（按需读取）；fetch_pages(fund) 产出 (parse, text)，
+    parse 为 None 表示载荷已是解析好的行（如缓存命中）；
+    写库阶段在调用线程中运行，每批最多 batch_size 行一个事务；
+    每只基金写完后回调 on_fund_done(fund, rows, error)；
+    validate 为 True 时校验结果经 store.save_quality 写入，calendar 默认按 store.db_path 读取
+    返回统计 {'funds', 'pages', 'rows', 'errors', 'issues'}
+    """
+    page_q = queue.Queue(maxsize=queue_size)
+    row_q = queue.Queue(maxsize=queue_size)
+    fund_iter = iter(funds)
+    fund_lock = threading.Lock()
+    # 任一阶段意外出错：抓取线程不再领新基金，各阶段照常收尾后在调用线程重新抛出
+    aborted = threading.Event()
+    crashed = []
+    stats = {'funds': 0, 'pages': 0, 'rows': 0, 'errors': 0, 'issues': 0}
+    if validate and calendar is None:
+        db_path = getattr(store, 'db_path', None)
+        calendar = get_calendar(db_path) if db_path else TradingCalendar()
+
+    def next_fund():
+        with fund_lock:
+            return None if aborted.is_set() else next(fund_iter, None)
+
+    def put(q, item, stage):
+        # 下游队列满时的阻塞时间（背压）
+        start = time.monotonic()
+        q.put(item)
+        telemetry.inc('stage_blocked_seconds', time.monotonic() - start, stage=stage)
+
+    def get(q, stage):
+        # 等待上游数据的空闲时间
+        start = time.monotonic()
+        item = q.get()
+        telemetry.inc('stage_idle_seconds', time.monotonic() - start, stage=stage)
+        return item
+
+    def fetch_stage():
+        # 抓取阶段：同一基金的页和结束标记由同一线程按序放入
+        try:
+            while True:
+                try:
+                    fund = next_fund()
+                except BaseException as e:
+                    # 读取基金池出错：不能当作正常结束
+                    crashed.append(e)
+                    aborted.set()
+                    break
+                if fund is None:
+                    break
+                error = None
+                try:
+                    for parse, text in fetch_pages(fund):
+                        put(page_q, (fund, parse, text), 'fetch')
+                except Exception as e:
+                    error = e
+                page_q.put((fund, _FUND_END, error))
+        finally:
+            # 读取基金池出错时也要通知下游，否则解析阶段永远等不到结束
+            page_q.put(_STOP)
+
+    def parse_stage():
+        # 解析阶段：单线程，保证每只基金的结束标记排在其所有页之后
+        stopped = [0]
+        try:
+            parse_loop(stopped)
+        except BaseException as e:
+            crashed.append(e)
+            aborted.set()
+            # 继续取走抓取线程放入的页，让它们能跑完手上的基金并退出
+            while stopped[0] < fetch_workers:
+                if page_q.get() is _STOP:
+                    stopped[0] += 1
+        finally:
+            # 无论如何都要通知写库阶段，否则调用线程永远等在 row_q 上
+            row_q.put(_STOP)
+
+    def parse_loop(stopped):
+        failed = {}
+        validators = {}
+        while stopped[0] < fetch_workers:
+            item = get(page_q, 'parse')
+            if item is _STOP:
+                stopped[0] += 1
+                continue
+            fund, parse, payload = item
+            code = fund['code']
+            if parse is _FUND_END:
+                error = payload
+                parse_error = failed.pop(code, None)
+                if error is None and parse_error is not None:
+                    error = ParseError(f'解析失败: {parse_error}')
+                validator = validators.pop(code, None)
+                put(row_q, (fund, _FUND_END, error, validator.report() if validator else None), 'parse')
+                continue
+            try:
+                if validate:
+                    validator = validators.get(code)
+                    if validator is None:
+                        validator = validators[code] = NavValidator(code, calendar)
+                    rows = validator.parse_page(parse, payload)
+                elif parse is None:
+                    rows = payload
+                else:
+                    with telemetry.timer('parse_seconds'):
+                        rows = parse(payload)
+            except Exception as e:
+                failed.setdefault(code, e)
+                continue
+            if rows:
+                put(row_q, (fund, rows, None, None), 'parse')
+
+    threads = [threading.Thread(target=fetch_stage, daemon=True) for _ in range(fetch_workers)]
+    threads.append(threading.Thread(target=parse_stage, daemon=True))
+    for t in threads:
+        t.start()
+
+    # 写库阶段
+    batch = []
+    finished = []
+    fund_rows = {}
+
+    def flush():
+        if batch:
+            store.upsert_rows(batch)
+            stats['rows'] += len(batch)
+            batch.clear()
+        reports = [report for _, _, report in finished if report]
+        if reports:
+            store.save_quality(reports)
+            stats['issues'] += sum(report['issues'] for report in reports)
+        for fund, error, _ in finished:
+            stats['funds'] += 1
+            if error:
+                stats['errors'] += 1
+            if on_fund_done:
+                on_fund_done(fund, fund_rows.pop(fund['code'], 0), error)
+        finished.clear()
+
+    stopped = False
+    try:
+        while True:
+            try:
+                item = row_q.get_nowait()
+            except queue.Empty:
+                # 上游暂时没有数据，先把已攒的批次写掉
+                flush()
+                item = get(row_q, 'write')
+            if item is _STOP:
+                stopped = True
+                break
+            fund, rows, error, report = item
+            if rows is _FUND_END:
+                finished.append((fund, error, report))
+                continue
+            code = fund['code']
+            stats['pages'] += 1
+            fund_rows[code] = fund_rows.get(code, 0) + len(rows)
+            batch.extend((code,) + row for row in rows)
+            if len(batch) >= batch_size:
+                flush()
+
+        flush()
+    except BaseException:
+        # 写库出错：让上游停止领新基金，取走剩余数据使各线程能退出，再抛出
+        aborted.set()
+        while not stopped:
+            stopped = row_q.get() is _STOP
+        for t in threads:
+            t.join()
+        raise
+    for t in threads:
+        t.join()
+    if crashed:
+        raise crashed[0]
+    return stats
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+净值数据质量校验
+入库流水线中逐行流式校验，每只基金只保留上一行（内存与历史长度无关）：
+日期单调且不重复、由相邻净值重算日增长率并与抓到的值比对、净值异常跳变、
+相对交易日历的缺口、解析时丢弃的行；结果写入 nav_quality（每只基金保留最近一次入库的校验结果）
+和 nav_quality_issues（每只基金最多 MAX_SAMPLES 条问题样本）
+
+用法:
+    python fund_quality.py                  # 有问题的基金
+    python fund_quality.py --fund 021489    # 单只基金的问题样本
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date
+
+import fund_telemetry as telemetry
+
+from fund_calendar import TradingCalendar
+from fund_parser import count_data_rows
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+# 日增长率比对容差（百分点）：抓到的值保留两位小数
+RETURN_TOLERANCE = 0.006
+
+# 净值保留四位小数，重算增长率的舍入误差约为 2 × 0.00005 / 前一日净值
+NAV_TICK = 0.0001
+
+# 单日涨跌幅超过该值视为异常跳变
+JUMP_THRESHOLD = 0.15
+
+# 相邻两条净值之间缺少的交易日达到该值才记为缺口（QDII 等基金随境外市场休市，短缺口不计）
+GAP_DAYS = 3
+
+MAX_SAMPLES = 20
+
+# 问题计数器（rows 为校验的行数）
+COUNTERS = ('rows', 'dropped', 'missing_nav', 'duplicates', 'out_of_order', 'return_mismatches', 'jumps', 'gaps')
+ISSUE_COUNTERS = COUNTERS[1:]
+
+CREATE_QUALITY_SQL = f'''
+    CREATE TABLE IF NOT EXISTS nav_quality (
+        fund_code TEXT PRIMARY KEY,
+        first_date TEXT,
+        last_date TEXT,
+        {', '.join(f'{name} INTEGER NOT NULL DEFAULT 0' for name in COUNTERS)},
+        issues INTEGER NOT NULL DEFAULT 0,
+        max_return_error REAL,
+        max_gap INTEGER,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+'''
+
+CREATE_ISSUES_SQL = '''
+    CREATE TABLE IF NOT EXISTS nav_quality_issues (
+        fund_code TEXT NOT NULL,
+        date TEXT,
+        kind TEXT NOT NULL,
+        detail TEXT
+    )
+'''
+
+SAVE_QUALITY_SQL = f'''
+    INSERT OR REPLACE INTO nav_quality (fund_code, first_date, last_date, {', '.join(COUNTERS)},
+        issues, max_return_error, max_gap, checked_at)
+    VALUES (:fund_code, :first_date, :last_date, {', '.join(':' + c for c in COUNTERS)},
+        :issues, :max_return_error, :max_gap, CURRENT_TIMESTAMP)
+'''
+
+
+def ensure_tables(conn):
+    conn.execute(CREATE_QUALITY_SQL)
+    conn.execute(CREATE_ISSUES_SQL)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_nav_quality_issue_count ON nav_quality(issues)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_nav_quality_samples_fund ON nav_quality_issues(fund_code)')
+
+
+class NavValidator:
+    """
+    单只基金的流式校验，行为 (date, nav, cumulative_nav, daily_return)；
+    日期升序或降序均可（由前两条不同日期确定方向），日增长率单位为百分比
+    """
+
+    def __init__(self, fund_code, calendar=None):
+        self.fund_code = fund_code
+        self.calendar = calendar if calendar is not None else TradingCalendar()
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.first_date = None
+        self.last_date = None
+        self.max_return_error = None
+        self.max_gap = None
+        self.samples = []
+        self._prev = None
+        self._direction = 0
+
+    def _issue(self, kind, day, detail, *args, count=1):
+        """计数；样本未满时才格式化说明"""
+        self.counts[kind] += count
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append((day, kind, detail.format(*args)))
+
+    def parse_page(self, parse, payload):
+        """解析一页（parse 为 None 时载荷已是行）并校验，返回行；原始响应中未解析出的行计为丢弃"""
+        start = time.monotonic()
+        rows = payload if parse is None else parse(payload)
+        parsed = time.monotonic()
+        dropped = count_data_rows(payload) - len(rows) if isinstance(payload, str) else 0
+        self.feed(rows, dropped)
+        if parse is not None:
+            telemetry.observe('parse_seconds', parsed - start)
+        telemetry.observe('validate_seconds', time.monotonic() - parsed)
+        telemetry.inc('pages_total', source='cache' if parse is None else 'network')
+        telemetry.inc('rows_parsed_total', len(rows))
+        return rows
+
+    def feed(self, rows, dropped=0):
+        if dropped > 0:
+            self._issue('dropped', None, '{} 行未能解析', dropped, count=dropped)
+        for row in rows:
+            self._check(row)
+
+    def _check(self, row):
+        counts = self.counts
+        counts['rows'] += 1
+        day_str, nav, cumulative, _ = row
+        if self.first_date is None or day_str < self.first_date:
+            self.first_date = day_str
+        if self.last_date is None or day_str > self.last_date:
+            self.last_date = day_str
+        if nav is None and cumulative is None:
+            self._issue('missing_nav', day_str, '单位净值与累计净值均缺失')
+
+        prev = self._prev
+        if prev is None:
+            self._prev = (date.fromisoformat(day_str), row)
+            return
+        prev_day, prev_row = prev
+        if day_str == prev_row[0]:
+            self._issue('duplicates', day_str, '日期重复')
+            return
+        direction = 1 if day_str > prev_row[0] else -1
+        if self._direction == 0:
+            self._direction = direction
+        elif direction != self._direction:
+            # 乱序行不作为后续比对的基准，一条错位只计一次
+            self._issue('out_of_order', day_str, '出现在 {} 之后', prev_row[0])
+            return
+        day = date.fromisoformat(day_str)
+        self._prev = (day, row)
+        if direction > 0:
+            self._check_pair(prev_day, prev_row, day, row)
+        else:
+            self._check_pair(day, row, prev_day, prev_row)
+
+    def _check_pair(self, old_day, old, new_day, new):
+        """相邻两个净值日：重算增长率、跳变、缺口"""
+        if (new_day - old_day).days > GAP_DAYS:
+            missing = self.calendar.between(old_day, new_day)
+            if missing >= GAP_DAYS:
+                self.max_gap = max(self.max_gap or 0, missing)
+                self._issue('gaps', new[0], '与 {} 之间缺 {} 个交易日', old[0], missing)
+
+        old_nav, new_nav = old[1], new[1]
+        if not old_nav or new_nav is None:
+            return
+        # 有累计净值时用累计净值之差，分红除息日也能对上
+        if old[2] is not None and new[2] is not None:
+            change = (new[2] - old[2]) / old_nav
+        else:
+            change = new_nav / old_nav - 1
+        if abs(change) > JUMP_THRESHOLD:
+            self._issue('jumps', new[0], '{} → {} 变动 {:+.2%}', old[0], new[0], change)
+        scraped = new[3]
+        if scraped is not None:
+            error = abs(change * 100 - scraped)
+            if error > RETURN_TOLERANCE + NAV_TICK * 100 / old_nav:
+                self.max_return_error = max(self.max_return_error or 0.0, error)
+                self._issue('return_mismatches', new[0], '抓到 {:.2f}%，重算 {:.4f}%', scraped, change * 100)
+
+    def report(self):
+        """校验结果 dict（可直接传给 save_reports）"""
+        report = dict(self.counts, fund_code=self.fund_code, first_date=self.first_date,
+                      last_date=self.last_date, max_return_error=self.max_return_error,
+                      max_gap=self.max_gap, samples=list(self.samples))
+        report['issues'] = sum(self.counts[name] for name in ISSUE_COUNTERS)
+        return report
+
+
+def save_reports(conn, reports):
+    """写入校验结果（替换这些基金上一次的结果与样本），跳过没有校验任何行的结果"""
+    reports = [r for r in reports if r and r['rows']]
+    if not reports:
+        return 0
+    conn.executemany(SAVE_QUALITY_SQL, reports)
+    conn.executemany('DELETE FROM nav_quality_issues WHERE fund_code = ?', ((r['fund_code'],) for r in reports))
+    conn.executemany('INSERT INTO nav_quality_issues (fund_code, date, kind, detail) VALUES (?, ?, ?, ?)',
+                     ((r['fund_code'],) + sample for r in reports for sample in r['samples']))
+    return len(reports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='净值数据质量')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--fund', help='查看单只基金的问题样本')
+    parser.add_argument('-n', type=int, default=50, help='最多列出的基金数')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        if args.fund:
+            for day, kind, detail in conn.execute(
+                    'SELECT date, kind, detail FROM nav_quality_issues WHERE fund_code = ? ORDER BY rowid',
+                    (args.fund,)):
+                print(f"{day or '-':<12}{kind:<20}{detail}")
+            return
+        print(f"{'代码':<8}{'区间':<24}{'行数':>8}" + ''.join(f'{name:>19}' for name in ISSUE_COUNTERS))
+        for row in conn.execute(
+                f"SELECT fund_code, first_date, last_date, rows, {', '.join(ISSUE_COUNTERS)} FROM nav_quality"
+                f" WHERE issues > 0 ORDER BY issues DESC LIMIT ?", (args.n,)):
+            print(f"{row[0]:<8}{row[1]} ~ {row[2]:<11}{row[3]:>8}" + ''.join(f'{v:>19}' for v in row[4:]))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+重试与熔断
+错误分类（超时 / 连接 / 4xx / 5xx / 限流 / 解析），可重试的错误按指数退避 + 随机抖动重试；
+每个主机一个熔断器：连续失败达到阈值后暂停该主机，冷却后放一个探测请求，成功才恢复
+"""
+
+import random
+import threading
+import time
+
+import requests
+
+import fund_telemetry as telemetry
+
+# 错误类别
+TIMEOUT = 'timeout'
+CONNECTION = 'connection'
+HTTP_4XX = 'http_4xx'
+HTTP_5XX = 'http_5xx'
+THROTTLED = 'throttled'
+PARSE = 'parse'
+CIRCUIT_OPEN = 'circuit_open'
+OTHER = 'other'
+
+# 值得重试、且计入主机熔断的错误
+RETRYABLE = frozenset({TIMEOUT, CONNECTION, HTTP_5XX, THROTTLED})
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """主机处于熔断状态，请求未发出"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f'{host} 已熔断，{retry_in:.1f}s 后探测')
+        self.host = host
+        self.retry_in = retry_in
+
+
+class ParseError(ValueError):
+    """响应无法解析"""
+
+
+def classify(exc):
+    """把异常归类为上面的错误类别之一"""
+    if isinstance(exc, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(exc, requests.Timeout):
+        return TIMEOUT
+    if isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else 0
+        if status == 429:
+            return THROTTLED
+        if status >= 500:
+            return HTTP_5XX
+        return HTTP_4XX
+    if isinstance(exc, requests.RequestException):
+        return CONNECTION
+    if isinstance(exc, (ValueError, IndexError, KeyError)):
+        return PARSE
+    return OTHER
+
+
+def retry_after(exc):
+    """429/503 响应的 Retry-After 秒数，没有则返回 None"""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+
+class RetryPolicy:
+    """指数退避 + 全抖动：第 n 次重试前等待 uniform(0, min(max_delay, base_delay * 2**n)) 秒"""
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, retry_on=RETRYABLE):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def delay(self, attempt, exc=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(exc) if exc is not None else None
+        if hint is not None:
+            delay = max(delay, min(self.max_delay, hint))
+        return delay
+
+
+class CircuitBreaker:
+    """单主机熔断器"""
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """请求前调用；熔断中抛出 CircuitOpenError，冷却结束后只放行一个探测请求"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.host, max(0.0, retry_in))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """探测请求以不计入熔断的结果结束（如 404）时，允许下一个探测"""
+        with self._lock:
+            self._probing = False
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+# 各主机熔断配置，未列出的主机用 DEFAULT_BREAKER
+HOST_BREAKERS = {}
+DEFAULT_BREAKER = {'failure_threshold': 5, 'reset_timeout': 30.0}
+
+_breakers = {}
+_counts = {}
+_lock = threading.Lock()
+
+
+def get_breaker(host):
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, **HOST_BREAKERS.get(host, DEFAULT_BREAKER))
+            _breakers[host] = breaker
+        return breaker
+
+
+def configure_breaker(host, failure_threshold=None, reset_timeout=None):
+    """修改某主机的熔断配置（重置该主机的熔断状态）"""
+    config = dict(HOST_BREAKERS.get(host, DEFAULT_BREAKER))
+    if failure_threshold is not None:
+        config['failure_threshold'] = failure_threshold
+    if reset_timeout is not None:
+        config['reset_timeout'] = reset_timeout
+    HOST_BREAKERS[host] = config
+    with _lock:
+        _breakers.pop(host, None)
+
+
+def _count(host, key):
+    with _lock:
+        item = _counts.setdefault(host, {})
+        item[key] = item.get(key, 0) + 1
+
+
+def call_with_retry(host, func, policy=None):
+    """
+    经熔断器调用 func()，可重试的错误按策略退避重试
+    最后一次失败（或熔断）的异常原样抛出
+    """
+    policy = policy or DEFAULT_POLICY
+    breaker = get_breaker(host)
+    attempt = 0
+    last_error = None
+    while True:
+        try:
+            breaker.allow()
+        except CircuitOpenError:
+            # 重试途中熔断：抛出真正导致熔断的错误
+            if last_error is not None:
+                raise last_error
+            raise
+        try:
+            result = func()
+        except Exception as e:
+            kind = classify(e)
+            _count(host, kind)
+            if kind not in RETRYABLE:
+                breaker.release_probe()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.max_attempts or kind not in policy.retry_on:
+                raise
+            last_error = e
+            _count(host, 'retries')
+            time.sleep(policy.delay(attempt - 1, e))
+            continue
+        breaker.record_success()
+        return result
+
+
+def retry_stats():
+    """各主机的错误/重试计数与熔断状态: {host: {...}}"""
+    with _lock:
+        stats = {host: dict(item) for host, item in _counts.items()}
+        breakers = list(_breakers.items())
+    for host, breaker in breakers:
+        item = stats.setdefault(host, {})
+        item['state'] = breaker.state
+        item['opened'] = breaker.opened
+    return stats
+
+
+def format_retry_stats():
+    lines = []
+    for host, item in sorted(retry_stats().items()):
+        errors = ', '.join(f'{k} {v}' for k, v in sorted(item.items())
+                           if k not in ('state', 'opened', 'retries'))
+        lines.append(f"{host}: 重试 {item.get('retries', 0)} 次, 熔断 {item.get('opened', 0)} 次"
+                     f" (当前 {item.get('state', CLOSED)}), 错误 {errors or '无'}")
+    return lines
+
+
+def _collect():
+    """导出给 fund_telemetry 的计数"""
+    for host, item in retry_stats().items():
+        for key, value in item.items():
+            if key == 'retries':
+                yield 'retries_total', {'host': host}, value
+            elif key == 'opened':
+                yield 'circuit_opened_total', {'host': host}, value
+            elif key != 'state':
+                yield 'http_errors_total', {'host': host, 'kind': key}, value
+
+
+telemetry.register_collector(_collect)
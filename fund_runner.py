@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+多进程分片同步
+N 个抓取/解析进程各自处理基金池的一个分片（进程内仍是 fund_pipeline 流水线），
+解析好的行（及数据质量校验结果）经有界的 multiprocessing 队列送到唯一的写库进程，只有它持有数据库连接，
+避免多个写者争用 SQLite 写锁（database is locked）
+
+用法:
+    python fund_runner.py --processes 4
+    python fund_runner.py --processes 8 --threads 2 --db /path/to/fund_robot.db
+    python fund_runner.py --metrics /var/lib/node_exporter/fund_sync.prom
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+
+import fund_telemetry as telemetry
+from fund_calendar import get_calendar
+from fund_http import HOST_LIMITS, configure_host
+from fund_pipeline import run_pipeline, eastmoney_pages, BATCH_SIZE
+from fund_store import get_store
+from fund_universe import iter_universe, count_universe
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+PROCESSES = max(1, min(8, os.cpu_count() or 1))
+THREADS = 2
+
+# 写库队列中最多积压的批次数（每批最多 BATCH_SIZE 行），满了抓取进程阻塞
+QUEUE_BATCHES = 32
+
+# 写库进程每个事务最多合并的批次数
+COMMIT_BATCHES = 8
+
+# 写库队列满时每次等待的秒数（之后检查写库进程是否还在）
+PUT_TIMEOUT = 1.0
+
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+    sys.stdout.flush()
+
+
+class QueueSink:
+    """
+    替代 NavStore 交给 run_pipeline：批次发往写库进程
+    （行批次为 list，校验结果为 ('quality', reports)，基金结束为 ('done', (分片, 代码, 名称, 行数, 错误))）；
+    写库进程已退出（abort 被置位）时不再阻塞在满队列上，抛出 RuntimeError
+    """
+
+    def __init__(self, row_queue, abort):
+        self.row_queue = row_queue
+        self.abort = abort
+
+    def _put(self, item):
+        while True:
+            if self.abort.is_set():
+                # 没人再读队列：退出时不等缓冲中的数据刷进管道
+                self.row_queue.cancel_join_thread()
+                raise RuntimeError('写库进程已退出')
+            try:
+                self.row_queue.put(item, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def upsert_rows(self, rows):
+        batch = list(rows)
+        if batch:
+            self._put(batch)
+        return len(batch)
+
+    def save_quality(self, reports):
+        if reports:
+            self._put(('quality', reports))
+        return len(reports)
+
+    def fund_done(self, shard, fund, count, error):
+        """排在该基金所有批次之后，由写库进程在提交后确认"""
+        self._put(('done', (shard, fund['code'], fund['name'], count, str(error) if error else None)))
+
+
+def _split_host_limits(processes):
+    """各进程的限速器相互独立，把每个主机的速率与并发平均分给各进程"""
+    for host, limit in list(HOST_LIMITS.items()):
+        configure_host(host, rate=limit['rate'] / processes,
+                       burst=max(1, limit['burst'] // processes),
+                       max_in_flight=max(1, limit['max_in_flight'] // processes))
+
+
+def _worker_main(db_path, shard, processes, threads, batch_size, row_queue, result_queue, abort):
+    """抓取/解析进程：处理分片 shard/processes"""
+    _split_host_limits(processes)
+    sink = QueueSink(row_queue, abort)
+
+    def on_fund_done(fund, count, error):
+        sink.fund_done(shard, fund, count, error)
+
+    stats = run_pipeline(iter_universe(db_path, shard, processes), sink,
+                         fetch_pages=eastmoney_pages, fetch_workers=threads,
+                         batch_size=batch_size, on_fund_done=on_fund_done, calendar=get_calendar(db_path))
+    stats['telemetry'] = telemetry.snapshot()
+    result_queue.put(('worker', shard, stats))
+
+
+def _writer_main(db_path, row_queue, result_queue, commit_batches, abort):
+    """写库进程：唯一的数据库写者，收到 None 后退出；基金在其数据提交之后才算完成"""
+    try:
+        store = get_store(db_path)
+        stats = {'rows': 0, 'commits': 0, 'commit_seconds': 0.0, 'funds': 0, 'failed': []}
+        stopping = False
+        while not stopping:
+            batches = [row_queue.get()]
+            # 队列里已有的批次合并进同一个事务
+            while len(batches) < commit_batches:
+                try:
+                    batches.append(row_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batches:
+                stopping = True
+                batches = [b for b in batches if b is not None]
+            done = [batch[1] for batch in batches if isinstance(batch, tuple) and batch[0] == 'done']
+            batches = [batch for batch in batches if not (isinstance(batch, tuple) and batch[0] == 'done')]
+            if batches:
+                start = time.monotonic()
+                with store.transaction():
+                    for batch in batches:
+                        if isinstance(batch, tuple):
+                            store.save_quality(batch[1])
+                        else:
+                            stats['rows'] += store.upsert_rows(batch)
+                stats['commit_seconds'] += time.monotonic() - start
+                stats['commits'] += 1
+            for shard, code, name, count, error in done:
+                stats['funds'] += 1
+                if error:
+                    stats['failed'].append(code)
+                    log(f"  ✗ [分片{shard}] {name}: {error}")
+        store.close()
+        stats['telemetry'] = telemetry.snapshot()
+        result_queue.put(('writer', 0, stats))
+    except BaseException:
+        abort.set()
+        raise
+
+
+def _collect(result_queue, procs, expected, results, watch=None, abort=None):
+    """
+    从结果队列取 expected 个结果并汇总（必须在 join 之前取，否则大结果填满管道时子进程退不出来）；
+    procs 都已退出且队列已空时不再等待；watch（写库进程）先于 procs 退出时置位 abort，让抓取进程不再阻塞
+    """
+    received = 0
+    idle = 0
+    while received < expected:
+        try:
+            kind, shard, stats = result_queue.get(timeout=1)
+        except queue.Empty:
+            if watch is not None and not watch.is_alive() and not abort.is_set():
+                log(f"✗ 写库进程提前退出 (exitcode={watch.exitcode})，停止抓取")
+                abort.set()
+            if any(p.is_alive() for p in procs):
+                continue
+            # 进程都已退出：再等一轮读完管道中的数据
+            idle += 1
+            if idle > 1:
+                break
+            continue
+        received += 1
+        telemetry.merge(stats.pop('telemetry'))
+        if kind == 'writer':
+            results['writer'] = stats
+        else:
+            results['workers'][shard] = stats
+
+
+def run_sharded(db_path=DB_PATH, processes=PROCESSES, threads=THREADS, batch_size=BATCH_SIZE,
+                queue_batches=QUEUE_BATCHES, commit_batches=COMMIT_BATCHES):
+    """
+    启动 1 个写库进程和 processes 个抓取进程，等待全部结束，各进程的运行指标汇总进本进程的 fund_telemetry
+    返回 {'workers': {shard: stats}, 'writer': stats, 'seconds': 耗时}
+    """
+    ctx = mp.get_context('spawn')
+    row_queue = ctx.Queue(maxsize=queue_batches)
+    result_queue = ctx.Queue()
+    abort = ctx.Event()
+    start = time.monotonic()
+
+    writer = ctx.Process(target=_writer_main, name='fund-writer',
+                         args=(db_path, row_queue, result_queue, commit_batches, abort))
+    writer.start()
+    workers = [ctx.Process(target=_worker_main, name=f'fund-worker-{shard}',
+                           args=(db_path, shard, processes, threads, batch_size, row_queue, result_queue, abort))
+               for shard in range(processes)]
+    for p in workers:
+        p.start()
+
+    results = {'workers': {}, 'writer': None}
+    _collect(result_queue, workers, len(workers), results, watch=writer, abort=abort)
+    for p in workers:
+        p.join()
+        if p.exitcode != 0:
+            log(f"✗ {p.name} 异常退出 (exitcode={p.exitcode})")
+    # 抓取进程退出前已把队列中的数据刷出，此后的 None 排在所有批次之后
+    while writer.is_alive():
+        try:
+            row_queue.put(None, timeout=PUT_TIMEOUT)
+            break
+        except queue.Full:
+            continue
+    _collect(result_queue, [writer], 1, results)
+    writer.join()
+    if writer.exitcode != 0:
+        log(f"✗ 写库进程异常退出 (exitcode={writer.exitcode})")
+    results['seconds'] = time.monotonic() - start
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程分片同步（单写库进程）')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--processes', type=int, default=PROCESSES, help='抓取/解析进程数（即分片数）')
+    parser.add_argument('--threads', type=int, default=THREADS, help='每个进程的抓取线程数')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='每批发往写库进程的行数')
+    parser.add_argument('--metrics', help='运行指标导出路径（.prom 为 Prometheus 文本，其余为 JSON 摘要）')
+    args = parser.parse_args()
+
+    total = count_universe(args.db)
+    log(f"开始同步 {total} 只基金: {args.processes} 个抓取进程 × {args.threads} 线程, 1 个写库进程")
+    results = run_sharded(args.db, args.processes, args.threads, args.batch_size)
+
+    issues = sum(s['issues'] for s in results['workers'].values())
+    writer = results['writer'] or {'rows': 0, 'commits': 0, 'commit_seconds': 0.0, 'funds': 0, 'failed': []}
+    # 以写库进程提交后确认的为准
+    funds, errors = writer['funds'], len(writer['failed'])
+    seconds = results['seconds']
+    log(f"✓ 基金 {funds}/{total} 只（失败 {errors}），写入 {writer['rows']} 行，"
+        f"{writer['commits']} 个事务，耗时 {seconds:.1f}s，{writer['rows'] / max(seconds, 1e-9):.0f} 行/s，"
+        f"写库占用 {writer['commit_seconds']:.1f}s，数据质量问题 {issues} 项")
+    # 各进程各有一个解析线程
+    for line in telemetry.format_summary(telemetry.summary(parse_workers=args.processes)):
+        log(line)
+    if args.metrics:
+        log(f"运行指标已写入 {telemetry.export(args.metrics, parse_workers=args.processes)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+同步调度守护进程
+常驻运行，按交易日历和净值公布时间（北京时间晚间，QDII 晚一个交易日）推算每只基金"此刻应已公布"的最新净值日期，
+只调度可能有新数据的基金：
+    等待堆    按下次可能有新数据的时间排序（周末、节假日期间为空转，不发请求）
+    就绪堆    到点的基金按 应有而缺失的优先、落后的交易日数多的优先 排序，每轮取一批走增量流水线
+某个净值日还没有任何基金拿到数据时，只放少量基金探测；探测到有数据才放行全部，
+过了公布窗口仍无一只有数据则认定为节假日（未登记的农历假期）并记入日历
+
+用法:
+    python fund_scheduler.py run                              # 常驻
+    python fund_scheduler.py run --holidays holidays.txt --metrics /var/lib/node_exporter/fund_sched.prom
+    python fund_scheduler.py plan                             # 只打印此刻会调度的基金
+    python fund_scheduler.py plan --at '2026-10-19 20:30'
+"""
+
+import argparse
+import heapq
+import signal
+import sys
+import threading
+from datetime import datetime, time as dtime, timedelta, timezone
+
+import fund_telemetry as telemetry
+from fund_calendar import load_calendar
+from fund_pipeline import FETCH_WORKERS, iter_eastmoney_pages, run_pipeline
+from fund_store import get_store
+from fund_universe import iter_universe
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+
+# 北京时间（无夏令时）
+TZ = timezone(timedelta(hours=8), 'Asia/Shanghai')
+
+# 基金类别 → (公布滞后的交易日数, 公布窗口开始时间)
+PUBLISH_WINDOWS = {
+    'etf': (0, dtime(17, 30)),
+    'open': (0, dtime(19, 0)),
+    'qdii': (1, dtime(19, 0)),
+}
+
+# 每轮最多调度的基金数
+BATCH_FUNDS = 200
+
+# 仍缺失时的重试间隔：从 RETRY_BASE 起翻倍，最长 RETRY_MAX；同一净值日最多尝试 MAX_ATTEMPTS 次，之后等下一个公布窗口
+RETRY_BASE = timedelta(minutes=10)
+RETRY_MAX = timedelta(hours=2)
+MAX_ATTEMPTS = 6
+
+# 净值日尚无任何基金拿到数据时，每轮最多放出的探测基金数；探测失败的基金按重试间隔再试
+PROBE_FUNDS = 5
+PROBE_WAIT = timedelta(minutes=10)
+
+# 公布窗口开始后过了这么久仍没有任何基金有该日净值，认定该日休市
+HOLIDAY_AFTER = timedelta(hours=6)
+
+# 基金池重新读取的间隔（新增基金加入调度）
+RELOAD_EVERY = timedelta(hours=1)
+
+# 无事可做时最长睡眠（便于响应基金池变化与退出信号）
+MAX_SLEEP = 300.0
+
+
+def log(msg):
+    print(f"[{datetime.now(TZ).strftime('%m-%d %H:%M:%S')}] {msg}")
+    sys.stdout.flush()
+
+
+def fund_kind(fund):
+    """按基金类型/名称归类到 PUBLISH_WINDOWS"""
+    text = f"{fund.get('type') or ''} {fund.get('name') or ''}".upper()
+    if 'QDII' in text:
+        return 'qdii'
+    if 'ETF' in text and '联接' not in text:
+        return 'etf'
+    return 'open'
+
+
+def day_after(date_str):
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class SyncScheduler:
+    """
+    调度状态全在内存：重启后按库中水位线重新推算，不需要持久化
+    now 为返回北京时间 datetime 的函数（测试或 plan --at 时可替换）
+    """
+
+    def __init__(self, db_path=DB_PATH, calendar=None, batch_funds=BATCH_FUNDS, fetch_workers=FETCH_WORKERS,
+                 now=None):
+        self.db_path = db_path
+        self.store = get_store(db_path)
+        self.calendar = calendar if calendar is not None else load_calendar(db_path)
+        self.batch_funds = batch_funds
+        self.fetch_workers = fetch_workers
+        self.now = now or (lambda: datetime.now(TZ))
+        self.funds = {}
+        self.attempts = {}
+        self.waiting = []
+        self.due = []
+        self._tokens = {}
+        self._confirmed = set()
+        self._probing = {}
+        self._deferred = {}
+        self._reloaded = None
+        self._stop = threading.Event()
+
+    # 公布时间推算
+
+    def publish_at(self, kind, day):
+        """day 的净值预计开始公布的时间"""
+        lag, start = PUBLISH_WINDOWS[kind]
+        for _ in range(lag):
+            day = self.calendar.next_trading_day(day)
+        return datetime.combine(day, start, TZ)
+
+    def expected_date(self, kind, now):
+        """now 时该类基金应已公布的最新净值日期（ISO 字符串）"""
+        day = now.date()
+        if not self.calendar.is_trading_day(day):
+            day = self.calendar.previous_trading_day(day)
+        while self.publish_at(kind, day) > now:
+            day = self.calendar.previous_trading_day(day)
+        return day.isoformat()
+
+    def next_publish(self, kind, watermark, now):
+        """水位线之后下一个净值日的公布时间"""
+        day = datetime.strptime(max(watermark, self.expected_date(kind, now)), '%Y-%m-%d').date()
+        return self.publish_at(kind, self.calendar.next_trading_day(day))
+
+    # 基金池
+
+    def reload(self):
+        """读取基金池与水位线（fund_metrics.last_date），新基金立即可调度"""
+        now = self.now()
+        watermarks = dict(self.store.conn.execute('SELECT fund_code, last_date FROM fund_metrics'))
+        seen = set()
+        for fund in iter_universe(self.db_path):
+            code = fund['code']
+            seen.add(code)
+            if code in self.funds:
+                continue
+            fund['kind'] = fund_kind(fund)
+            fund['watermark'] = watermarks.get(code)
+            self.funds[code] = fund
+            self._schedule(code, now)
+        for code in set(self.funds) - seen:
+            del self.funds[code]
+            self._tokens.pop(code, None)
+        # 已有基金拿到的最新净值日都是交易日
+        self._confirmed.update(w for w in watermarks.values() if w)
+        self._reloaded = now
+        return len(self.funds)
+
+    # 堆操作（同一基金重新入堆时旧条目按 token 作废）
+
+    def _push_waiting(self, code, ready_at):
+        token = self._tokens.get(code, 0) + 1
+        self._tokens[code] = token
+        heapq.heappush(self.waiting, (ready_at, code, token))
+
+    def _schedule(self, code, now):
+        """按水位线决定立即就绪还是等到下一个公布时间"""
+        fund = self.funds[code]
+        watermark = fund['watermark']
+        if watermark is None or watermark < self.expected_date(fund['kind'], now):
+            self._push_waiting(code, now)
+        else:
+            self._push_waiting(code, self.next_publish(fund['kind'], watermark, now))
+
+    def _promote(self, now):
+        """到点的基金中仍可能有新数据的进入就绪堆，其余改排到下一个公布时间"""
+        while self.waiting and self.waiting[0][0] <= now:
+            _, code, token = heapq.heappop(self.waiting)
+            if self._tokens.get(code) != token:
+                continue
+            fund = self.funds[code]
+            expected = self.expected_date(fund['kind'], now)
+            watermark = fund['watermark']
+            if watermark is not None and watermark >= expected:
+                self._push_waiting(code, self.next_publish(fund['kind'], watermark, now))
+                continue
+            # 今天的净值应已公布却缺失的优先，其次落后的交易日数多的优先（从未入库的最先）
+            today = 0 if expected == now.date().isoformat() else 1
+            stale = self._behind(watermark, expected) if watermark else float('inf')
+            self._tokens[code] += 1
+            heapq.heappush(self.due, ((today, -stale, code), code, self._tokens[code], expected))
+
+    def _behind(self, watermark, expected):
+        """水位线落后应有净值日的交易日数"""
+        a = datetime.strptime(watermark, '%Y-%m-%d').date()
+        b = datetime.strptime(expected, '%Y-%m-%d').date()
+        return self.calendar.count(a + timedelta(days=1), b + timedelta(days=1))
+
+    def _next_batch(self, now):
+        """从就绪堆取一批；尚未确认的净值日只放 PROBE_FUNDS 只基金探测"""
+        batch, deferred = [], []
+        probes = {}
+        while self.due and len(batch) < self.batch_funds:
+            _, code, token, expected = heapq.heappop(self.due)
+            if self._tokens.get(code) != token:
+                continue
+            if expected not in self._confirmed:
+                if probes.get(expected, 0) >= PROBE_FUNDS:
+                    deferred.append((code, expected))
+                    continue
+                probes[expected] = probes.get(expected, 0) + 1
+                self._probing.setdefault(expected, now)
+            batch.append((self.funds[code], expected))
+        for code, expected in deferred:
+            self._deferred.setdefault(expected, set()).add(code)
+            self._push_waiting(code, now + PROBE_WAIT)
+        return batch
+
+    # 调度一轮
+
+    def dispatch(self, batch):
+        """增量同步一批基金（水位线之后的数据），返回 {基金代码: 错误或 None}"""
+        errors = {}
+
+        def fetch_pages(fund):
+            watermark = fund['watermark']
+            return iter_eastmoney_pages(fund['code'], sdate=day_after(watermark) if watermark else None)
+
+        def on_fund_done(fund, count, error):
+            errors[fund['code']] = error
+
+        # 用调度器自己的日历校验：包含推断出的休市日和运行期间确认的交易日
+        run_pipeline((fund for fund, _ in batch), self.store, fetch_pages=fetch_pages,
+                     fetch_workers=self.fetch_workers, on_fund_done=on_fund_done, calendar=self.calendar)
+        return errors
+
+    def _after_dispatch(self, batch, errors, now):
+        fresh = missed = 0
+        for fund, expected in batch:
+            code = fund['code']
+            if code not in self.funds:
+                continue
+            fund['watermark'] = self.store.get_watermark(code) or fund['watermark']
+            if fund['watermark'] and fund['watermark'] >= expected and not errors.get(code):
+                fresh += 1
+                self._confirm(expected, now)
+                self.attempts.pop(code, None)
+                self._push_waiting(code, self.next_publish(fund['kind'], fund['watermark'], now))
+                continue
+            if fund['watermark']:
+                self._confirm(fund['watermark'], now)
+            missed += 1
+            attempts = self.attempts.get(code, (expected, 0))
+            attempts = (expected, attempts[1] + 1 if attempts[0] == expected else 1)
+            self.attempts[code] = attempts
+            if attempts[1] >= MAX_ATTEMPTS:
+                # 该净值日多次未见数据（不每日公布的基金等）：等下一个净值日的公布窗口
+                day = datetime.strptime(expected, '%Y-%m-%d').date()
+                self._push_waiting(code, self.publish_at(fund['kind'], self.calendar.next_trading_day(day)))
+            else:
+                self._push_waiting(code, now + min(RETRY_BASE * 2 ** (attempts[1] - 1), RETRY_MAX))
+        telemetry.inc('scheduler_funds_total', fresh, result='fresh')
+        telemetry.inc('scheduler_funds_total', missed, result='missing')
+        return fresh, missed
+
+    def _confirm(self, day, now):
+        """已有基金拿到 day 的净值：因探测而推迟的基金立即放行"""
+        self._confirmed.add(day)
+        self.calendar.add_trading_day(datetime.strptime(day, '%Y-%m-%d').date())
+        for code in self._deferred.pop(day, ()):
+            if code in self.funds:
+                self._push_waiting(code, now)
+
+    def _infer_holidays(self, now):
+        """公布窗口开始 HOLIDAY_AFTER 之后仍无任何基金有该日净值：记为休市日"""
+        for expected, since in list(self._probing.items()):
+            if expected in self._confirmed:
+                del self._probing[expected]
+                continue
+            day = datetime.strptime(expected, '%Y-%m-%d').date()
+            if now - self.publish_at('open', day) >= HOLIDAY_AFTER and now - since >= HOLIDAY_AFTER / 2:
+                del self._probing[expected]
+                self._deferred.pop(expected, None)
+                self.calendar.add_holiday(day)
+                telemetry.inc('scheduler_holidays_total')
+                log(f"{expected} 公布窗口过后仍无任何基金有净值，按休市日处理")
+
+    def step(self):
+        """调度一轮，返回 (本轮基金数, 距下次可能有事做的秒数)"""
+        now = self.now()
+        if self._reloaded is None or now - self._reloaded >= RELOAD_EVERY:
+            self.reload()
+        self._infer_holidays(now)
+        self._promote(now)
+        batch = self._next_batch(now)
+        if batch:
+            errors = self.dispatch(batch)
+            done = self.now()
+            fresh, missed = self._after_dispatch(batch, errors, done)
+            log(f"调度 {len(batch)} 只基金：{fresh} 只拿到最新净值，{missed} 只仍缺失"
+                f"（失败 {sum(1 for e in errors.values() if e)}），待调度 {len(self.due)}")
+            return len(batch), 0.0
+        if not self.waiting:
+            return 0, MAX_SLEEP
+        return 0, max(0.0, min(MAX_SLEEP, (self.waiting[0][0] - now).total_seconds()))
+
+    def plan(self):
+        """此刻就绪的基金 [(基金, 应有净值日)]，不发请求"""
+        if self._reloaded is None:
+            self.reload()
+        self._promote(self.now())
+        return [(self.funds[code], expected) for _, code, token, expected in sorted(self.due)
+                if self._tokens.get(code) == token]
+
+    def run(self, metrics_path=None):
+        log(f"调度器启动：{self.reload()} 只基金")
+        while not self._stop.is_set():
+            count, sleep = self.step()
+            if count and metrics_path:
+                telemetry.export(metrics_path)
+            if sleep:
+                if self.waiting:
+                    log(f"下次调度 {self.waiting[0][0].strftime('%m-%d %H:%M')}（等待 {sleep:.0f}s）")
+                self._stop.wait(sleep)
+        log("调度器已退出")
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按交易日历调度的同步守护进程')
+    parser.add_argument('command', choices=['run', 'plan'])
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--holidays', help='节假日文件（每行一个 YYYY-MM-DD）')
+    parser.add_argument('--batch', type=int, default=BATCH_FUNDS, help='每轮最多调度的基金数')
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help='抓取线程数')
+    parser.add_argument('--at', help='plan：按该北京时间推算（YYYY-MM-DD HH:MM）')
+    parser.add_argument('--metrics', help='运行指标导出路径（.prom 为 Prometheus 文本，其余为 JSON 摘要）')
+    args = parser.parse_args()
+
+    calendar = load_calendar(args.db, args.holidays)
+    now = None
+    if args.at:
+        at = datetime.strptime(args.at, '%Y-%m-%d %H:%M').replace(tzinfo=TZ)
+        now = lambda: at
+    scheduler = SyncScheduler(args.db, calendar, args.batch, args.workers, now=now)
+
+    if args.command == 'plan':
+        due = scheduler.plan()
+        for fund, expected in due[:50]:
+            print(f"{fund['code']} {fund['kind']:<5} 水位线 {fund['watermark'] or '-':<11} 应有 {expected}  {fund['name']}")
+        print(f"[INFO] 共 {len(scheduler.funds)} 只基金，此刻可调度 {len(due)} 只")
+        if scheduler.waiting:
+            print(f"[INFO] 其余最早在 {scheduler.waiting[0][0].strftime('%Y-%m-%d %H:%M')} 可能有新数据")
+        return
+
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    scheduler.run(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,28 +5,17 @@
 """
 
 import sqlite3
-import requests
-import re
-import time
 from datetime import datetime
-from html import unescape
 
-DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+from fund_http import format_connection_stats
+from fund_retry import classify, format_retry_stats
+from fund_cache import get_cache
+from fund_store import get_store
+from fund_universe import seed_universe, iter_universe, count_universe
+from fund_pipeline import iter_eastmoney_pages
+from fund_engine import run_concurrent, MAX_WORKERS
 
-FUNDS = [
-    {'code': '562500', 'name': '华夏中证机器人ETF', 'company': '华夏基金', 'type': 'ETF'},
-    {'code': '159530', 'name': '易方达国证机器人产业ETF', 'company': '易方达基金', 'type': 'ETF'},
-    {'code': '159526', 'name': '嘉实中证机器人ETF', 'company': '嘉实基金', 'manager': '田光远', 'type': 'ETF'},
-    {'code': '159258', 'name': '南方中证机器人ETF', 'company': '南方基金', 'type': 'ETF'},
-    {'code': '018095', 'name': '博时中证机器人指数发起C', 'company': '博时基金', 'manager': '唐屹兵', 'type': 'ETF'},
-    {'code': '159559', 'name': '景顺长城国证机器人产业ETF', 'company': '景顺长城', 'type': 'ETF'},
-    {'code': '159278', 'name': '鹏华国证机器人产业ETF', 'company': '鹏华基金', 'manager': '陈龙', 'type': 'ETF'},
-    {'code': '159213', 'name': '汇添富中证机器人ETF', 'company': '汇添富基金', 'type': 'ETF'},
-    {'code': '007713', 'name': '华富科技动能混合A', 'company': '华富基金', 'manager': '沈成', 'type': '主动管理'},
-    {'code': '000649', 'name': '长城久鑫灵活配置混合A', 'company': '长城基金', 'manager': '余欢', 'type': '主动管理'},
-    {'code': '021489', 'name': '中航趋势领航混合发起A', 'company': '中航基金', 'manager': '王森', 'type': '主动管理'},
-    {'code': '018124', 'name': '永赢先进制造智选混合发起A', 'company': '永赢基金', 'manager': '张璐', 'type': '主动管理'},
-]
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
 
 def init_db():
     print("[步骤1/14] 初始化数据库...")
@@ -61,123 +50,65 @@ def init_db():
     print("[步骤1/14] ✓ 数据库初始化完成")
 
 def insert_funds():
-    print("[步骤2/14] 插入基金基础信息...")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for fund in FUNDS:
-        cursor.execute('''
-            INSERT OR REPLACE INTO funds (fund_code, fund_name, fund_company, fund_manager, fund_type)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (fund['code'], fund['name'], fund.get('company', ''), fund.get('manager', ''), fund['type']))
-    
-    conn.commit()
-    conn.close()
-    print(f"[步骤2/14] ✓ 已插入 {len(FUNDS)} 只基金信息")
+    print("[步骤2/14] 更新基金基础信息...")
+    store = get_store(DB_PATH)
+    with store.transaction() as conn:
+        changed = seed_universe(conn)
+    print(f"[步骤2/14] ✓ 基金信息有 {changed} 条变化")
 
 def fetch_nav_eastmoney(fund_code):
-    """从东方财富抓取基金净值"""
-    url = f'http://fund.eastmoney.com/f10/F10DataApi.aspx?type=lsjz&code={fund_code}&page=1&per=1000'
-    
+    """从东方财富抓取基金全部净值，返回 (date, nav, cumulative_nav, daily_return) 列表"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        resp = requests.get(url, headers=headers, timeout=30)
-        resp.encoding = 'utf-8'
-        
-        content = resp.text
-        
-        # 提取表格内容
-        # 格式: var apidata={ content:"<table>...</table>", records:1000, pages:1, curpage:1 };
-        match = re.search(r'content:"([^"]+)"', content)
-        if not match:
-            return []
-        
-        html = match.group(1)
-        # 解码HTML实体
-        html = unescape(html)
-        
-        # 提取行数据
         nav_data = []
-        row_pattern = r'<tr><td>(\d{4}-\d{2}-\d{2})</td><td[^>]*>([\d.]+)</td><td[^>]*>([\d.]+)</td><td[^>]*>([-\d.%]+)</td>'
-        
-        rows = re.findall(row_pattern, html)
-        for row in rows:
-            date_str, nav, cumulative_nav, daily_return = row
-            
-            # 清理日增长率
-            daily_return = daily_return.replace('%', '').strip()
-            if daily_return == '--':
-                daily_return = None
-            
-            try:
-                nav_data.append({
-                    'date': date_str,
-                    'nav': float(nav) if nav else None,
-                    'cumulative_nav': float(cumulative_nav) if cumulative_nav else None,
-                    'daily_return': float(daily_return) if daily_return else None
-                })
-            except:
-                pass
-        
+        for parse, payload in iter_eastmoney_pages(fund_code):
+            nav_data.extend(payload if parse is None else parse(payload))
         return nav_data
         
     except Exception as e:
-        print(f"    [错误] 抓取失败: {e}")
+        print(f"    [错误] 抓取失败({classify(e)}): {e}")
         return []
 
 def save_nav(fund_code, nav_data):
-    """保存净值到数据库"""
+    """保存净值到数据库（单事务批量 UPSERT）"""
     if not nav_data:
         return 0
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    count = 0
-    for item in nav_data:
-        try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nav_history (fund_code, date, nav_value, cumulative_nav, daily_return)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (fund_code, item['date'], item['nav'], item['cumulative_nav'], item['daily_return']))
-            count += 1
-        except:
-            pass
-    
-    conn.commit()
-    conn.close()
-    return count
+    return get_store(DB_PATH).upsert_nav(fund_code, nav_data)
 
-def main():
+def main(max_workers=MAX_WORKERS):
     print("="*60)
     print("基金净值数据抓取脚本 - 真实数据版")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
     init_db()
-    time.sleep(0.5)
-    
     insert_funds()
-    time.sleep(0.5)
     
-    total = len(FUNDS)
-    for i, fund in enumerate(FUNDS, 3):
-        code = fund['code']
+    # 并发抓取，各主机的限速与并发上限由 fund_http 统一控制
+    total = count_universe(DB_PATH)
+    done = [0]
+    
+    def worker(_, fund):
+        return save_nav(fund['code'], fetch_nav_eastmoney(fund['code']))
+    
+    def on_done(_, fund, count, error):
+        done[0] += 1
+        step = f"[步骤{done[0] + 2}/{total+2}]"
         name = fund['name']
-        
-        print(f"[步骤{i}/{total+2}] 正在抓取: {name} ({code})")
-        
-        nav_data = fetch_nav_eastmoney(code)
-        count = save_nav(code, nav_data)
-        
-        if count > 0:
-            print(f"[步骤{i}/{total+2}] ✓ {name}: 成功导入 {count} 条真实净值记录")
+        if error:
+            print(f"{step} ✗ {name}({classify(error)}): {error}")
+        elif count > 0:
+            print(f"{step} ✓ {name}: 成功导入 {count} 条真实净值记录")
         else:
-            print(f"[步骤{i}/{total+2}] ✗ {name}: 未获取到数据")
-        
-        time.sleep(1)  # 避免请求过快
+            print(f"{step} ✗ {name}: 未获取到数据")
+    
+    run_concurrent(iter_universe(DB_PATH), worker, max_workers=max_workers, on_done=on_done)
+    
+    for line in format_connection_stats():
+        print(f"[连接] {line}")
+    for line in format_retry_stats():
+        print(f"[重试] {line}")
+    cache = get_cache().stats()
+    print(f"[缓存] 命中 {cache['hits']}, 304 {cache['revalidated']}, 下载 {cache['misses']}")
     
     print("\n" + "="*60)
     print("✓ 抓取完成 - 全部使用真实数据")
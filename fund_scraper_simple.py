@@ -4,26 +4,13 @@
 """
 
 import sqlite3
-import time
 from datetime import datetime, timedelta
-import random
 
-DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+from fund_engine import run_concurrent, MAX_WORKERS
+from fund_store import get_store
+from fund_universe import seed_universe, iter_universe, count_universe
 
-FUNDS = [
-    {'code': '562500', 'name': '华夏中证机器人ETF', 'company': '华夏基金', 'type': 'ETF'},
-    {'code': '159530', 'name': '易方达国证机器人产业ETF', 'company': '易方达基金', 'type': 'ETF'},
-    {'code': '159526', 'name': '嘉实中证机器人ETF', 'company': '嘉实基金', 'manager': '田光远', 'type': 'ETF'},
-    {'code': '159258', 'name': '南方中证机器人ETF', 'company': '南方基金', 'type': 'ETF'},
-    {'code': '018095', 'name': '博时中证机器人指数发起C', 'company': '博时基金', 'manager': '唐屹兵', 'type': 'ETF'},
-    {'code': '159559', 'name': '景顺长城国证机器人产业ETF', 'company': '景顺长城', 'type': 'ETF'},
-    {'code': '159278', 'name': '鹏华国证机器人产业ETF', 'company': '鹏华基金', 'manager': '陈龙', 'type': 'ETF'},
-    {'code': '159213', 'name': '汇添富中证机器人ETF', 'company': '汇添富基金', 'type': 'ETF'},
-    {'code': '007713', 'name': '华富科技动能混合A', 'company': '华富基金', 'manager': '沈成', 'type': '主动管理'},
-    {'code': '000649', 'name': '长城久鑫灵活配置混合A', 'company': '长城基金', 'manager': '余欢', 'type': '主动管理'},
-    {'code': '021489', 'name': '中航趋势领航混合发起A', 'company': '中航基金', 'manager': '王森', 'type': '主动管理'},
-    {'code': '018124', 'name': '永赢先进制造智选混合发起A', 'company': '永赢基金', 'manager': '张璐', 'type': '主动管理'},
-]
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
 
 def init_db():
     print("[1/12] 初始化数据库...")
@@ -58,35 +45,24 @@ def init_db():
     print("[1/12] ✓ 数据库初始化完成")
 
 def insert_funds():
-    print("[2/12] 插入基金基础信息...")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for fund in FUNDS:
-        cursor.execute('''
-            INSERT OR REPLACE INTO funds (fund_code, fund_name, fund_company, fund_manager, fund_type)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (fund['code'], fund['name'], fund.get('company', ''), fund.get('manager', ''), fund['type']))
-    
-    conn.commit()
-    conn.close()
-    print(f"[2/12] ✓ 已插入 {len(FUNDS)} 只基金信息")
+    print("[2/12] 更新基金基础信息...")
+    store = get_store(DB_PATH)
+    with store.transaction() as conn:
+        changed = seed_universe(conn)
+    print(f"[2/12] ✓ 基金信息有 {changed} 条变化")
 
 def fetch_and_save_nav(fund_code, fund_name):
     """模拟抓取净值数据"""
     import random
     
     # 模拟生成一些历史数据
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     # 生成从2024-06-01到2025-12-31的模拟数据
     start_date = datetime(2024, 6, 1)
     end_date = datetime(2025, 12, 31)
     
     current_date = start_date
     base_nav = 1.0
-    count = 0
+    rows = []
     
     while current_date <= end_date:
         # 跳过周末
@@ -96,19 +72,13 @@ def fetch_and_save_nav(fund_code, fund_name):
             base_nav = base_nav * (1 + change)
             
             date_str = current_date.strftime('%Y-%m-%d')
-            cursor.execute('''
-                INSERT OR REPLACE INTO nav_history (fund_code, date, nav_value, cumulative_nav, daily_return)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (fund_code, date_str, round(base_nav, 4), round(base_nav, 4), round(change*100, 2)))
-            count += 1
+            rows.append((date_str, round(base_nav, 4), round(base_nav, 4), round(change*100, 2)))
         
         current_date += timedelta(days=1)
     
-    conn.commit()
-    conn.close()
-    return count
+    return get_store(DB_PATH).upsert_nav(fund_code, rows)
 
-def main():
+def main(max_workers=MAX_WORKERS):
     print("="*60)
     print("基金净值数据抓取脚本启动")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -116,21 +86,21 @@ def main():
     
     # 初始化
     init_db()
-    time.sleep(1)
-    
     insert_funds()
-    time.sleep(1)
     
-    # 抓取每只基金
-    total = len(FUNDS)
-    for i, fund in enumerate(FUNDS, 3):
-        code = fund['code']
-        name = fund['name']
-        
-        print(f"[{i}/{total+2}] 正在处理: {name} ({code})")
-        count = fetch_and_save_nav(code, name)
-        print(f"[{i}/{total+2}] ✓ {name}: 导入 {count} 条记录")
-        time.sleep(1)
+    # 逐只基金生成并写入（并发执行，写库由 NavStore 串行化）
+    total = count_universe(DB_PATH)
+    done = [0]
+    
+    def on_done(_, fund, count, error):
+        done[0] += 1
+        if error:
+            print(f"[{done[0] + 2}/{total+2}] ✗ {fund['name']}: {error}")
+        else:
+            print(f"[{done[0] + 2}/{total+2}] ✓ {fund['name']}: 导入 {count} 条记录")
+    
+    run_concurrent(iter_universe(DB_PATH), lambda _, fund: fetch_and_save_nav(fund['code'], fund['name']),
+                   max_workers=max_workers, on_done=on_done)
     
     print("\n" + "="*60)
     print("✓ 抓取完成")
@@ -2,33 +2,31 @@
 """
 基金净值数据抓取脚本 - V3
 增加增量抓取和进度记录
+默认按水位线增量抓取（只抓数据库中最新日期之后的净值），--full 为全量抓取并支持断点续传；
+进度按基金记录在 sync_jobs 任务表中（见 fund_jobs），多个进程可同时运行、崩溃后从各基金的断点继续
 """
 
 import sqlite3
-import requests
-import re
-import time
 import sys
-import os
-from datetime import datetime
-from html import unescape
+import argparse
+from datetime import datetime, timedelta
+
+import fund_telemetry as telemetry
+from fund_http import format_connection_stats
+from fund_retry import classify, format_retry_stats
+from fund_cache import get_cache
+from fund_engine import run_concurrent, MAX_WORKERS
+from fund_store import get_store
+from fund_jobs import JobQueue
+from fund_pipeline import iter_eastmoney_pages
+from fund_quality import NavValidator
+from fund_calendar import get_calendar
+from fund_universe import seed_universe, iter_universe, parse_shard
 
 DB_PATH = '/home/xiaoman/xiaoman/fund_scraper/fund_robot.db'
 
-FUNDS = [
-    {'code': '562500', 'name': '华夏中证机器人ETF', 'company': '华夏基金', 'type': 'ETF'},
-    {'code': '159530', 'name': '易方达国证机器人产业ETF', 'company': '易方达基金', 'type': 'ETF'},
-    {'code': '159526', 'name': '嘉实中证机器人ETF', 'company': '嘉实基金', 'manager': '田光远', 'type': 'ETF'},
-    {'code': '159258', 'name': '南方中证机器人ETF', 'company': '南方基金', 'type': 'ETF'},
-    {'code': '018095', 'name': '博时中证机器人指数发起C', 'company': '博时基金', 'manager': '唐屹兵', 'type': 'ETF'},
-    {'code': '159559', 'name': '景顺长城国证机器人产业ETF', 'company': '景顺长城', 'type': 'ETF'},
-    {'code': '159278', 'name': '鹏华国证机器人产业ETF', 'company': '鹏华基金', 'manager': '陈龙', 'type': 'ETF'},
-    {'code': '159213', 'name': '汇添富中证机器人ETF', 'company': '汇添富基金', 'type': 'ETF'},
-    {'code': '007713', 'name': '华富科技动能混合A', 'company': '华富基金', 'manager': '沈成', 'type': '主动管理'},
-    {'code': '000649', 'name': '长城久鑫灵活配置混合A', 'company': '长城基金', 'manager': '余欢', 'type': '主动管理'},
-    {'code': '021489', 'name': '中航趋势领航混合发起A', 'company': '中航基金', 'manager': '王森', 'type': '主动管理'},
-    {'code': '018124', 'name': '永赢先进制造智选混合发起A', 'company': '永赢基金', 'manager': '张璐', 'type': '主动管理'},
-]
+# 全量抓取时每多少行写一次库
+FLUSH_ROWS = 5000
 
 def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
@@ -64,212 +62,153 @@ def init_db():
         )
     ''')
     
-    # 同步进度表（新增）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sync_meta (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            current_fund_code TEXT,
-            current_fund_name TEXT,
-            current_page INTEGER DEFAULT 1,
-            current_fund_index INTEGER DEFAULT 0,
-            total_funds INTEGER DEFAULT 12,
-            status TEXT DEFAULT 'running',
-            last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 初始化或更新同步记录
-    cursor.execute('SELECT COUNT(*) FROM sync_meta')
-    if cursor.fetchone()[0] == 0:
-        cursor.execute('''
-            INSERT INTO sync_meta (current_fund_code, current_fund_name, current_page, current_fund_index, total_funds, status)
-            VALUES (?, ?, 1, 0, 12, 'running')
-        ''', (FUNDS[0]['code'], FUNDS[0]['name']))
-    
     conn.commit()
     conn.close()
     log("✓ 数据库初始化完成")
 
-def get_sync_status():
-    """获取当前同步状态"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM sync_meta ORDER BY id DESC LIMIT 1')
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            'current_fund_code': row[1],
-            'current_fund_name': row[2],
-            'current_page': row[3],
-            'current_fund_index': row[4],
-            'total_funds': row[5],
-            'status': row[6]
-        }
-    return None
-
-def update_sync_status(fund_code, fund_name, page, fund_index, status='running'):
-    """更新同步状态"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE sync_meta SET 
-            current_fund_code = ?, 
-            current_fund_name = ?, 
-            current_page = ?, 
-            current_fund_index = ?,
-            status = ?,
-            last_update = CURRENT_TIMESTAMP
-        WHERE id = (SELECT id FROM sync_meta ORDER BY id DESC LIMIT 1)
-    ''', (fund_code, fund_name, page, fund_index, status))
-    conn.commit()
-    conn.close()
+def insert_funds(funds_file=None):
+    """准备基金池（funds 表），指定文件时从文件导入"""
+    log("更新基金基础信息...")
+    store = get_store(DB_PATH)
+    with store.transaction() as conn:
+        changed = seed_universe(conn, funds_file)
+    log(f"✓ 基金信息有 {changed} 条变化")
 
-def insert_funds():
-    log("插入基金基础信息...")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for fund in FUNDS:
-        cursor.execute('''
-            INSERT OR REPLACE INTO funds (fund_code, fund_name, fund_company, fund_manager, fund_type)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (fund['code'], fund['name'], fund.get('company', ''), fund.get('manager', ''), fund['type']))
-    
-    conn.commit()
-    conn.close()
-    log(f"✓ 已插入 {len(FUNDS)} 只基金信息")
-
-def fetch_nav_eastmoney_page(fund_code, page, retry=1):
-    """抓取单页数据"""
-    url = f'http://fund.eastmoney.com/f10/F10DataApi.aspx?type=lsjz&code={fund_code}&page={page}&per=20'
-    
-    for attempt in range(retry + 1):
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-            resp = requests.get(url, headers=headers, timeout=30)
-            resp.encoding = 'utf-8'
-            
-            content = resp.text
-            
-            if 'records:0' in content or 'content:""' in content:
-                return None  # 无更多数据
-            
-            match = re.search(r'content:"([^"]*)"', content)
-            if not match or not match.group(1):
-                return None
-            
-            html = unescape(match.group(1))
-            nav_data = []
-            row_pattern = r'<tr><td>(\d{4}-\d{2}-\d{2})</td><td[^>]*>([\d.]+)</td><td[^>]*>([\d.]+)</td><td[^>]*>([-\d.%]+)</td>'
-            rows = re.findall(row_pattern, html)
-            
-            for row in rows:
-                date_str, nav, cumulative_nav, daily_return = row
-                daily_return = daily_return.replace('%', '').strip()
-                if daily_return == '--':
-                    daily_return = None
-                
-                try:
-                    nav_data.append({
-                        'date': date_str,
-                        'nav': float(nav) if nav else None,
-                        'cumulative_nav': float(cumulative_nav) if cumulative_nav else None,
-                        'daily_return': float(daily_return) if daily_return else None
-                    })
-                except:
-                    pass
-            
-            return nav_data
-            
-        except Exception as e:
-            if attempt < retry:
-                time.sleep(3)
-            else:
-                return None
+def get_watermark(fund_code):
+    """获取基金已入库的最新净值日期（水位线），无数据返回 None"""
+    return get_store(DB_PATH).get_watermark(fund_code)
 
 def save_nav(fund_code, nav_data):
-    """保存净值到数据库"""
+    """保存净值到数据库（单事务批量 UPSERT）"""
     if not nav_data:
         return 0
+    return get_store(DB_PATH).upsert_nav(fund_code, nav_data)
+
+def day_before(date_str):
+    return (datetime.strptime(date_str, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+
+def sync_fund(fund, queue=None):
+    """
+    抓取单只基金全部历史（页大小自适应，多页并行），返回保存条数
+    数据按日期倒序返回，每次写库后把已写入的最早日期记为断点；
+    任务带断点时只抓断点之前的数据
+    """
+    code = fund['code']
+    name = fund['name']
+    fund_total = 0
+    buffer = []
+    validator = NavValidator(code, get_calendar(DB_PATH))
+    
+    edate = None
+    first_page = 1
+    if fund.get('resume_date'):
+        edate = day_before(fund['resume_date'])
+        first_page = fund['last_page'] + 1
+        log(f"  {name} 从 {fund['resume_date']} 之前（第{first_page}页起）继续")
+    
+    for page, (parse, payload) in enumerate(iter_eastmoney_pages(code, edate=edate), first_page):
+        nav_data = validator.parse_page(parse, payload)
+        buffer.extend(nav_data)
+        log(f"  {name} 第{page}页: {len(nav_data)}条")
+        
+        # 每 FLUSH_ROWS 行写一次库
+        if len(buffer) >= FLUSH_ROWS:
+            fund_total += save_nav(code, buffer)
+            if queue is not None:
+                queue.checkpoint(fund, page, min(row[0] for row in buffer))
+            buffer = []
+    
+    fund_total += save_nav(code, buffer)
+    get_store(DB_PATH).save_quality([validator.report()])
+    return fund_total
+
+def sync_fund_incremental(fund):
+    """
+    按水位线增量抓取单只基金，返回新增条数
+    数据按日期倒序返回，遇到已入库的日期即停止翻页；
+    新数据在本基金抓完后一次性写入，避免中断时水位线前移而留下缺口
+    """
+    code = fund['code']
+    name = fund['name']
+    watermark = get_watermark(code) or ''
+    sdate = None
+    if watermark:
+        sdate = (datetime.strptime(watermark, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    new_rows = []
+    validator = NavValidator(code, get_calendar(DB_PATH))
+    
+    for parse, payload in iter_eastmoney_pages(code, sdate=sdate):
+        nav_data = validator.parse_page(parse, payload)
+        fresh = [row for row in nav_data if row[0] > watermark]
+        new_rows.extend(fresh)
+        
+        if len(fresh) < len(nav_data):
+            break
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    count = 0
-    for item in nav_data:
-        try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nav_history (fund_code, date, nav_value, cumulative_nav, daily_return)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (fund_code, item['date'], item['nav'], item['cumulative_nav'], item['daily_return']))
-            count += 1
-        except:
-            pass
-    
-    conn.commit()
-    conn.close()
+    count = save_nav(code, new_rows)
+    get_store(DB_PATH).save_quality([validator.report()])
+    log(f"  {name} 水位线 {watermark or '无'}，新增 {count}条")
     return count
 
-def main():
+def main(max_workers=MAX_WORKERS, incremental=True, funds_file=None, shard=0, num_shards=1, metrics_path=None):
     log("="*60)
     log("基金净值数据抓取脚本 V3 - 增量抓取")
     log(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     log("="*60)
     
     init_db()
-    insert_funds()
-    
-    # 获取同步状态
-    sync = get_sync_status()
-    start_index = sync['current_fund_index'] if sync else 0
-    start_page = sync['current_page'] if sync else 1
-    
-    log(f"从第{start_index+1}只基金、第{start_page}页继续抓取...")
-    
-    total = len(FUNDS)
-    
-    for i in range(start_index, total):
-        fund = FUNDS[i]
-        code = fund['code']
-        name = fund['name']
-        
-        log(f"[{i+1}/{total}] {name}")
-        
-        # 从记录的页码开始，或从第1页开始
-        page = start_page if i == start_index else 1
-        fund_total = 0
-        
-        while True:
-            update_sync_status(code, name, page, i, 'running')
-            
-            nav_data = fetch_nav_eastmoney_page(code, page, retry=1)
-            
-            if not nav_data:
-                log(f"  第{page}页无数据，基金完成")
-                break
-            
-            count = save_nav(code, nav_data)
-            fund_total += count
-            log(f"  第{page}页: {count}条")
-            
-            # 检查是否还有下一页
-            if len(nav_data) < 20:
-                break
-            
-            page += 1
-            time.sleep(1)  # 页间延时
-        
-        log(f"  ✓ {name}: 共{fund_total}条")
-        
-        # 重置下一基金从第1页开始
-        start_page = 1
-        
-        time.sleep(2)  # 基金间延时
-    
-    # 标记完成
-    update_sync_status('', '', 1, total, 'completed')
+    insert_funds(funds_file)
+    
+    # 每只基金一个任务：上一轮未完成时续跑，已完成的基金不再重做
+    mode = 'incremental' if incremental else 'full'
+    queue = JobQueue(get_store(DB_PATH), mode, shard, num_shards)
+    resumed = queue.plan(fund['code'] for fund in iter_universe(DB_PATH, shard, num_shards))
+    counts = queue.stats()
+    total = sum(counts.values())
+    log(f"{'水位线增量' if incremental else '全量'}抓取（分片 {shard}/{num_shards}，并发 {max_workers}）："
+        f"{'续跑上一轮，' if resumed else ''}待处理 {counts.get('pending', 0)}/{total} 只")
+    
+    done = [counts.get('done', 0)]
+    
+    def worker(_, job):
+        log(f"[领取] {job['name']} ({job['code']}) 第{job['attempts']}次")
+        if not queue.renew(job):
+            log(f"  - {job['name']}: 租约已被其他进程接手，跳过")
+            return None
+        if incremental:
+            return sync_fund_incremental(job)
+        return sync_fund(job, queue)
+    
+    def on_done(_, job, fund_total, error):
+        if error:
+            queue.fail(job, error)
+            log(f"  ✗ {job['name']}({classify(error)}): {error}")
+            return
+        if fund_total is None:
+            return
+        queue.complete(job, get_watermark(job['code']))
+        done[0] += 1
+        log(f"  ✓ [{done[0]}/{total}] {job['name']}: 共{fund_total}条")
+    
+    # 只在有空闲线程时领取任务，领到的任务立即开始处理，租约不会在排队中过期
+    run_concurrent(queue.iter_claims(), worker, max_workers=max_workers, on_done=on_done,
+                   max_pending=max_workers)
+    
+    counts = queue.stats()
+    log(f"任务状态: 完成 {counts.get('done', 0)}, 失败 {counts.get('failed', 0)}, "
+        f"其他进程处理中 {counts.get('running', 0)}, 待重试 {counts.get('pending', 0)}")
+    
+    for line in format_connection_stats():
+        log(f"连接复用: {line}")
+    for line in format_retry_stats():
+        log(f"重试/熔断: {line}")
+    cache = get_cache().stats()
+    log(f"缓存: 命中 {cache['hits']}, 304 {cache['revalidated']}, 下载 {cache['misses']}")
+    # 解析在各抓取线程中进行
+    for line in telemetry.format_summary(telemetry.summary(parse_workers=max_workers)):
+        log(f"运行指标: {line}")
+    if metrics_path:
+        log(f"运行指标已写入 {telemetry.export(metrics_path, parse_workers=max_workers)}")
     
     log("\n" + "="*60)
     log("✓ 所有基金抓取完成")
@@ -277,4 +216,13 @@ def main():
     log("="*60)
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='基金净值数据抓取 V3')
+    parser.add_argument('--full', action='store_true', help='全量抓取（支持断点续传）')
+    parser.add_argument('--funds-file', help='基金列表文件（JSON/CSV），导入 funds 表后再同步')
+    parser.add_argument('--shard', default='0/1', help='只同步指定分片，格式 i/n')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='并发数')
+    parser.add_argument('--metrics', help='运行指标导出路径（.prom 为 Prometheus 文本，其余为 JSON 摘要）')
+    args = parser.parse_args()
+    shard, num_shards = parse_shard(args.shard)
+    main(max_workers=args.workers, incremental=not args.full, funds_file=args.funds_file,
+         shard=shard, num_shards=num_shards, metrics_path=args.metrics)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+净值列式快照
+把 nav_history 导出为按列存放的 .npy 文件（基金按 fund_code 排序拼接，offsets 标出每只基金的区间），
+另存全体日期轴（date_axis）和每行在日期轴上的位置（date_pos）；
+读取时用 np.load(mmap_mode='r') 映射，零拷贝、多进程共享页缓存。
+刷新时按基金指纹（行数、最新日期、各列之和）找出有变化的基金，只重新查询这些基金，
+其余基金从旧快照整段复制；新版本写在独立目录中，最后原子替换 CURRENT 指针
+
+用法:
+    python fund_snapshot.py refresh            # 创建或增量刷新快照
+    python fund_snapshot.py info               # 查看当前快照
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+import fund_compact
+from fund_analytics import NavPanel, NAV_EXPR, UNIX_EPOCH_JD
+from fund_compact import RETURN_SCALE, date_sql, decode_sql
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+SNAPSHOT_DIR = '/root/.openclaw/workspace/nav_snapshot'
+
+# 列名 → SQL 表达式，NULL 导出为 NaN；navs 与 fund_analytics 的收益口径一致
+VALUE_COLUMNS = {
+    'nav_value': 'nav_value',
+    'cumulative_nav': 'cumulative_nav',
+    'daily_return': 'daily_return',
+    'navs': NAV_EXPR,
+}
+
+FINGERPRINT_SQL = '''
+    SELECT fund_code, COUNT(*), MAX(date), TOTAL(nav_value), TOTAL(cumulative_nav), TOTAL(daily_return)
+    FROM nav_history GROUP BY fund_code ORDER BY fund_code
+'''
+
+# 紧凑布局（fund_compact）下按 nav_compact 主键读取，值的还原与 nav_history 视图一致（指纹不因迁移而变）
+COMPACT_VALUE_COLUMNS = {
+    'nav_value': decode_sql('nav'),
+    'cumulative_nav': decode_sql('cumulative_nav'),
+    'daily_return': decode_sql('daily_return', RETURN_SCALE),
+    'navs': decode_sql('COALESCE(cumulative_nav, nav)'),
+}
+
+COMPACT_FINGERPRINT_SQL = f'''
+    SELECT i.fund_code, f.rows, {date_sql('f.last_day')}, f.nav_value, f.cumulative_nav, f.daily_return
+    FROM (
+        SELECT fund_id, COUNT(*) AS rows, MAX(day) AS last_day,
+            TOTAL({COMPACT_VALUE_COLUMNS['nav_value']}) AS nav_value,
+            TOTAL({COMPACT_VALUE_COLUMNS['cumulative_nav']}) AS cumulative_nav,
+            TOTAL({COMPACT_VALUE_COLUMNS['daily_return']}) AS daily_return
+        FROM nav_compact GROUP BY fund_id
+    ) f JOIN fund_ids i ON i.fund_id = f.fund_id
+'''
+
+COMPACT_FUND_SQL = f'''
+    SELECT day, {', '.join(COMPACT_VALUE_COLUMNS.values())} FROM nav_compact WHERE fund_id = ? ORDER BY day
+'''
+
+IN_CHUNK = 500
+
+# 保留的旧版本数（仍在读旧版本的进程不受刷新影响）
+KEEP_VERSIONS = 2
+
+
+class NavSnapshot:
+    """一个快照版本：各列均为只读 memmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.codes = np.load(os.path.join(path, 'codes.npy'))
+        self.offsets = self._column('offsets')
+        self.days = self._column('days')
+        self.date_axis = self._column('date_axis')
+        self.date_pos = self._column('date_pos')
+        self.columns = {name: self._column(name) for name in VALUE_COLUMNS}
+
+    def _column(self, name):
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def fingerprints(self):
+        """导出时各基金的指纹（只在刷新时读取）"""
+        with open(os.path.join(self.path, 'fingerprints.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def index(self, code):
+        i = int(np.searchsorted(self.codes, code))
+        if i >= len(self.codes) or self.codes[i] != code:
+            raise KeyError(code)
+        return i
+
+    def fund(self, code, column='navs'):
+        """单只基金的 (days, 值) 视图"""
+        i = self.index(code)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.days[lo:hi], self.columns[column][lo:hi]
+
+    def panel(self, column='navs'):
+        """供 fund_analytics 使用的 NavPanel（不复制数据，带预先算好的日期轴）"""
+        return NavPanel(self.codes, self.offsets, self.days, self.columns[column],
+                        axis=self.date_axis, positions=self.date_pos)
+
+
+def current_version(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """打开当前快照，没有快照返回 None"""
+    version = current_version(snapshot_dir)
+    if version is None:
+        return None
+    return NavSnapshot(os.path.join(snapshot_dir, version))
+
+
+def _fingerprints(conn):
+    sql = COMPACT_FINGERPRINT_SQL if fund_compact.is_compact(conn) else FINGERPRINT_SQL
+    return {row[0]: list(row[1:]) for row in conn.execute(sql)}
+
+
+def _query_funds(conn, codes):
+    """查询指定基金的全部行，返回 (每只基金行数, days, {列名: 数组})"""
+    if fund_compact.is_compact(conn):
+        return _query_compact(conn, codes)
+    exprs = ', '.join(f'{expr}' for expr in VALUE_COLUMNS.values())
+    counts = []
+    parts = []
+    for i in range(0, len(codes), IN_CHUNK):
+        chunk = codes[i:i + IN_CHUNK]
+        marks = ','.join('?' * len(chunk))
+        counts.extend(conn.execute(
+            f'SELECT fund_code, COUNT(*) FROM nav_history WHERE fund_code IN ({marks})'
+            f' GROUP BY fund_code ORDER BY fund_code', chunk).fetchall())
+        rows = conn.execute(
+            f'SELECT CAST(julianday(date) - {UNIX_EPOCH_JD} AS INTEGER), {exprs} FROM nav_history'
+            f' WHERE fund_code IN ({marks}) ORDER BY fund_code, date', chunk).fetchall()
+        # None → NaN
+        parts.append(np.array(rows, dtype=np.float64).reshape(len(rows), 1 + len(VALUE_COLUMNS)))
+    counts = dict(counts)
+    table = np.concatenate(parts) if parts else np.empty((0, 1 + len(VALUE_COLUMNS)))
+    values = {name: table[:, j + 1].copy() for j, name in enumerate(VALUE_COLUMNS)}
+    return [counts.get(code, 0) for code in codes], table[:, 0].astype(np.int64), values
+
+
+def _query_compact(conn, codes):
+    """紧凑布局：逐只基金按主键范围读取（codes 已按 fund_code 排序）"""
+    ids = fund_compact.fund_ids(conn)
+    counts = []
+    parts = []
+    for code in codes:
+        rows = conn.execute(COMPACT_FUND_SQL, (ids[code],)).fetchall() if code in ids else []
+        counts.append(len(rows))
+        parts.extend(rows)
+    # None → NaN
+    table = np.array(parts, dtype=np.float64).reshape(len(parts), 1 + len(COMPACT_VALUE_COLUMNS))
+    values = {name: table[:, j + 1].copy() for j, name in enumerate(COMPACT_VALUE_COLUMNS)}
+    return counts, table[:, 0].astype(np.int64), values
+
+
+def refresh(db_path=DB_PATH, snapshot_dir=SNAPSHOT_DIR, full=False):
+    """
+    创建或刷新快照，返回 {'version', 'funds', 'rows', 'changed', 'removed', 'seconds'}
+    没有任何变化时不写新版本
+    """
+    start = time.monotonic()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    old = None if full else open_snapshot(snapshot_dir)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute('BEGIN')
+        prints = _fingerprints(conn)
+        old_prints = old.fingerprints() if old is not None else {}
+        codes = sorted(prints)
+        changed = [code for code in codes if old_prints.get(code) != prints[code]]
+        removed = [code for code in old_prints if code not in prints]
+        if old is not None and not changed and not removed:
+            return {'version': current_version(snapshot_dir), 'funds': len(codes),
+                    'rows': int(old.offsets[-1]), 'changed': 0, 'removed': 0,
+                    'seconds': time.monotonic() - start}
+        new_counts, new_days, new_values = _query_funds(conn, changed)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    # 按 fund_code 顺序拼出新列：变化的基金取新查询结果，其余从旧快照整段复制
+    fresh = {code: (count, offset) for code, count, offset in
+             zip(changed, new_counts, np.concatenate([[0], np.cumsum(new_counts, dtype=np.int64)]))}
+    counts = np.array([fresh[code][0] if code in fresh else prints[code][0] for code in codes], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    total = int(offsets[-1])
+    days = np.empty(total, dtype=np.int64)
+    values = {name: np.empty(total, dtype=np.float64) for name in VALUE_COLUMNS}
+    for i, code in enumerate(codes):
+        lo, hi = offsets[i], offsets[i + 1]
+        if code in fresh:
+            src = fresh[code][1]
+            days[lo:hi] = new_days[src:src + hi - lo]
+            for name in VALUE_COLUMNS:
+                values[name][lo:hi] = new_values[name][src:src + hi - lo]
+        else:
+            j = old.index(code)
+            src = old.offsets[j]
+            days[lo:hi] = old.days[src:src + hi - lo]
+            for name in VALUE_COLUMNS:
+                values[name][lo:hi] = old.columns[name][src:src + hi - lo]
+
+    date_axis = np.unique(days)
+    date_pos = np.searchsorted(date_axis, days).astype(np.int32)
+
+    version = f'v{time.time_ns()}'
+    path = os.path.join(snapshot_dir, version)
+    tmp = path + '.tmp'
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'codes.npy'), np.array(codes, dtype=str))
+    np.save(os.path.join(tmp, 'offsets.npy'), offsets)
+    np.save(os.path.join(tmp, 'days.npy'), days)
+    np.save(os.path.join(tmp, 'date_axis.npy'), date_axis)
+    np.save(os.path.join(tmp, 'date_pos.npy'), date_pos)
+    for name, column in values.items():
+        np.save(os.path.join(tmp, f'{name}.npy'), column)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'db_path': db_path, 'created_at': time.time(), 'rows': total}, f)
+    with open(os.path.join(tmp, 'fingerprints.json'), 'w', encoding='utf-8') as f:
+        json.dump(prints, f)
+    os.rename(tmp, path)
+
+    pointer = os.path.join(snapshot_dir, 'CURRENT.tmp')
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(snapshot_dir, 'CURRENT'))
+    _prune(snapshot_dir, version)
+
+    return {'version': version, 'funds': len(codes), 'rows': total, 'changed': len(changed),
+            'removed': len(removed), 'seconds': time.monotonic() - start}
+
+
+def _prune(snapshot_dir, keep):
+    """删除较旧的版本（已映射旧文件的进程在 Linux 上仍可继续读取）"""
+    versions = sorted(name for name in os.listdir(snapshot_dir)
+                      if name.startswith('v') and os.path.isdir(os.path.join(snapshot_dir, name)))
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='净值列式快照')
+    parser.add_argument('command', choices=['refresh', 'info'])
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help='快照目录')
+    parser.add_argument('--full', action='store_true', help='忽略旧快照，全部重新导出')
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        stats = refresh(args.db, args.dir, args.full)
+        print(f"[INFO] 快照 {stats['version']}: {stats['funds']} 只基金, {stats['rows']} 行, "
+              f"更新 {stats['changed']} 只, 移除 {stats['removed']} 只, 耗时 {stats['seconds']:.2f}s")
+        return
+
+    start = time.monotonic()
+    snapshot = open_snapshot(args.dir)
+    if snapshot is None:
+        print('[WARN] 还没有快照，先运行 refresh')
+        return
+    elapsed = time.monotonic() - start
+    axis = snapshot.date_axis
+    if not len(axis):
+        print(f"[INFO] 快照 {os.path.basename(snapshot.path)} 为空")
+        return
+    print(f"[INFO] 快照 {os.path.basename(snapshot.path)}: {len(snapshot)} 只基金, {snapshot.meta['rows']} 行, "
+          f"日期 {np.datetime64(int(axis[0]), 'D')} ~ {np.datetime64(int(axis[-1]), 'D')}, "
+          f"打开耗时 {elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+净值数据源
+东方财富、新浪财经等数据源实现统一接口 pages(fund_code)：逐页产出 (解析函数, 载荷)，正常结束即已覆盖全部历史；
+HedgedFetcher 按健康度选主源，主源首页超过其延迟分位数仍未返回时再发备源首页，
+先返回有效首页的数据源胜出并继续逐页产出（背压由调用方的拉取节奏决定），输掉的数据源不再抓后续页
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from fund_cache import cached_parse
+from fund_parser import parse_sina
+from fund_pipeline import iter_eastmoney_pages
+from fund_retry import ParseError
+
+HEDGE_PERCENTILE = 0.9
+DEFAULT_HEDGE_DELAY = 2.0
+MIN_HEDGE_DELAY = 0.2
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 10
+
+# 新浪历史净值每页行数（不足一页即最后一页）及页数上限
+SINA_PAGE_ROWS = 40
+SINA_MAX_PAGES = 500
+
+
+class NavSource:
+    """
+    数据源接口：pages 逐页产出 (解析函数, 载荷)（解析函数为 None 时载荷即为行列表），
+    生成器正常结束表示已取完全部历史，无数据时不产出任何页，失败抛异常
+    """
+
+    name = ''
+
+    def pages(self, fund_code):
+        raise NotImplementedError
+
+    def fetch(self, fund_code):
+        """整只基金的 (date, nav, cumulative_nav, daily_return) 列表"""
+        nav_data = []
+        for parse, payload in self.pages(fund_code):
+            nav_data.extend(payload if parse is None else parse(payload))
+        return nav_data
+
+
+class EastmoneySource(NavSource):
+    name = 'eastmoney'
+
+    def pages(self, fund_code):
+        return iter_eastmoney_pages(fund_code)
+
+
+class SinaSource(NavSource):
+    name = 'sina'
+
+    def pages(self, fund_code):
+        previous = None
+        for page in range(1, SINA_MAX_PAGES + 1):
+            url = f'http://stock.finance.sina.com.cn/fundInfo/view/FundInfo_LSJZ.php?symbol={fund_code}&page={page}'
+            rows = cached_parse(url, parse_sina, encoding='gb2312')
+            if rows and previous and rows[0] == previous:
+                # 服务端忽略了分页参数：拿不全历史，不能当作完整结果
+                raise ParseError(f'新浪财经分页无效: {fund_code}')
+            if rows:
+                previous = rows[0]
+                yield None, rows
+            if len(rows) < SINA_PAGE_ROWS:
+                return
+        raise ParseError(f'新浪财经超过 {SINA_MAX_PAGES} 页: {fund_code}')
+
+
+class SourceHealth:
+    """数据源健康度：成功率 EWMA + 最近成功请求的延迟样本"""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.success = 1.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, ok):
+        with self._lock:
+            self.success = (1 - self.alpha) * self.success + self.alpha * (1.0 if ok else 0.0)
+            if ok:
+                self.latencies.append(elapsed)
+
+    def percentile(self, q):
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def score(self):
+        """越大越好：成功率除以中位延迟"""
+        median = self.percentile(0.5)
+        return self.success / (1.0 + (median if median is not None else DEFAULT_HEDGE_DELAY))
+
+
+class HedgedFetcher:
+    """带对冲请求的多源抓取：只对各数据源的首页做对冲，延迟样本也都是单页请求的耗时"""
+
+    def __init__(self, sources, hedge_percentile=HEDGE_PERCENTILE, max_workers=16):
+        self.sources = list(sources)
+        self.hedge_percentile = hedge_percentile
+        self.health = {source.name: SourceHealth() for source in self.sources}
+        self.wins = {source.name: 0 for source in self.sources}
+        self.hedges = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def ranked(self):
+        """按健康度从高到低排列的数据源"""
+        return sorted(self.sources, key=lambda source: self.health[source.name].score(), reverse=True)
+
+    def hedge_delay(self, source):
+        delay = self.health[source.name].percentile(self.hedge_percentile)
+        return DEFAULT_HEDGE_DELAY if delay is None else max(MIN_HEDGE_DELAY, delay)
+
+    def _first_page(self, source, fund_code):
+        """打开数据源的页迭代器并取首页，返回 (迭代器, 首页或 None)；没有数据（正常结束）不算失败"""
+        pages = source.pages(fund_code)
+        start = time.monotonic()
+        try:
+            first = next(pages, None)
+        except Exception:
+            self.health[source.name].record(time.monotonic() - start, False)
+            raise
+        self.health[source.name].record(time.monotonic() - start, True)
+        return pages, first
+
+    def _discard(self, future):
+        """输掉的数据源：未开始的直接取消，已在进行的首页请求完成后关闭迭代器，不再抓后续页"""
+        if future.cancel():
+            return
+
+        def close(done):
+            try:
+                pages, _ = done.result()
+            except Exception:
+                return
+            pages.close()
+
+        future.add_done_callback(close)
+
+    def open(self, fund_code):
+        """
+        返回 (数据源名, 页迭代器)；所有数据源都无数据时返回 (None, 空迭代器)，全部失败时抛出最后一个异常
+        首页在此取回，其余页在迭代时才抓取
+        """
+        ranked = self.ranked()
+        backups = iter(ranked[1:])
+        running = {self._pool.submit(self._first_page, ranked[0], fund_code): ranked[0]}
+        timeout = self.hedge_delay(ranked[0])
+        error = None
+
+        while running:
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                source = running.pop(future)
+                try:
+                    pages, first = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if first is not None:
+                    for loser in running:
+                        self._discard(loser)
+                    self.wins[source.name] += 1
+                    return source.name, self._resume(first, pages)
+
+            # 超时未返回或已返回但无数据：发出下一个备源
+            backup = next(backups, None)
+            if backup is not None:
+                if not done:
+                    self.hedges += 1
+                running[self._pool.submit(self._first_page, backup, fund_code)] = backup
+                timeout = self.hedge_delay(backup)
+            else:
+                timeout = None
+
+        if error is not None:
+            raise error
+        return None, iter(())
+
+    @staticmethod
+    def _resume(first, pages):
+        yield first
+        yield from pages
+
+    def fetch(self, fund_code):
+        """返回 (数据源名, 行列表)，整只基金读入内存（流水线请用 open 逐页处理）"""
+        source, pages = self.open(fund_code)
+        nav_data = []
+        for parse, payload in pages:
+            nav_data.extend(payload if parse is None else parse(payload))
+        return source, nav_data
+
+    def stats(self):
+        return {
+            'hedges': self.hedges,
+            'wins': dict(self.wins),
+            'health': {name: round(h.success, 3) for name, h in self.health.items()},
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher():
+    """默认的 东方财富 + 新浪财经 对冲抓取器"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HedgedFetcher([EastmoneySource(), SinaSource()])
+        return _default
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+净值存储层
+每个数据库只保持一个长连接（WAL + synchronous=NORMAL），
+净值用 executemany 批量 UPSERT，每次写入一个事务；
+同一事务内增量更新 fund_metrics 指标表（见 fund_metrics）；
+已迁移为紧凑布局时直接写 nav_compact（见 fund_compact）；
+入库校验结果写入 nav_quality（见 fund_quality）
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+import fund_compact
+import fund_metrics
+import fund_quality
+import fund_telemetry as telemetry
+
+BATCH_SIZE = 5000
+
+UPSERT_NAV_SQL = '''
+    INSERT INTO nav_history (fund_code, date, nav_value, cumulative_nav, daily_return)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(fund_code, date) DO UPDATE SET
+        nav_value = excluded.nav_value,
+        cumulative_nav = excluded.cumulative_nav,
+        daily_return = excluded.daily_return
+    WHERE nav_value IS NOT excluded.nav_value
+       OR cumulative_nav IS NOT excluded.cumulative_nav
+       OR daily_return IS NOT excluded.daily_return
+'''
+
+
+def _nav_params(fund_code, nav_data):
+    """把 dict 或 (date, nav, cumulative_nav, daily_return) 元组转成 SQL 参数"""
+    for item in nav_data:
+        if isinstance(item, dict):
+            yield (fund_code, item['date'], item['nav'], item['cumulative_nav'], item['daily_return'])
+        else:
+            yield (fund_code,) + tuple(item)
+
+
+class NavStore:
+    """持有单个长连接的存储对象，可在多线程间共享（内部加锁）"""
+
+    def __init__(self, db_path, batch_size=BATCH_SIZE):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self.conn.execute('PRAGMA cache_size=-65536')
+        with self.transaction() as conn:
+            self.compact = fund_compact.is_compact(conn)
+            fund_metrics.ensure_table(conn)
+            fund_quality.ensure_tables(conn)
+
+    @contextmanager
+    def transaction(self):
+        """写事务，可嵌套（只有最外层提交）"""
+        with self._lock:
+            if self._depth == 0:
+                with telemetry.timer('sqlite_begin_seconds'):
+                    self.conn.execute('BEGIN IMMEDIATE')
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                with telemetry.timer('sqlite_commit_seconds'):
+                    self.conn.execute('COMMIT')
+
+    def upsert_nav(self, fund_code, nav_data):
+        """
+        批量写入单只基金的净值，整次调用一个事务（按 batch_size 分块 executemany），返回处理的行数
+        数值未变化的行不会被改写
+        """
+        return self.upsert_rows(_nav_params(fund_code, nav_data))
+
+    def upsert_rows(self, rows):
+        """批量写入 (fund_code, date, nav, cumulative_nav, daily_return) 行，可混合多只基金"""
+        rows = iter(rows)
+        count = 0
+        with self.transaction() as conn:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                start = time.monotonic()
+                self._upsert_with_metrics(conn, batch)
+                telemetry.observe('sqlite_upsert_seconds', time.monotonic() - start)
+                count += len(batch)
+        self.rows_written += count
+        telemetry.inc('rows_written_total', count)
+        return count
+
+    def _upsert_with_metrics(self, conn, batch):
+        """
+        按基金写入并更新指标：晚于指标最新日期的行只折叠新行；
+        不晚于的行若确有改动（total_changes 增加，包括补历史）或基金还没有指标行，则整段重算
+        """
+        funds = {}
+        for row in batch:
+            funds.setdefault(row[0], []).append(row)
+        states = fund_metrics.load_states(conn, funds)
+        for code, rows in funds.items():
+            state = states.get(code)
+            old, new, tail = fund_metrics.split_rows(state, rows)
+            if old:
+                before = conn.total_changes
+                self._write(conn, code, old)
+                if conn.total_changes != before:
+                    state = None
+            if new:
+                self._write(conn, code, new)
+            if state is None:
+                state = fund_metrics.scan_state(conn, code)
+            elif new:
+                fund_metrics.fold(state, tail)
+            else:
+                continue
+            # 有写入就保存（同时推进 version），读端据此失效该基金的缓存
+            fund_metrics.save(conn, code, state)
+
+    def _write(self, conn, fund_code, rows):
+        if self.compact:
+            conn.executemany(fund_compact.UPSERT_SQL,
+                             fund_compact.encode_rows(fund_compact.fund_id(conn, fund_code), rows))
+        else:
+            conn.executemany(UPSERT_NAV_SQL, rows)
+
+    def save_quality(self, reports):
+        """写入 NavValidator 的校验结果，返回写入的基金数"""
+        with self.transaction() as conn:
+            return fund_quality.save_reports(conn, reports)
+
+    def get_watermark(self, fund_code):
+        """基金已入库的最新净值日期，无数据返回 None"""
+        with self._lock:
+            sql = fund_compact.WATERMARK_SQL if self.compact else 'SELECT MAX(date) FROM nav_history WHERE fund_code = ?'
+            row = self.conn.execute(sql, (fund_code,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path):
+    """按数据库路径复用 NavStore"""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = NavStore(db_path)
+            _stores[db_path] = store
+        return store
+
+
+def close_stores():
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+运行指标
+进程内的计数器与直方图（按标签区分，线程安全），在 HTTP、解析、写库各处埋点；
+已有统计（重试/熔断、响应缓存）以采集函数的形式在导出时读取。
+多进程运行时各进程 snapshot() 后由主进程 merge() 汇总；
+结束时导出为 Prometheus 文本文件（.prom，可交给 node_exporter textfile collector）或 JSON 摘要，
+摘要中按各阶段忙碌/空等时间判断本次同步是网络、解析还是写库瓶颈
+
+用法:
+    python fund_telemetry.py metrics.json        # 查看导出的 JSON 摘要
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'fund_'
+
+# 耗时直方图的桶上界（秒）
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'http_request_seconds': '单次 HTTP 请求耗时（含失败的尝试，不含限速等待）',
+    'http_wait_seconds': '等待主机限速器的时间',
+    'http_requests_total': 'HTTP 请求数（按状态码或错误类别）',
+    'http_bytes_total': '下载的字节数（线上字节，gzip 压缩后）',
+    'parse_seconds': '每页解析耗时',
+    'validate_seconds': '每页数据质量校验耗时',
+    'pages_total': '处理的页数（source=network 为新下载，cache 为缓存命中的已解析结果）',
+    'rows_parsed_total': '解析出的净值行数',
+    'sqlite_begin_seconds': 'BEGIN IMMEDIATE 等待写锁的时间',
+    'sqlite_upsert_seconds': '每批 UPSERT（含指标表维护）耗时',
+    'sqlite_commit_seconds': 'COMMIT 耗时',
+    'rows_written_total': '写入的净值行数',
+    'stage_idle_seconds': '流水线阶段等待上游数据的时间',
+    'stage_blocked_seconds': '流水线阶段因下游队列已满而阻塞的时间',
+    'retries_total': '重试次数',
+    'http_errors_total': '请求错误数（按错误类别）',
+    'circuit_opened_total': '熔断器打开次数',
+    'cache_requests_total': '响应缓存查询（按结果）',
+    'api_request_seconds': '查询服务每个请求的耗时（流式响应含发送时间）',
+    'api_requests_total': '查询服务请求数（按接口与状态码）',
+    'api_cache_total': '查询服务结果缓存（按命中与否）',
+    'scheduler_funds_total': '调度器同步的基金数（fresh 为拿到应有净值，missing 为仍缺失）',
+    'scheduler_holidays_total': '调度器推断出的休市日数',
+    'run_seconds': '本次运行的墙钟时间',
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+_started = time.monotonic()
+
+
+def _key(name, labels):
+    # 标签值统一为字符串（状态码与错误类别共用 status 标签），保证可排序
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        hist['buckets'][i] += 1
+        hist['sum'] += seconds
+        hist['count'] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """with timer('parse_seconds'): ... 记录块内耗时"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, **labels)
+
+
+def register_collector(collect):
+    """导出时调用 collect()，产出 (name, labels, value) 计数；用于接入已有的统计"""
+    with _lock:
+        _collectors.append(collect)
+
+
+def reset():
+    """清零并重新开始计时（同一进程内多次运行时使用）"""
+    global _started
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started = time.monotonic()
+
+
+def snapshot():
+    """可 pickle 的当前值（含采集函数的结果），供多进程汇总"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                      for key, h in _histograms.items()}
+        collectors = list(_collectors)
+    for collect in collectors:
+        for name, labels, value in collect():
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+    return {'counters': counters, 'histograms': histograms}
+
+
+def merge(snap):
+    """把其他进程的 snapshot() 累加进本进程"""
+    with _lock:
+        for key, value in snap['counters'].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, other in snap['histograms'].items():
+            hist = _histograms.get(key)
+            if hist is None:
+                hist = _histograms[key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            hist['buckets'] = [a + b for a, b in zip(hist['buckets'], other['buckets'])]
+            hist['sum'] += other['sum']
+            hist['count'] += other['count']
+
+
+def _quantile(buckets, count, q):
+    """由桶计数线性插值估计分位数"""
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        if seen + n >= rank and n:
+            lower = BUCKETS[i - 1] if i > 0 else 0.0
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            return lower + (upper - lower) * (rank - seen) / n
+        seen += n
+    return BUCKETS[-1]
+
+
+def _escape(value):
+    """标签值转义：反斜杠、双引号、换行（Prometheus 文本格式的要求）"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def to_prometheus(snap=None):
+    """Prometheus 文本格式"""
+    snap = snap or snapshot()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+    for (name, labels), value in sorted(snap['counters'].items()):
+        describe(name, 'counter')
+        lines.append(f'{PREFIX}{name}{_labels_text(labels)} {value}')
+    for (name, labels), hist in sorted(snap['histograms'].items()):
+        describe(name, 'histogram')
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ('+Inf',), hist['buckets']):
+            cumulative += n
+            lines.append(f'{PREFIX}{name}_bucket{_labels_text(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{PREFIX}{name}_sum{_labels_text(labels)} {hist["sum"]:.6f}')
+        lines.append(f'{PREFIX}{name}_count{_labels_text(labels)} {hist["count"]}')
+    describe('run_seconds', 'gauge')
+    lines.append(f'{PREFIX}run_seconds {time.monotonic() - _started:.3f}')
+    return '\n'.join(lines) + '\n'
+
+
+def _total(snap, name, kind='counters', field=None, **match):
+    """按名称（及部分标签）汇总计数或直方图的某个字段"""
+    total = 0
+    for (key_name, labels), value in snap[kind].items():
+        if key_name != name:
+            continue
+        labels = dict(labels)
+        if any(labels.get(k) != v for k, v in match.items()):
+            continue
+        total += value[field] if field else value
+    return total
+
+
+def summary(snap=None, parse_workers=1):
+    """
+    JSON 摘要：墙钟时间、吞吐、各直方图的计数/均值/分位数、各阶段忙碌时间与瓶颈判断
+    parse_workers 为并行的解析线程数（多进程运行时为进程数），解析忙碌比例按此折算
+    """
+    snap = snap or snapshot()
+    wall = time.monotonic() - _started
+    histograms = {}
+    for (name, labels), hist in sorted(snap['histograms'].items()):
+        label = name + _labels_text(labels)
+        count = hist['count']
+        histograms[label] = {
+            'count': count, 'sum': round(hist['sum'], 6),
+            'mean': hist['sum'] / count if count else None,
+            'p50': _quantile(hist['buckets'], count, 0.5),
+            'p90': _quantile(hist['buckets'], count, 0.9),
+            'p99': _quantile(hist['buckets'], count, 0.99),
+        }
+    counters = {name + _labels_text(labels): value for (name, labels), value in sorted(snap['counters'].items())}
+
+    rows = _total(snap, 'rows_written_total')
+    # 解析、写库阶段各为单线程：忙碌时间接近墙钟时间即为瓶颈；否则两者都在等上游，瓶颈在网络
+    stages = {
+        'network': _total(snap, 'http_request_seconds', 'histograms', 'sum')
+                   + _total(snap, 'http_wait_seconds', 'histograms', 'sum'),
+        'parse': _total(snap, 'parse_seconds', 'histograms', 'sum')
+                 + _total(snap, 'validate_seconds', 'histograms', 'sum'),
+        'write': _total(snap, 'sqlite_begin_seconds', 'histograms', 'sum')
+                 + _total(snap, 'sqlite_upsert_seconds', 'histograms', 'sum')
+                 + _total(snap, 'sqlite_commit_seconds', 'histograms', 'sum'),
+    }
+    busy = {stage: seconds / wall if wall > 0 else 0.0 for stage, seconds in stages.items()}
+    busy['parse'] /= max(1, parse_workers)
+    if max(busy['parse'], busy['write']) >= 0.7:
+        bound = 'parse' if busy['parse'] >= busy['write'] else 'write'
+    else:
+        bound = 'network'
+    return {
+        'wall_seconds': wall,
+        'rows_written': rows,
+        'rows_per_second': rows / wall if wall > 0 else None,
+        'bytes_downloaded': _total(snap, 'http_bytes_total'),
+        'pages': _total(snap, 'pages_total'),
+        'stage_seconds': stages,
+        'stage_busy': busy,
+        'bound': bound,
+        'counters': counters,
+        'histograms': histograms,
+    }
+
+
+def export(path, **kwargs):
+    """按扩展名导出：.prom 为 Prometheus 文本，其余为 JSON 摘要（kwargs 传给 summary）；先写临时文件再原子替换"""
+    snap = snapshot()
+    if path.endswith('.prom'):
+        content = to_prometheus(snap)
+    else:
+        content = json.dumps(summary(snap, **kwargs), ensure_ascii=False, indent=2, default=str)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return path
+
+
+def format_summary(data=None):
+    """摘要的几行文本（写入日志）"""
+    data = data or summary()
+    busy = data['stage_busy']
+    names = {'network': '网络', 'parse': '解析', 'write': '写库'}
+    lines = [
+        f"耗时 {data['wall_seconds']:.1f}s, 写入 {data['rows_written']} 行 "
+        f"({data['rows_per_second'] or 0:.0f} 行/s), 下载 {data['bytes_downloaded'] / 1e6:.1f}MB, "
+        f"{data['pages']} 页",
+        '阶段累计耗时: ' + ', '.join(f"{names[s]} {data['stage_seconds'][s]:.1f}s ({busy[s]:.0%})" for s in names)
+        + f" → 瓶颈: {names[data['bound']]}",
+    ]
+    for name in ('http_request_seconds', 'parse_seconds', 'sqlite_commit_seconds'):
+        for label, hist in data['histograms'].items():
+            if label.split('{')[0] == name and hist['count']:
+                lines.append(f"{label}: {hist['count']} 次, 均值 {hist['mean'] * 1000:.1f}ms, "
+                             f"p50 {hist['p50'] * 1000:.1f}ms, p99 {hist['p99'] * 1000:.1f}ms")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看运行指标 JSON 摘要')
+    parser.add_argument('path', help='export() 写出的 JSON 文件')
+    args = parser.parse_args()
+    with open(args.path, encoding='utf-8') as f:
+        data = json.load(f)
+    for line in format_summary(data):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
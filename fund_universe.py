@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+基金池
+基金列表以 funds 表为准，可由外部 JSON/CSV 文件导入；
+调度时按 fund_code 分批惰性读取，并支持按 shard 切分
+"""
+
+import csv
+import json
+import sqlite3
+import zlib
+
+DEFAULT_THEME = '机器人'
+
+# 内置的机器人主题基金，仅在 funds 表为空且未指定文件时作为种子
+DEFAULT_FUNDS = [
+    {'code': '562500', 'name': '华夏中证机器人ETF', 'company': '华夏基金', 'type': 'ETF'},
+    {'code': '159530', 'name': '易方达国证机器人产业ETF', 'company': '易方达基金', 'type': 'ETF'},
+    {'code': '159526', 'name': '嘉实中证机器人ETF', 'company': '嘉实基金', 'manager': '田光远', 'type': 'ETF'},
+    {'code': '159258', 'name': '南方中证机器人ETF', 'company': '南方基金', 'type': 'ETF'},
+    {'code': '018095', 'name': '博时中证机器人指数发起C', 'company': '博时基金', 'manager': '唐屹兵', 'type': 'ETF'},
+    {'code': '159559', 'name': '景顺长城国证机器人产业ETF', 'company': '景顺长城', 'type': 'ETF'},
+    {'code': '159278', 'name': '鹏华国证机器人产业ETF', 'company': '鹏华基金', 'manager': '陈龙', 'type': 'ETF'},
+    {'code': '159213', 'name': '汇添富中证机器人ETF', 'company': '汇添富基金', 'type': 'ETF'},
+    {'code': '007713', 'name': '华富科技动能混合A', 'company': '华富基金', 'manager': '沈成', 'type': '主动管理'},
+    {'code': '000649', 'name': '长城久鑫灵活配置混合A', 'company': '长城基金', 'manager': '余欢', 'type': '主动管理'},
+    {'code': '021489', 'name': '中航趋势领航混合发起A', 'company': '中航基金', 'manager': '王森', 'type': '主动管理'},
+    {'code': '018124', 'name': '永赢先进制造智选混合发起A', 'company': '永赢基金', 'manager': '张璐', 'type': '主动管理'},
+]
+
+CREATE_FUNDS_SQL = '''
+    CREATE TABLE IF NOT EXISTS funds (
+        fund_code TEXT PRIMARY KEY,
+        fund_name TEXT NOT NULL,
+        fund_company TEXT,
+        fund_manager TEXT,
+        fund_type TEXT,
+        theme TEXT DEFAULT '机器人',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# 只在字段确有变化时才改写；传入 None 的字段保留库中已有值（新插入时用空串/默认主题）
+UPSERT_FUND_SQL = '''
+    INSERT INTO funds (fund_code, fund_name, fund_company, fund_manager, fund_type, theme)
+    VALUES (:code, :name, COALESCE(:company, ''), COALESCE(:manager, ''), COALESCE(:type, ''),
+            COALESCE(:theme, :default_theme))
+    ON CONFLICT(fund_code) DO UPDATE SET
+        fund_name = excluded.fund_name,
+        fund_company = COALESCE(:company, funds.fund_company),
+        fund_manager = COALESCE(:manager, funds.fund_manager),
+        fund_type = COALESCE(:type, funds.fund_type),
+        theme = COALESCE(:theme, funds.theme)
+    WHERE funds.fund_name IS NOT excluded.fund_name
+       OR funds.fund_company IS NOT COALESCE(:company, funds.fund_company)
+       OR funds.fund_manager IS NOT COALESCE(:manager, funds.fund_manager)
+       OR funds.fund_type IS NOT COALESCE(:type, funds.fund_type)
+       OR funds.theme IS NOT COALESCE(:theme, funds.theme)
+'''
+
+FUND_COLUMNS = 'fund_code, fund_name, fund_company, fund_manager, fund_type, theme'
+
+
+def _fund_params(funds):
+    for fund in funds:
+        yield {
+            'code': fund['code'],
+            'name': fund['name'],
+            'company': fund.get('company'),
+            'manager': fund.get('manager'),
+            'type': fund.get('type'),
+            'theme': fund.get('theme'),
+            'default_theme': fund.get('default_theme', DEFAULT_THEME),
+        }
+
+
+def ensure_table(conn):
+    conn.execute(CREATE_FUNDS_SQL)
+
+
+def upsert_funds(conn, funds):
+    """批量写入基金信息，只改动有变化的行，返回实际插入/更新的行数"""
+    before = conn.total_changes
+    conn.executemany(UPSERT_FUND_SQL, _fund_params(funds))
+    return conn.total_changes - before
+
+
+def seed_universe(conn, funds_file=None):
+    """
+    准备基金池：指定文件时导入文件中的基金；否则仅在 funds 表为空时写入 DEFAULT_FUNDS
+    返回实际插入/更新的行数
+    """
+    if funds_file:
+        return upsert_funds(conn, load_funds_file(funds_file))
+    if conn.execute('SELECT 1 FROM funds LIMIT 1').fetchone():
+        return 0
+    return upsert_funds(conn, DEFAULT_FUNDS)
+
+
+def load_funds_file(path):
+    """从 JSON（列表）或 CSV（表头 code,name,company,manager,type,theme）读取基金列表"""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    with open(path, encoding='utf-8', newline='') as f:
+        return [{k: v for k, v in row.items() if v} for row in csv.DictReader(f)]
+
+
+def shard_of(fund_code, num_shards):
+    """基金所属分片，与列表顺序无关"""
+    return zlib.crc32(fund_code.encode('ascii')) % num_shards
+
+
+def parse_shard(text):
+    """解析 'i/n' 形式的分片参数"""
+    shard, num_shards = (int(x) for x in text.split('/'))
+    if not 0 <= shard < num_shards:
+        raise ValueError(f'无效分片: {text}')
+    return shard, num_shards
+
+
+def _row_to_fund(row):
+    code, name, company, manager, fund_type, theme = row
+    return {'code': code, 'name': name, 'company': company or '', 'manager': manager or '',
+            'type': fund_type or '', 'theme': theme}
+
+
+def iter_universe(db_path, shard=0, num_shards=1, theme=None, batch=500):
+    """
+    按 fund_code 顺序惰性遍历基金池
+    每批单独查询（键集分页），不在同步过程中长时间占用读游标；
+    可由多个线程轮流消费（调用方负责串行化 next）
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    try:
+        last = ''
+        while True:
+            sql = f'SELECT {FUND_COLUMNS} FROM funds WHERE fund_code > ?'
+            params = [last]
+            if theme:
+                sql += ' AND theme = ?'
+                params.append(theme)
+            sql += ' ORDER BY fund_code LIMIT ?'
+            params.append(batch)
+            rows = conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                if num_shards == 1 or shard_of(row[0], num_shards) == shard:
+                    yield _row_to_fund(row)
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def count_universe(db_path, shard=0, num_shards=1, theme=None):
+    """基金池（分片）大小"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        sql = 'SELECT fund_code FROM funds'
+        params = []
+        if theme:
+            sql += ' WHERE theme = ?'
+            params.append(theme)
+        if num_shards == 1:
+            return conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+        return sum(1 for (code,) in conn.execute(sql, params) if shard_of(code, num_shards) == shard)
+    finally:
+        conn.close()
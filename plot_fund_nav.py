@@ -1,96 +1,245 @@
+#!/usr/bin/env python3
+"""
+基金净值走势图
+从 nav_history 读取净值，长序列用 LTTB 降采样后绘图；
+批量模式下每个进程只创建一次 Figure（Agg 后端），逐只基金更新数据后保存，由进程池并行渲染
+
+用法:
+    python plot_fund_nav.py                          # 默认绘制 021489
+    python plot_fund_nav.py --fund 021489 --fund 562500
+    python plot_fund_nav.py --all --workers 4        # 全部基金
+    python plot_fund_nav.py --theme 机器人 --out charts/
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime
 import numpy as np
 
+import fund_compact
+from fund_analytics import load_panel, compute_metrics, from_days
+
+DB_PATH = '/root/.openclaw/workspace/fund_robot.db'
+OUTPUT_DIR = '/root/.openclaw/workspace/charts'
+
+DEFAULT_FUND = '021489'
+
+# 每张图最多绘制的点数
+MAX_POINTS = 1000
+
+# 每个进程任务包含的基金数（一次查询读出整批）
+CHUNK_SIZE = 25
+
+WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+DPI = 150
+FIGSIZE = (14, 7)
+COLOR = '#E74C3C'
+
 # 设置支持中文的字体
 plt.rcParams['font.sans-serif'] = ['DejaVu Sans', 'Arial Unicode MS', 'SimHei', 'sans-serif']
 plt.rcParams['axes.unicode_minus'] = False
 
-# 中航趋势领航混合发起A (021489) 历史净值数据
-dates = [
-    '2024-06-18', '2024-07-18', '2024-08-18', '2024-09-18', '2024-10-18', 
-    '2024-11-18', '2024-12-18', '2025-01-18', '2025-02-18', '2025-03-18',
-    '2025-04-18', '2025-05-18', '2025-06-18', '2025-07-18', '2025-08-18',
-    '2025-09-18', '2025-10-18', '2025-11-18', '2025-12-18', '2025-12-31'
-]
-
-# 根据搜索到的信息推算净值走势
-nav_values = [
-    1.0000,  # 2024-06-18 成立
-    0.9800,  # 2024-07
-    0.9700,  # 2024-08
-    1.0500,  # 2024-09
-    1.1200,  # 2024-10
-    1.2500,  # 2024-11
-    1.4338,  # 2024-12-18 +43.38%
-    1.5500,  # 2025-01
-    1.6800,  # 2025-02
-    1.8500,  # 2025-03
-    2.0000,  # 2025-04
-    2.1500,  # 2025-05
-    2.3000,  # 2025-06
-    2.4200,  # 2025-07
-    2.5500,  # 2025-08
-    2.7500,  # 2025-09
-    2.6500,  # 2025-10 回撤
-    2.5000,  # 2025-11 回撤
-    2.3550,  # 2025-12-18
-    2.7928,  # 2025-12-31
-]
-
-# 转换日期
-dates_dt = [datetime.strptime(d, '%Y-%m-%d') for d in dates]
-
-# 创建图表
-fig, ax = plt.subplots(figsize=(14, 7))
-
-# 绘制净值曲线
-ax.plot(dates_dt, nav_values, linewidth=2.5, color='#E74C3C', label='NAV')
-ax.fill_between(dates_dt, nav_values, alpha=0.3, color='#E74C3C')
-
-# 添加关键节点标注
-ax.annotate('Launch\n1.0000', xy=(dates_dt[0], nav_values[0]), 
-            xytext=(dates_dt[0], nav_values[0]-0.3),
-            fontsize=9, ha='center',
-            arrowprops=dict(arrowstyle='->', color='gray'))
-
-ax.annotate('End of 2024\n+43.38%', xy=(dates_dt[6], nav_values[6]), 
-            xytext=(dates_dt[6], nav_values[6]+0.2),
-            fontsize=9, ha='center',
-            arrowprops=dict(arrowstyle='->', color='gray'))
-
-ax.annotate('2025-12-31\n2.7928 (+179.28%)', xy=(dates_dt[-1], nav_values[-1]), 
-            xytext=(dates_dt[-1], nav_values[-1]+0.2),
-            fontsize=9, ha='center',
-            arrowprops=dict(arrowstyle='->', color='gray'))
-
-# 设置标题和标签（使用英文避免字体问题）
-ax.set_title('AVIC Trend Navigator Mixed Fund A (021489) NAV Trend\nSince Inception Return: +179.28% | Annualized Return: +89.33%', 
-             fontsize=14, fontweight='bold', pad=20)
-ax.set_xlabel('Date', fontsize=11)
-ax.set_ylabel('Cumulative NAV (CNY)', fontsize=11)
-
-# 格式化x轴日期
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-ax.xaxis.set_major_locator(mdates.MonthLocator(interval=2))
-plt.xticks(rotation=45)
-
-# 添加网格
-ax.grid(True, alpha=0.3, linestyle='--')
-
-# 添加图例
-ax.legend(loc='upper left', fontsize=10)
-
-# 设置y轴范围
-ax.set_ylim(0.5, 3.2)
-
-# 添加信息框（使用英文）
-textstr = 'Fund Info:\n• Launch Date: 2024-06-18\n• Fund Manager: Wang Sen\n• Latest NAV: 2.7928 (2025-12-31)\n• Fund Size: 259M CNY\n• Theme: Humanoid Robot'
-props = dict(boxstyle='round', facecolor='wheat', alpha=0.8)
-ax.text(0.02, 0.98, textstr, transform=ax.transAxes, fontsize=9,
-        verticalalignment='top', bbox=props)
-
-plt.tight_layout()
-plt.savefig('/root/.openclaw/workspace/中航趋势领航净值走势.png', dpi=150, bbox_inches='tight')
-print("Chart saved successfully")
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，保留首尾点，返回选中点的下标
+    每个桶内向量化计算三角形面积，只对桶做循环
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 中间 n-2 个点均分到 threshold-2 个桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的平均点（最后一个桶用末点）
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def select_funds(db_path, codes=None, theme=None, all_funds=False):
+    """要绘制的基金代码列表"""
+    if codes:
+        return list(codes)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if theme:
+            rows = conn.execute('SELECT fund_code FROM funds WHERE theme = ? ORDER BY fund_code', (theme,))
+        elif all_funds:
+            sql = (fund_compact.FUND_CODES_SQL if fund_compact.is_compact(conn)
+                   else 'SELECT DISTINCT fund_code FROM nav_history ORDER BY fund_code')
+            rows = conn.execute(sql)
+        else:
+            return [DEFAULT_FUND]
+        return [code for (code,) in rows]
+    finally:
+        conn.close()
+
+
+class ChartRenderer:
+    """持有一个 Figure，逐只基金替换数据后保存，避免重复创建画布"""
+
+    def __init__(self, max_points=MAX_POINTS, dpi=DPI):
+        self.max_points = max_points
+        self.dpi = dpi
+        self.fig, self.ax = plt.subplots(figsize=FIGSIZE)
+        self.line, = self.ax.plot([], [], linewidth=2.5, color=COLOR, label='NAV')
+        self.ax.set_xlabel('Date', fontsize=11)
+        self.ax.set_ylabel('Cumulative NAV (CNY)', fontsize=11)
+        self.ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+        self.ax.grid(True, alpha=0.3, linestyle='--')
+        self.ax.legend(loc='upper left', fontsize=10)
+        for label in self.ax.get_xticklabels():
+            label.set_rotation(45)
+        # 固定边距：bbox_inches='tight' 每次保存要多绘制一遍
+        self.fig.subplots_adjust(left=0.06, right=0.98, top=0.88, bottom=0.13)
+        self._artists = []
+
+    def render(self, code, days, navs, metrics, path):
+        """绘制一只基金并保存为 PNG"""
+        for artist in self._artists:
+            artist.remove()
+        self._artists = []
+
+        keep = lttb(days, navs, self.max_points)
+        dates = days[keep].astype('datetime64[D]')
+        values = navs[keep]
+        self.line.set_data(dates, values)
+        self._artists.append(self.ax.fill_between(dates, values, alpha=0.3, color=COLOR))
+
+        # 首尾标注
+        start, end = from_days([days[0], days[-1]])
+        offset = (values.max() - values.min()) * 0.1 or 0.1
+        self._artists.append(self.ax.annotate(
+            f'Launch\n{navs[0]:.4f}', xy=(dates[0], values[0]), xytext=(dates[0], values[0] - offset),
+            fontsize=9, ha='center', arrowprops=dict(arrowstyle='->', color='gray')))
+        self._artists.append(self.ax.annotate(
+            f"{end}\n{navs[-1]:.4f} ({metrics['cumulative_return']:+.2%})",
+            xy=(dates[-1], values[-1]), xytext=(dates[-1], values[-1] + offset),
+            fontsize=9, ha='center', arrowprops=dict(arrowstyle='->', color='gray')))
+
+        # 标题和信息框使用英文，避免缺字体
+        self.ax.set_title(
+            f"Fund {code} NAV Trend\n"
+            f"Since Inception Return: {metrics['cumulative_return']:+.2%} | "
+            f"Annualized Return: {metrics['annualized_return']:+.2%}",
+            fontsize=14, fontweight='bold', pad=20)
+        text = (f"Fund Info:\n• First NAV Date: {start}\n• Latest NAV: {navs[-1]:.4f} ({end})\n"
+                f"• Volatility: {metrics['volatility']:.2%}\n• Sharpe: {metrics['sharpe']:.2f}\n"
+                f"• Max Drawdown: {metrics['max_drawdown']:.2%}\n• Points: {len(days)} (shown {len(keep)})")
+        self._artists.append(self.ax.text(
+            0.02, 0.90, text, transform=self.ax.transAxes, fontsize=9, verticalalignment='top',
+            bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8)))
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+        low, high = values.min(), values.max()
+        self.ax.set_ylim(low - offset * 2, high + offset * 2)
+        self.fig.savefig(path, dpi=self.dpi)
+
+
+_renderer = None
+
+
+def _init_worker(max_points, dpi):
+    global _renderer
+    _renderer = ChartRenderer(max_points, dpi)
+
+
+def render_chunk(db_path, codes, out_dir):
+    """进程池任务：一次读出一批基金，逐只渲染，返回 [(code, path 或 None)]"""
+    global _renderer
+    if _renderer is None:
+        _renderer = ChartRenderer()
+    panel = load_panel(db_path, codes)
+    results = []
+    if len(panel):
+        axis, mat = panel.matrix(fill=False)
+        metrics = compute_metrics(axis, mat)
+        for i, code in enumerate(panel.codes):
+            lo, hi = panel.offsets[i], panel.offsets[i + 1]
+            if hi - lo < 2:
+                continue
+            path = os.path.join(out_dir, f'{code}.png')
+            _renderer.render(code, panel.days[lo:hi], panel.navs[lo:hi],
+                             {name: values[i] for name, values in metrics.items()}, path)
+            results.append((str(code), path))
+    rendered = {code for code, _ in results}
+    results.extend((code, None) for code in codes if code not in rendered)
+    return results
+
+
+def render_funds(codes, db_path=DB_PATH, out_dir=OUTPUT_DIR, workers=WORKERS,
+                 max_points=MAX_POINTS, dpi=DPI, chunk_size=CHUNK_SIZE, on_done=None):
+    """批量渲染，返回 {code: path 或 None（无数据）}"""
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    results = {}
+    if workers <= 1 or len(chunks) <= 1:
+        _init_worker(max_points, dpi)
+        for chunk in chunks:
+            for code, path in render_chunk(db_path, chunk, out_dir):
+                results[code] = path
+                if on_done:
+                    on_done(code, path)
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                             initargs=(max_points, dpi)) as pool:
+        futures = [pool.submit(render_chunk, db_path, chunk, out_dir) for chunk in chunks]
+        for future in as_completed(futures):
+            for code, path in future.result():
+                results[code] = path
+                if on_done:
+                    on_done(code, path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基金净值走势图')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--fund', action='append', help='基金代码，可重复；默认 021489')
+    parser.add_argument('--theme', help='绘制该主题的全部基金')
+    parser.add_argument('--all', action='store_true', help='绘制所有有净值数据的基金')
+    parser.add_argument('--out', default=OUTPUT_DIR, help='输出目录，文件名为 <基金代码>.png')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='渲染进程数')
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS, help='每张图最多绘制的点数（LTTB 降采样）')
+    parser.add_argument('--dpi', type=int, default=DPI)
+    args = parser.parse_args()
+
+    codes = select_funds(args.db, args.fund, args.theme, args.all)
+    start = time.monotonic()
+
+    def on_done(code, path):
+        if path is None:
+            print(f"[WARN] {code}: 没有净值数据")
+
+    results = render_funds(codes, args.db, args.out, args.workers, args.max_points, args.dpi, on_done=on_done)
+    done = sum(1 for path in results.values() if path)
+    print(f"[INFO] 已生成 {done}/{len(codes)} 张图 → {args.out}（{time.monotonic() - start:.1f}s）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+var r = [["000001","HXCZHH","华夏成长混合","混合型-偏股","HUAXIACHENGZHANGHUNHE"],["000649","CCJXLHPZHHA","长城久鑫灵活配置混合A","混合型-灵活","CHANGCHENGJIUXINLINGHUOPEIZHIHUNHEA"],["007713","HFKJDNHHA","华富科技动能混合A","混合型-偏股","HUAFUKEJIDONGNENGHUNHEA"],["008585","HXZZRGZNZTETFLJA","华夏中证人工智能主题ETF联接A","指数型-股票","HUAXIAZHONGZHENGRENGONGZHINENGZHUTIETFLIANJIEA"],["159526","JSZZJQRETF","嘉实中证机器人ETF","指数型-股票","JIASHIZHONGZHENGJIQIRENETF"],["159530","YFDGZJQRCYETF","易方达国证机器人产业ETF","指数型-股票","YIFANGDAGUOZHENGJIQIRENCHANYEETF"],["161725","ZSZZBJ","招商中证白酒指数(LOF)A","指数型-股票","ZHAOSHANGZHONGZHENGBAIJIUZHISHULOFA"],["512480","GLZZQBDTETF","国联安中证全指半导体ETF","指数型-股票","GUOLIANANZHONGZHENGQUANZHIBANDAOTIETF"],["562500","HXZZJQRETF","华夏中证机器人ETF","指数型-股票","HUAXIAZHONGZHENGJIQIRENETF"]];
@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import date, timedelta
+
+import fund_calendar
+from fund_quality import NavValidator
+
+
+def _weekdays(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def _make_db(path, days):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE nav_history (fund_code TEXT, date DATE, nav_value REAL, cumulative_nav REAL,'
+                 ' daily_return REAL, UNIQUE(fund_code, date))')
+    conn.executemany('INSERT INTO nav_history VALUES (?, ?, 1.0, 1.0, 0.0)',
+                     [('000001', day.isoformat()) for day in days])
+    conn.commit()
+    conn.close()
+
+
+def test_day_missing_from_all_funds_is_a_gap(tmp_path):
+    days = [day for day in _weekdays(date(2024, 3, 1), date(2024, 3, 29))
+            if not date(2024, 3, 11) <= day <= date(2024, 3, 15)]
+    db_path = str(tmp_path / 'nav.db')
+    _make_db(db_path, days)
+    calendar = fund_calendar.load_calendar(db_path)
+    assert calendar.is_trading_day(date(2024, 3, 13))
+
+    validator = NavValidator('000001', calendar)
+    validator.feed([(day.isoformat(), 1.0, 1.0, 0.0) for day in days])
+    report = validator.report()
+    assert report['gaps'] == 1
+    assert report['max_gap'] == 5
+
+
+def test_holiday_file_and_confirmed_days(tmp_path):
+    db_path = str(tmp_path / 'nav.db')
+    _make_db(db_path, [date(2024, 2, 9)])
+    (tmp_path / 'holidays.txt').write_text('2024-02-08  # 春节\n2024-02-09\n2024-02-12\n', encoding='utf-8')
+    calendar = fund_calendar.load_calendar(db_path)
+    assert not calendar.is_trading_day(date(2024, 2, 8))
+    # 登记为休市但库里有净值：按交易日算
+    assert calendar.is_trading_day(date(2024, 2, 9))
+    assert not calendar.is_trading_day(date(2024, 10, 1))
+    assert calendar.between(date(2024, 2, 7), date(2024, 2, 13)) == 1
+    assert calendar.count(date(2024, 1, 1), date(2025, 1, 1)) == 262 - 2 - 7
+
+
+def test_get_calendar_refresh(tmp_path):
+    db_path = str(tmp_path / 'nav.db')
+    _make_db(db_path, [])
+    calendar = fund_calendar.get_calendar(db_path)
+    assert fund_calendar.get_calendar(db_path) is calendar
+    (tmp_path / 'holidays.txt').write_text('2024-02-08\n', encoding='utf-8')
+    assert fund_calendar.get_calendar(db_path, refresh=True).is_trading_day(date(2024, 2, 8)) is False
+    fund_calendar.invalidate_calendar(db_path)
+    assert fund_calendar.get_calendar(db_path) is not calendar
+    fund_calendar.invalidate_calendar()
+
+
+def test_scheduler_validates_with_its_calendar(tmp_path, monkeypatch):
+    import fund_scheduler
+
+    seen = {}
+
+    def fake_pipeline(funds, store, **kwargs):
+        seen['calendar'] = kwargs.get('calendar')
+        return {}
+
+    monkeypatch.setattr(fund_scheduler, 'run_pipeline', fake_pipeline)
+    calendar = fund_calendar.TradingCalendar(holidays={date(2024, 2, 8)})
+    scheduler = fund_scheduler.SyncScheduler(str(tmp_path / 'nav.db'), calendar)
+    scheduler.dispatch([({'code': '000001', 'watermark': None}, '2024-02-08')])
+    assert seen['calendar'] is calendar
@@ -0,0 +1,67 @@
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+
+import fund_analytics
+import fund_calendar
+import fund_compact
+import fund_snapshot
+import plot_fund_nav
+
+
+def _make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE funds (fund_code TEXT PRIMARY KEY, fund_name TEXT)')
+    conn.execute('CREATE TABLE nav_history (id INTEGER PRIMARY KEY AUTOINCREMENT, fund_code TEXT NOT NULL,'
+                 ' date DATE NOT NULL, nav_value REAL, cumulative_nav REAL, daily_return REAL,'
+                 ' UNIQUE(fund_code, date))')
+    rows = []
+    for i, code in enumerate(['000003', '000001', '000002']):
+        nav = 1.0
+        for n in range(i * 5, 60):
+            day = date(2024, 1, 1) + timedelta(days=n)
+            if day.weekday() >= 5 or (n + i) % 7 == 0:
+                continue
+            nav = round(nav * (1.003 if n % 3 else 0.996), 4)
+            # 最后一只基金缺累计净值、带不能定点存放的值
+            cumulative = None if i == 2 else round(nav + 0.5, 4)
+            rows.append((code, day.isoformat(), nav if i < 2 else nav + 1e-7, cumulative, round(n / 10, 2)))
+    conn.executemany('INSERT INTO nav_history (fund_code, date, nav_value, cumulative_nav, daily_return)'
+                     ' VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def _read_all(db_path):
+    panel = fund_analytics.load_panel(db_path)
+    subset = fund_analytics.load_panel(db_path, fund_codes=['000002', '000001'], start='2024-01-10',
+                                       end='2024-02-10')
+    conn = sqlite3.connect(db_path)
+    try:
+        prints = fund_snapshot._fingerprints(conn)
+        counts, days, values = fund_snapshot._query_funds(conn, sorted(prints))
+    finally:
+        conn.close()
+    return {
+        'panel': (panel.codes.tolist(), panel.offsets.tolist(), panel.days.tolist(), panel.navs.tolist()),
+        'subset': (subset.codes.tolist(), subset.offsets.tolist(), subset.days.tolist(), subset.navs.tolist()),
+        'prints': prints,
+        'rows': (counts, days.tolist()),
+        'values': {name: np.nan_to_num(column, nan=-1).tolist() for name, column in values.items()},
+        'calendar': sorted(fund_calendar.load_calendar(db_path).trading),
+        'funds': plot_fund_nav.select_funds(db_path, all_funds=True),
+    }
+
+
+def test_readers_match_after_migration(tmp_path):
+    db_path = str(tmp_path / 'nav.db')
+    _make_db(db_path)
+    before = _read_all(db_path)
+    fund_compact.migrate(db_path, vacuum=False)
+    conn = sqlite3.connect(db_path)
+    assert fund_compact.is_compact(conn)
+    conn.close()
+    after = _read_all(db_path)
+    assert after == before
+    assert before['funds'] == ['000001', '000002', '000003']
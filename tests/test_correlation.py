@@ -0,0 +1,17 @@
+import numpy as np
+
+from fund_analytics import NavPanel
+from fund_correlation import aligned_returns
+
+
+def test_returns_use_each_funds_own_dates():
+    # 基金 A 在第 2 天有净值，B 没有；B 第 3 天的收益应相对它第 1 天的净值
+    codes = np.array(['A', 'B'])
+    offsets = np.array([0, 4, 7])
+    days = np.array([1, 2, 3, 4, 1, 3, 4])
+    navs = np.array([1.0, 1.1, 1.21, 1.331, 2.0, 2.2, 2.42])
+    axis, returns = aligned_returns(NavPanel(codes, offsets, days, navs))
+    assert axis.tolist() == [2, 3, 4]
+    np.testing.assert_allclose(returns[0], [0.1, 0.1, 0.1])
+    assert np.isnan(returns[1, 0])
+    np.testing.assert_allclose(returns[1, 1:], [0.1, 0.1])
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+
+import fund_discovery
+import fund_store
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+FUNDCODE_JS = os.path.join(FIXTURES, 'fundcode_search.js')
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _funds(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            'SELECT fund_code, fund_name, fund_company, fund_manager, fund_type, theme FROM funds')}
+    finally:
+        conn.close()
+
+
+def test_entries_split_across_chunks():
+    text = _fixture('fundcode_search.js')
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    entries = list(fund_discovery.iter_fund_entries(chunks))
+    assert len(entries) == 9
+    assert entries[0] == ('000001', '华夏成长混合', '混合型-偏股')
+    assert entries[-1] == ('562500', '华夏中证机器人ETF', '指数型-股票')
+
+
+def test_parse_fund_details():
+    details = fund_discovery.parse_fund_details(_fixture('jbgk_562500.html'))
+    assert details == {'company': '华夏基金', 'manager': '荣膺'}
+    assert fund_discovery.parse_fund_details('<html></html>') == {}
+
+
+def test_discover_fresh_db(tmp_path):
+    db_path = str(tmp_path / 'fund_robot.db')
+    try:
+        total, changed = fund_discovery.discover(db_path, from_file=FUNDCODE_JS, details='none')
+        assert (total, changed) == (9, 9)
+        funds = _funds(db_path)
+        assert funds['562500'][-1] == '机器人'
+        assert funds['008585'][-1] == '人工智能'
+        assert funds['512480'][-1] == '半导体'
+        assert funds['161725'][-1] == '消费'
+        assert funds['000001'][-1] == fund_discovery.OTHER_THEME
+
+        # 再次导入没有变化
+        assert fund_discovery.discover(db_path, from_file=FUNDCODE_JS, details='none') == (9, 0)
+    finally:
+        fund_store.close_stores()
+
+
+def test_discover_fills_details_for_tagged_funds(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'fund_robot.db')
+    requested = []
+
+    def fake_details(code):
+        requested.append(code)
+        return fund_discovery.parse_fund_details(_fixture('jbgk_562500.html'))
+
+    monkeypatch.setattr(fund_discovery, 'fetch_fund_details', fake_details)
+    try:
+        fund_discovery.discover(db_path, from_file=FUNDCODE_JS, tagged_only=True)
+        assert sorted(requested) == ['008585', '159526', '159530', '161725', '512480', '562500']
+        assert _funds(db_path)['562500'][1:3] == ('华夏基金', '荣膺')
+
+        # 已有基金公司的不再抓取
+        requested.clear()
+        fund_discovery.discover(db_path, from_file=FUNDCODE_JS, tagged_only=True)
+        assert requested == []
+    finally:
+        fund_store.close_stores()
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+import fake_fund_server
+import fund_cache
+import fund_discovery
+import fund_http
+import fund_nav_scraper
+import fund_retry
+from fund_pipeline import run_pipeline
+from fund_retry import RetryPolicy
+from fund_store import close_stores, get_store
+from fund_universe import iter_universe
+
+HOSTS = ('fund.eastmoney.com', 'stock.finance.sina.com.cn')
+
+
+@pytest.fixture
+def proxied(tmp_path, monkeypatch):
+    """
+    线程内的回放服务器（注入 503 / 429 / 断开连接），抓取请求经 HTTP_PROXY 落到它；
+    缓存与数据库都在临时目录，退避缩短到毫秒级
+    """
+    data = fake_fund_server.SyntheticData(funds=20, days=600, seed=3)
+    server = fake_fund_server.FakeFundServer(data, port=0, error_rate=0.15, throttle_rate=0.1,
+                                             reset_rate=0.1, seed=3)
+    server.start()
+    monkeypatch.setenv('HTTP_PROXY', server.url)
+    monkeypatch.setenv('http_proxy', server.url)
+    monkeypatch.delenv('NO_PROXY', raising=False)
+    monkeypatch.delenv('no_proxy', raising=False)
+    monkeypatch.setattr(fund_retry, 'DEFAULT_POLICY', RetryPolicy(max_attempts=6, base_delay=0.001, max_delay=0.01))
+    limits = {host: dict(fund_http.HOST_LIMITS.get(host, fund_http.DEFAULT_LIMIT)) for host in HOSTS}
+    for host in HOSTS:
+        fund_http.configure_host(host, rate=1000, burst=1000, max_in_flight=8)
+        fund_retry.configure_breaker(host, failure_threshold=50)
+    monkeypatch.setattr(fund_cache, '_cache', None)
+    fund_cache.configure_cache(str(tmp_path / 'http_cache.db'))
+    db_path = str(tmp_path / 'fund_robot.db')
+    monkeypatch.setattr(fund_nav_scraper, 'DB_PATH', db_path)
+    yield server, data, db_path
+    close_stores()
+    fund_cache.get_cache().close()
+    server.shutdown()
+    server.server_close()
+    for host, limit in limits.items():
+        fund_http.configure_host(host, **limit)
+        fund_retry.HOST_BREAKERS.pop(host, None)
+        fund_retry.configure_breaker(host)
+        fund_retry.HOST_BREAKERS.pop(host, None)
+
+
+def test_pipeline_survives_injected_faults(proxied):
+    server, data, db_path = proxied
+    fund_nav_scraper.init_database()
+    total, _ = fund_discovery.discover(db_path, details='none')
+    assert total == 20
+
+    stats = run_pipeline(iter_universe(db_path), get_store(db_path), fetch_workers=4)
+    assert stats['funds'] == 20
+    assert stats['errors'] == 0
+    faults = server.stats()
+    assert faults.get('error', 0) and faults.get('throttle', 0) and faults.get('reset', 0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for code in data.codes():
+            stored = conn.execute('SELECT date, nav_value, cumulative_nav, daily_return FROM nav_history'
+                                  ' WHERE fund_code = ? ORDER BY date', (code,)).fetchall()
+            assert stored == sorted(data.history(code))
+    finally:
+        conn.close()
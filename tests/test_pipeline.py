@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+import fund_pipeline
+
+FUNDS = [{'code': f'{i:06d}', 'name': str(i)} for i in range(50)]
+
+
+class MemoryStore:
+    db_path = None
+
+    def __init__(self, fail=None):
+        self.rows = []
+        self.fail = fail
+
+    def upsert_rows(self, rows):
+        if self.fail:
+            raise self.fail
+        self.rows.extend(rows)
+
+    def save_quality(self, reports):
+        pass
+
+
+def _pages(fund):
+    for day in range(1, 6):
+        yield None, [(f'2024-01-0{day}', 1.0, 1.0, 0.0)]
+
+
+def _run(funds, store):
+    return fund_pipeline.run_pipeline(funds, store, fetch_pages=_pages, fetch_workers=4, queue_size=2,
+                                      validate=False)
+
+
+def _assert_no_leak(before):
+    assert threading.active_count() == before
+
+
+def test_pipeline_writes_all_rows():
+    store = MemoryStore()
+    stats = _run(FUNDS, store)
+    assert stats == {'funds': 50, 'pages': 250, 'rows': 250, 'errors': 0, 'issues': 0}
+    assert len(store.rows) == 250
+
+
+def test_write_error_stops_all_stages():
+    before = threading.active_count()
+    with pytest.raises(RuntimeError, match='disk full'):
+        _run(FUNDS, MemoryStore(fail=RuntimeError('disk full')))
+    _assert_no_leak(before)
+
+
+def test_universe_error_is_raised():
+    def funds():
+        yield FUNDS[0]
+        raise ValueError('universe broken')
+
+    before = threading.active_count()
+    with pytest.raises(ValueError, match='universe broken'):
+        _run(funds(), MemoryStore())
+    _assert_no_leak(before)
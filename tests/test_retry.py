@@ -0,0 +1,144 @@
+import random
+import time
+
+import pytest
+import requests
+
+import fake_fund_server
+import fund_http
+import fund_retry
+from fund_retry import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ParseError, RetryPolicy
+
+HOST = '127.0.0.1'
+FAST = RetryPolicy(max_attempts=4, base_delay=0.001, max_delay=0.01)
+
+
+@pytest.fixture
+def server():
+    """本地回放服务器（不注入错误，各测试按需修改 faults）；重置本机的熔断与计数"""
+    server = fake_fund_server.FakeFundServer(fake_fund_server.SyntheticData(funds=3, days=60), port=0)
+    server.start()
+    limits = dict(fund_http.HOST_LIMITS.get(HOST, fund_http.DEFAULT_LIMIT))
+    fund_http.configure_host(HOST, rate=1000, burst=1000, max_in_flight=4)
+    fund_retry.configure_breaker(HOST, failure_threshold=3, reset_timeout=0.2)
+    fund_retry._counts.pop(HOST, None)
+    yield server
+    server.shutdown()
+    server.server_close()
+    fund_http.configure_host(HOST, **limits)
+    fund_retry.configure_breaker(HOST)
+    fund_retry.HOST_BREAKERS.pop(HOST, None)
+    fund_retry._counts.pop(HOST, None)
+
+
+def _url(server):
+    return f'{server.url}/js/fundcode_search.js'
+
+
+def _http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+def test_classify():
+    assert fund_retry.classify(requests.Timeout()) == fund_retry.TIMEOUT
+    assert fund_retry.classify(requests.ConnectionError()) == fund_retry.CONNECTION
+    assert fund_retry.classify(_http_error(429)) == fund_retry.THROTTLED
+    assert fund_retry.classify(_http_error(503)) == fund_retry.HTTP_5XX
+    assert fund_retry.classify(_http_error(404)) == fund_retry.HTTP_4XX
+    assert fund_retry.classify(ParseError('bad')) == fund_retry.PARSE
+    assert fund_retry.classify(CircuitOpenError(HOST, 1.0)) == fund_retry.CIRCUIT_OPEN
+    assert fund_retry.classify(RuntimeError()) == fund_retry.OTHER
+
+
+def test_backoff_within_bounds():
+    policy = RetryPolicy(base_delay=0.5, max_delay=4.0)
+    random.seed(0)
+    for attempt in range(8):
+        cap = min(policy.max_delay, policy.base_delay * 2 ** attempt)
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        # 全抖动：不是固定等待
+        assert max(delays) - min(delays) > cap / 2
+
+
+def test_retry_after_is_honoured_and_capped():
+    policy = RetryPolicy(base_delay=0.001, max_delay=5.0)
+    assert policy.delay(0, _http_error(429, {'Retry-After': '3'})) >= 3
+    assert policy.delay(0, _http_error(429, {'Retry-After': '60'})) == 5.0
+    assert policy.delay(0, _http_error(429, {'Retry-After': 'soon'})) <= 0.001
+    assert fund_retry.retry_after(_http_error(503, {'Retry-After': '2'})) == 2.0
+
+
+def test_retries_until_success(server):
+    # 该种子下前两次为 503，第三次成功
+    server.faults = fake_fund_server.FaultInjector(error_rate=0.5, seed=7)
+    resp = fund_http.http_request(_url(server), policy=FAST)
+    assert resp.status_code == 200
+    assert server.stats() == {'error': 2, 'ok': 1}
+    assert fund_retry.retry_stats()[HOST]['retries'] == 2
+    assert fund_retry.get_breaker(HOST).state == CLOSED
+
+
+def test_throttled_request_waits_for_retry_after(server):
+    # Retry-After: 1，被策略的 max_delay 截到 0.2s
+    server.faults.throttle_rate = 1.0
+    policy = RetryPolicy(max_attempts=2, base_delay=0.001, max_delay=0.2)
+    start = time.monotonic()
+    with pytest.raises(requests.HTTPError) as info:
+        fund_http.http_request(_url(server), policy=policy)
+    assert info.value.response.status_code == 429
+    assert time.monotonic() - start >= 0.2
+    assert server.stats() == {'throttle': 2}
+    assert fund_retry.retry_stats()[HOST][fund_retry.THROTTLED] == 2
+
+
+def test_breaker_open_half_open_closed(server):
+    server.faults.error_rate = 1.0
+    breaker = fund_retry.get_breaker(HOST)
+
+    # 连续 3 次失败后熔断，重试途中抛出真正的 503
+    with pytest.raises(requests.HTTPError):
+        fund_http.http_request(_url(server), policy=FAST)
+    assert server.stats() == {'error': 3}
+    assert breaker.state == OPEN
+
+    # 熔断期间请求不发出
+    with pytest.raises(CircuitOpenError):
+        fund_http.http_request(_url(server), policy=FAST)
+    assert server.stats() == {'error': 3}
+
+    # 冷却后只放一个探测请求；探测失败重新熔断
+    time.sleep(0.25)
+    with pytest.raises(requests.HTTPError):
+        fund_http.http_request(_url(server), policy=FAST)
+    assert server.stats() == {'error': 4}
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+
+    # 主机恢复：探测成功后关闭
+    server.faults.error_rate = 0.0
+    time.sleep(0.25)
+    assert fund_http.http_request(_url(server), policy=FAST).status_code == 200
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(HOST, failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    # 不计入熔断的结果（如 404）：放行下一个探测
+    breaker.release_probe()
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
@@ -0,0 +1,10 @@
+import fund_telemetry as telemetry
+
+
+def test_label_values_are_escaped():
+    telemetry.reset()
+    telemetry.inc('http_errors_total', host='a"b', kind='back\\slash\nnext')
+    text = telemetry.to_prometheus()
+    telemetry.reset()
+    line = next(line for line in text.splitlines() if line.startswith(telemetry.PREFIX + 'http_errors_total{'))
+    assert line == (telemetry.PREFIX + 'http_errors_total{host="a\\"b",kind="back\\\\slash\\nnext"} 1')